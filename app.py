@@ -1,14 +1,16 @@
 import streamlit as st
-import json
-import time
+import queue
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Add src to sys.path so the package is discoverable
 sys.path.insert(0, os.path.join(os.getcwd(), "src"))
 
-from self_verifying_agent.graph import stream_self_verifying_agent
+from self_verifying_agent.checkpointing import get_checkpointer
+from self_verifying_agent.graph import compiled_graph, stream_self_verifying_agent
+from self_verifying_agent.llm_factory import get_llm
 
 load_dotenv()
 
@@ -50,11 +52,177 @@ st.markdown("""
 st.title("🤖 AutoMend AI")
 st.caption("Self-Healing Code Agent")
 
-# Initialize session state for chat history and agent state
+# Track steps for progress bar
+STEPS = ["spec_parser", "code_generator", "test_generator", "test_runner", "failure_analyzer", "code_fixer"]
+
+# How long the page waits for new agent events before checking again (seconds)
+POLL_INTERVAL = 0.2
+
+
+@st.cache_resource
+def agent_workers():
+    """Process-wide resources shared by every session.
+
+    Builds the LLM client and compiles the graph once, and returns the thread pool
+    agent runs execute on, so a run never blocks a session's script thread and
+    several sessions can run jobs at the same time.
+    """
+    get_llm()
+    compiled_graph(get_checkpointer())
+    return ThreadPoolExecutor(max_workers=int(os.getenv("AGENT_UI_WORKERS", "4")), thread_name_prefix="agent-job")
+
+
+class AgentJob:
+    """One agent run on the shared worker pool.
+
+    The worker only puts `(node_name, update)` events on a queue; the session's
+    script thread drains it with `poll`, so the run survives Streamlit reruns.
+    """
+
+    def __init__(self, spec, max_iterations):
+        self.events = queue.Queue()
+        self.results = {"parsed_spec": None, "code": None, "tests": None, "error_analysis": None, "iteration": 0}
+        self.partial = {}
+        self.node = None
+        self.error = None
+        self.done = False
+        self.future = agent_workers().submit(self._run, spec, max_iterations)
+
+    def _run(self, spec, max_iterations):
+        try:
+            for node_name, state_update in stream_self_verifying_agent(spec, max_iterations=max_iterations, stream_tokens=True):
+                self.events.put((node_name, state_update))
+        except Exception as e:
+            self.events.put(("error", e))
+        finally:
+            self.events.put(None)
+
+    @property
+    def queued(self):
+        return self.node is None and not self.future.running() and not self.future.done()
+
+    def poll(self, timeout):
+        """Apply every pending event, waiting up to `timeout` for the first one."""
+        try:
+            event = self.events.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            if event is None:
+                self.done = True
+            elif event[0] == "error" and isinstance(event[1], Exception):
+                self.error = event[1]
+            else:
+                node_name, state_update = event
+                if isinstance(state_update, str):
+                    self.partial[node_name] = self.partial.get(node_name, "") + state_update
+                else:
+                    self.partial.pop(node_name, None)
+                    self.results.update(state_update)
+                    self.node = node_name
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                return
+
+
+def _update(placeholder, rendered, key, value, draw):
+    """Redraw `placeholder` only when `value` differs from what it last showed."""
+    if key in rendered and rendered[key] == value:
+        return
+    rendered[key] = value
+    if value:
+        draw(placeholder, value)
+    else:
+        placeholder.empty()
+
+
+def _draw_status(placeholder, text):
+    placeholder.markdown(f"<span style='color:black'>{text}</span>", unsafe_allow_html=True)
+
+
+def _draw_code(title):
+    def draw(placeholder, code):
+        with placeholder.container():
+            st.markdown(f"<h3 style='color:black'>{title}</h3>", unsafe_allow_html=True)
+            st.code(code, language="python")
+    return draw
+
+
+def _draw_analysis(placeholder, analysis):
+    with placeholder.container():
+        st.markdown("<h3 style='color:black'>Analysis / Logs</h3>", unsafe_allow_html=True)
+        st.json(analysis)
+
+
+def _draw_live(placeholder, partial):
+    # Live view of the text the LLM is currently streaming
+    with placeholder.container():
+        for streaming_node, text in partial:
+            st.caption(f"{streaming_node.replace('_', ' ').title()} (streaming)")
+            st.code(text, language="python")
+
+
+def follow_job(job):
+    """Render `job` into fixed placeholders until it finishes, updating each only when it changes."""
+    with st.chat_message("assistant"):
+        message_placeholder = st.empty()
+        full_response = "I'm working on it! I'll parse your specification, generate code, and verify it with tests."
+        message_placeholder.markdown(f"<span style='color:black'>{full_response}▌</span>", unsafe_allow_html=True)
+
+        # Progress bar and status
+        status_text = st.empty()
+        progress_bar = st.progress(0)
+        live_placeholder = st.empty()
+
+        # Live preview below the chat
+        cols = st.columns(2)
+        code_placeholder = cols[0].empty()
+        tests_placeholder = cols[1].empty()
+        analysis_placeholder = st.empty()
+
+        rendered = {}
+        while True:
+            job.poll(POLL_INTERVAL)
+
+            if job.queued:
+                status = "Waiting for a free worker..."
+            elif job.node:
+                status = f"Current Phase: {job.node.replace('_', ' ').title()}..."
+            else:
+                status = "Starting..."
+            _update(status_text, rendered, "status", status, _draw_status)
+            if job.node in STEPS and rendered.get("step") != job.node:
+                rendered["step"] = job.node
+                progress_bar.progress((STEPS.index(job.node) + 1) / len(STEPS))
+            _update(live_placeholder, rendered, "live", list(job.partial.items()), _draw_live)
+            _update(code_placeholder, rendered, "code", job.results.get("code"), _draw_code("Implementation"))
+            _update(tests_placeholder, rendered, "tests", job.results.get("tests"), _draw_code("Unit Tests"))
+            _update(analysis_placeholder, rendered, "analysis", job.results.get("error_analysis"), _draw_analysis)
+
+            if job.done:
+                break
+
+        if job.error is not None:
+            error_msg = f"An error occurred: {str(job.error)}"
+            st.error(error_msg)
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
+        else:
+            full_response = "Done! I've generated the code and verified it. You can see the details below."
+            message_placeholder.markdown(f"<span style='color:black'>{full_response}</span>", unsafe_allow_html=True)
+            st.session_state.messages.append({"role": "assistant", "content": full_response})
+            st.session_state.agent_results = job.results
+            status_text.markdown("<span style='color:black'>Task Complete!</span>", unsafe_allow_html=True)
+            progress_bar.progress(1.0)
+
+
+# Initialize session state for chat history, agent state and the running job
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "agent_results" not in st.session_state:
     st.session_state.agent_results = {}
+if "job" not in st.session_state:
+    st.session_state.job = None
 
 # Display chat history
 for message in st.session_state.messages:
@@ -68,82 +236,21 @@ with st.sidebar:
     if st.button("Clear Chat"):
         st.session_state.messages = []
         st.session_state.agent_results = {}
+        st.session_state.job = None
         st.rerun()
 
-# Chat input
-if prompt := st.chat_input("What would you like me to build?"):
-    # Add user message to chat
+# Chat input (one job per session at a time)
+if prompt := st.chat_input("What would you like me to build?", disabled=st.session_state.job is not None):
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
+    st.session_state.job = AgentJob(prompt, max_iters)
 
-    # Agent response
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        full_response = "I'm working on it! I'll parse your specification, generate code, and verify it with tests."
-        message_placeholder.markdown(f"<span style='color:black'>{full_response}▌</span>", unsafe_allow_html=True)
-        
-        # Progress bar and status
-        status_text = st.empty()
-        progress_bar = st.progress(0)
-        
-        # Container for live updates below the chat
-        results_container = st.container()
-
-        # Run the agent
-        results = {
-            "parsed_spec": None,
-            "code": None,
-            "tests": None,
-            "error_analysis": None,
-            "iteration": 0
-        }
-
-        # Track steps for progress bar
-        steps = ["spec_parser", "code_generator", "test_generator", "test_runner", "failure_analyzer", "code_fixer"]
-        total_steps = len(steps)
-        current_step_idx = 0
-
-        try:
-            for node_name, state_update in stream_self_verifying_agent(prompt, max_iterations=max_iters):
-                results.update(state_update)
-                
-                # Update status and progress
-                status_text.markdown(f"<span style='color:black'>Current Phase: {node_name.replace('_', ' ').title()}...</span>", unsafe_allow_html=True)
-                if node_name in steps:
-                    current_step_idx = steps.index(node_name)
-                    progress_bar.progress((current_step_idx + 1) / total_steps)
-
-                # Live preview in the results container
-                with results_container:
-                    cols = st.columns(2)
-                    with cols[0]:
-                        if results.get("code"):
-                            st.markdown("<h3 style='color:black'>Implementation</h3>", unsafe_allow_html=True)
-                            st.code(results["code"], language="python")
-                    with cols[1]:
-                        if results.get("tests"):
-                            st.markdown("<h3 style='color:black'>Unit Tests</h3>", unsafe_allow_html=True)
-                            st.code(results["tests"], language="python")
-
-                    if results.get("error_analysis"):
-                        st.markdown("<h3 style='color:black'>Analysis / Logs</h3>", unsafe_allow_html=True)
-                        st.json(results["error_analysis"])
-
-                time.sleep(0.1) # Small delay for visual effect
-
-            full_response = "Done! I've generated the code and verified it. You can see the details below."
-            message_placeholder.markdown(f"<span style='color:black'>{full_response}</span>", unsafe_allow_html=True)
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
-            st.session_state.agent_results = results
-            
-            status_text.markdown("<span style='color:black'>Task Complete!</span>", unsafe_allow_html=True)
-            progress_bar.progress(1.0)
-
-        except Exception as e:
-            error_msg = f"An error occurred: {str(e)}"
-            st.error(error_msg)
-            st.session_state.messages.append({"role": "assistant", "content": error_msg})
+# Follow the running job; after a rerun (e.g. a widget change) this picks it up again
+if st.session_state.job is not None:
+    follow_job(st.session_state.job)
+    st.session_state.job = None
+    st.rerun()
 
 # Final Results Section (always visible if results exist)
 if st.session_state.agent_results:
@@ -0,0 +1,161 @@
+"""Load test of the HTTP job service (`self_verifying_agent.service`).
+
+Usage:
+
+    python -m benchmarks.load_service --jobs 200 --concurrency 32
+    python -m benchmarks.load_service --url http://127.0.0.1:8000   # an already running service
+
+Without `--url`, the service is started as a subprocess (`examples.run_service`) with
+the stub LLM, so the test runs fully offline. Each client submits a spec, follows
+its event stream until the job ends and records the latency from submission to the
+`end` event. Submissions answered with 429 are retried after `Retry-After`, and
+counted as rejections.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .scenarios import SCENARIOS
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_service(port: int, workers: int, max_queue: int, llm_latency: float) -> subprocess.Popen:
+    """Start `examples.run_service` with the stub LLM and wait until it answers."""
+
+    env = dict(os.environ, LLM_PROVIDER="stub", STUB_LLM_LATENCY=str(llm_latency))
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(ROOT / "src"), env.get("PYTHONPATH")) if p)
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "examples.run_service",
+            "--port", str(port), "--workers", str(workers), "--max-queue", str(max_queue),
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"The service exited with status {process.returncode}.")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/healthz", timeout=1).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise SystemExit("The service did not start within 30 seconds.")
+
+
+async def run_job(client: httpx.AsyncClient, spec: str, max_iterations: int) -> Dict[str, Any]:
+    """Submit one spec, retrying on 429, and follow its events until it ends."""
+
+    submitted = time.perf_counter()
+    rejected = 0
+    while True:
+        response = await client.post("/jobs", json={"spec": spec, "max_iterations": max_iterations})
+        if response.status_code != 429:
+            break
+        rejected += 1
+        await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+    response.raise_for_status()
+    job_id = response.json()["id"]
+
+    end: Dict[str, Any] = {}
+    event = None
+    async with client.stream("GET", f"/jobs/{job_id}/events") as stream:
+        async for line in stream.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event == "end":
+                end = json.loads(line[len("data: "):])
+                break
+    return {
+        "status": end.get("status"),
+        "latency_s": time.perf_counter() - submitted,
+        "queue_wait_s": (end.get("started") or end.get("finished") or 0) - end.get("created", 0),
+        "rejected": rejected,
+    }
+
+
+async def load(url: str, jobs: int, concurrency: int, max_iterations: int) -> Dict[str, Any]:
+    specs = [scenario["spec"] for scenario in SCENARIOS]
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency * 2)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=None) as client:
+
+        async def one(index: int) -> Dict[str, Any]:
+            async with semaphore:
+                return await run_job(client, specs[index % len(specs)], max_iterations)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(index) for index in range(jobs)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(result["latency_s"] for result in results)
+    statuses: Dict[str, int] = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    return {
+        "jobs": jobs,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_jobs_per_s": round(jobs / elapsed, 2),
+        "latency_p50_s": round(statistics.median(latencies), 3),
+        "latency_p95_s": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3),
+        "latency_max_s": round(latencies[-1], 3),
+        "queue_wait_mean_s": round(statistics.mean(result["queue_wait_s"] for result in results), 3),
+        "rejected_429": sum(result["rejected"] for result in results),
+        "statuses": statuses,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the agent's HTTP job service.")
+    parser.add_argument("--url", default=None, help="Service to test (default: start one with the stub LLM).")
+    parser.add_argument("--jobs", type=int, default=100, help="Jobs submitted in total.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients submitting and following jobs at once.")
+    parser.add_argument("--max-iterations", type=int, default=1, help="max_iterations sent with every job.")
+    parser.add_argument("--workers", type=int, default=4, help="Workers of the started service.")
+    parser.add_argument("--max-queue", type=int, default=8, help="Queue size of the started service.")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per stub LLM call.")
+    args = parser.parse_args(argv)
+
+    process = None
+    url = args.url
+    if url is None:
+        port = _free_port()
+        process = start_service(port, args.workers, args.max_queue, args.llm_latency)
+        url = f"http://127.0.0.1:{port}"
+    try:
+        report = asyncio.run(load(url, args.jobs, args.concurrency, args.max_iterations))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
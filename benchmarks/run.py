@@ -0,0 +1,249 @@
+"""End-to-end benchmark of the agent graph against a scripted, offline LLM.
+
+Usage:
+
+    python -m benchmarks.run                      # run and compare with benchmarks/baseline.json
+    python -m benchmarks.run --update-baseline    # run and store the results as the new baseline
+
+Each scenario in `benchmarks.scenarios` is run `--repeat` times through
+`build_graph()`; timings are medians. Peak memory is measured in one extra,
+untimed run under `tracemalloc` (agent process only, not the pytest workers).
+Exits with status 1 when a scenario regresses against the baseline.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from self_verifying_agent.code_fixer import FIX_MODES
+from self_verifying_agent.graph import build_graph
+from self_verifying_agent.instrumentation import Tracer
+from self_verifying_agent.llm_cache import configure_llm_cache
+from self_verifying_agent.llm_factory import clear_llm_clients, register_provider
+from self_verifying_agent.pytest_pool import configure_pytest_pool
+from self_verifying_agent.state import AgentState
+
+from .scenarios import SCENARIOS, Scenario
+from .scripted_llm import ScriptedChatModel
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+# Metrics compared against the baseline, and whether they are timings (seconds).
+_COMPARED = {"wall_s": True, "pytest_s": True, "peak_memory_kb": False}
+
+
+def _use_scripted_llm(latency: float, chunk_latency: float) -> None:
+    register_provider(
+        "scripted",
+        lambda model_name, temperature: ScriptedChatModel(
+            model_name=model_name,
+            temperature=temperature,
+            latency=latency,
+            chunk_latency=chunk_latency,
+        ),
+        default_model="scripted",
+    )
+    os.environ["LLM_PROVIDER"] = "scripted"
+    clear_llm_clients()
+    configure_llm_cache("off")
+
+
+def run_scenario(app: Any, scenario: Scenario, fix_mode: str = "rewrite") -> Dict[str, Any]:
+    """Run one scenario once and return its measurements."""
+
+    tracer = Tracer()
+    max_iterations = scenario.get("max_iterations", 3)
+    tracer.start_run(scenario=scenario["name"])
+    state = AgentState(spec=scenario["spec"], max_iterations=max_iterations, fix_mode=fix_mode)
+
+    started = time.perf_counter()
+    final = app.invoke(state, config={"configurable": {"tracer": tracer}})
+    wall = time.perf_counter() - started
+    tracer.finish_run()
+
+    nodes: Dict[str, float] = {}
+    pytest_s = pytest_cpu_s = llm_s = 0.0
+    pytest_runs = completion_tokens = 0
+    for record in tracer.spans:
+        if record["kind"] == "node":
+            nodes[record["name"]] = nodes.get(record["name"], 0.0) + record["duration_s"]
+        elif record["kind"] == "pytest":
+            pytest_runs += 1
+            pytest_s += record["duration_s"]
+            pytest_cpu_s += record["attributes"].get("cpu_time") or 0.0
+        elif record["kind"] == "llm":
+            llm_s += record["duration_s"]
+            completion_tokens += record["attributes"].get("completion_tokens") or 0
+
+    status = (final.get("error_analysis") or {}).get("status")
+    return {
+        "status": status,
+        "iterations": final.get("iteration", 0),
+        "iterations_to_green": final.get("iteration", 0) if status == "success" else None,
+        "wall_s": wall,
+        "nodes_s": nodes,
+        "llm_s": llm_s,
+        "completion_tokens": completion_tokens,
+        "pytest_s": pytest_s,
+        "pytest_cpu_s": pytest_cpu_s,
+        "pytest_runs": pytest_runs,
+    }
+
+
+def _median(runs: List[Dict[str, Any]], key: str) -> float:
+    return round(statistics.median(run[key] for run in runs), 4)
+
+
+def benchmark(app: Any, scenario: Scenario, repeat: int, fix_mode: str = "rewrite") -> Dict[str, Any]:
+    runs = [run_scenario(app, scenario, fix_mode) for _ in range(repeat)]
+
+    tracemalloc.start()
+    try:
+        run_scenario(app, scenario, fix_mode)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    node_names = sorted({name for run in runs for name in run["nodes_s"]})
+    return {
+        "status": runs[-1]["status"],
+        "iterations": runs[-1]["iterations"],
+        "iterations_to_green": runs[-1]["iterations_to_green"],
+        "wall_s": _median(runs, "wall_s"),
+        "llm_s": _median(runs, "llm_s"),
+        "completion_tokens": runs[-1]["completion_tokens"],
+        "pytest_s": _median(runs, "pytest_s"),
+        "pytest_cpu_s": _median(runs, "pytest_cpu_s"),
+        "pytest_runs": runs[-1]["pytest_runs"],
+        "nodes_s": {
+            name: round(statistics.median(run["nodes_s"].get(name, 0.0) for run in runs), 4) for name in node_names
+        },
+        "peak_memory_kb": round(peak / 1024),
+    }
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    tolerance: float,
+    min_delta: float,
+) -> List[str]:
+    """Regressions of `results` against `baseline`, as human-readable lines."""
+
+    regressions: List[str] = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("status", "iterations"):
+            if current[key] != base[key]:
+                regressions.append(f"{name}: {key} changed from {base[key]} to {current[key]}")
+        for key, is_time in _COMPARED.items():
+            limit = base[key] * (1 + tolerance)
+            if current[key] > limit and (not is_time or current[key] - base[key] > min_delta):
+                regressions.append(f"{name}: {key} {current[key]} exceeds baseline {base[key]} by more than {tolerance:.0%}")
+    return regressions
+
+
+def _print_table(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]) -> None:
+    header = (
+        f"{'scenario':<22} {'status':<8} {'iters':>5} {'wall s':>8} {'base s':>8} {'llm s':>7} "
+        f"{'out tok':>7} {'pytest s':>8} {'runs':>4} {'peak KB':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        base = baseline.get(name, {}).get("wall_s")
+        print(
+            f"{name:<22} {str(r['status']):<8} {r['iterations']:>5} {r['wall_s']:>8.3f} "
+            f"{base if base is not None else '-':>8} {r['llm_s']:>7.3f} {r['completion_tokens']:>7} {r['pytest_s']:>8.3f} "
+            f"{r['pytest_runs']:>4} {r['peak_memory_kb']:>8}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the agent end to end against a scripted LLM.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per scenario; medians are reported.")
+    parser.add_argument("--scenario", action="append", default=None, help="Only run this scenario (repeatable).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per LLM call.")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="Simulated seconds per streamed line.")
+    parser.add_argument("--fix-mode", choices=FIX_MODES, default="rewrite", help="How the fixer returns its changes.")
+    parser.add_argument("--pytest-workers", type=int, default=2, help="Size of the pytest worker pool (0: subprocess per run).")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Baseline JSON to compare with.")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results to the baseline file.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before flagging.")
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=0.05,
+        help="Timing differences below this many seconds are never flagged.",
+    )
+    parser.add_argument("--output", type=Path, default=None, help="Also write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in SCENARIOS if not args.scenario or s["name"] in args.scenario]
+    if not scenarios:
+        parser.error(f"No scenario named {', '.join(args.scenario)}.")
+
+    _use_scripted_llm(args.latency, args.chunk_latency)
+    configure_pytest_pool(args.pytest_workers)
+
+    compile_started = time.perf_counter()
+    app = build_graph().compile()
+    compile_s = time.perf_counter() - compile_started
+
+    # One untimed run warms the pytest workers and imports.
+    run_scenario(app, scenarios[0])
+
+    settings = {
+        "repeat": args.repeat,
+        "latency": args.latency,
+        "chunk_latency": args.chunk_latency,
+        "pytest_workers": args.pytest_workers,
+        "fix_mode": args.fix_mode,
+    }
+    results = {scenario["name"]: benchmark(app, scenario, args.repeat, args.fix_mode) for scenario in scenarios}
+    report = {
+        "settings": settings,
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "compile_s": round(compile_s, 4),
+        "scenarios": results,
+    }
+
+    stored: Dict[str, Any] = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    baseline = stored.get("scenarios", {})
+    _print_table(results, baseline)
+    print(f"\ngraph compile: {compile_s:.3f}s")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("No baseline to compare with; run with --update-baseline to store one.")
+        return 0
+    if stored.get("settings") != settings:
+        print(f"Warning: baseline was recorded with different settings: {stored.get('settings')}")
+
+    regressions = compare(results, baseline, args.tolerance, args.min_delta)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print("No regressions against the baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
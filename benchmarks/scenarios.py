@@ -0,0 +1,351 @@
+"""Benchmark corpus: specs with the replies the scripted LLM gives for each of them.
+
+`code` lists every version of the implementation in order: the generated code
+first, then one entry per fix. `analyses` holds the failure analysis returned for
+each failing version. Scenarios cover a first-try pass, one- and two-iteration
+repairs, a large parametrized suite, and a run that exhausts its iterations.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+Scenario = Dict[str, Any]
+
+
+def _analysis(summary: str, error_type: str, suggestion: str) -> Dict[str, Any]:
+    return {
+        "status": "failure",
+        "summary": summary,
+        "error_type": error_type,
+        "focus_lines": [],
+        "suggestions": [suggestion],
+    }
+
+
+SCENARIOS: List[Scenario] = [
+    {
+        "name": "is_prime",
+        "spec": "Write a function that returns whether or not a given number is prime.",
+        "parsed": {
+            "name": "is_prime",
+            "inputs": [{"name": "n", "type": "int", "description": "Number to test."}],
+            "output": "bool",
+            "constraints": [],
+            "edge_cases": ["n < 2"],
+            "assumptions": [],
+        },
+        "tests": '''import pytest
+
+from impl import is_prime
+
+
+@pytest.mark.parametrize("n", [2, 3, 5, 7, 11, 13, 97, 7919])
+def test_primes(n):
+    assert is_prime(n)
+
+
+@pytest.mark.parametrize("n", [-7, 0, 1, 4, 9, 15, 100, 7917])
+def test_non_primes(n):
+    assert not is_prime(n)
+''',
+        "code": [
+            '''def is_prime(n: int) -> bool:
+    """Return True if `n` is a prime number."""
+    if n < 2:
+        return False
+    i = 2
+    while i * i <= n:
+        if n % i == 0:
+            return False
+        i += 1
+    return True
+''',
+        ],
+        "analyses": [],
+    },
+    {
+        "name": "fizzbuzz",
+        "spec": "Write a function fizzbuzz(n) that returns the FizzBuzz strings for the numbers 1 to n inclusive.",
+        "parsed": {
+            "name": "fizzbuzz",
+            "inputs": [{"name": "n", "type": "int", "description": "Last number, inclusive."}],
+            "output": "list[str]",
+            "constraints": ["n >= 0"],
+            "edge_cases": ["n == 0"],
+            "assumptions": [],
+        },
+        "tests": '''from impl import fizzbuzz
+
+
+def test_length_is_inclusive():
+    assert len(fizzbuzz(15)) == 15
+
+
+def test_values():
+    assert fizzbuzz(15)[-1] == "FizzBuzz"
+    assert fizzbuzz(5) == ["1", "2", "Fizz", "4", "Buzz"]
+
+
+def test_empty():
+    assert fizzbuzz(0) == []
+''',
+        "code": [
+            '''def fizzbuzz(n: int) -> list:
+    """Return the FizzBuzz strings for 1..n."""
+    out = []
+    for i in range(1, n):
+        if i % 15 == 0:
+            out.append("FizzBuzz")
+        elif i % 3 == 0:
+            out.append("Fizz")
+        elif i % 5 == 0:
+            out.append("Buzz")
+        else:
+            out.append(str(i))
+    return out
+''',
+            '''def fizzbuzz(n: int) -> list:
+    """Return the FizzBuzz strings for 1..n."""
+    out = []
+    for i in range(1, n + 1):
+        if i % 15 == 0:
+            out.append("FizzBuzz")
+        elif i % 3 == 0:
+            out.append("Fizz")
+        elif i % 5 == 0:
+            out.append("Buzz")
+        else:
+            out.append(str(i))
+    return out
+''',
+        ],
+        "analyses": [
+            _analysis("The range stops at n - 1.", "boundary_condition", "Iterate up to and including n."),
+        ],
+    },
+    {
+        "name": "k_smallest_pair_sums",
+        "spec": "Write a function that returns the k smallest pair sums from two sorted arrays.",
+        "parsed": {
+            "name": "k_smallest_pair_sums",
+            "inputs": [
+                {"name": "a", "type": "list[int]", "description": "Sorted array."},
+                {"name": "b", "type": "list[int]", "description": "Sorted array."},
+                {"name": "k", "type": "int", "description": "Number of sums to return."},
+            ],
+            "output": "list[int]",
+            "constraints": [],
+            "edge_cases": ["k larger than len(a) * len(b)", "empty input"],
+            "assumptions": [],
+        },
+        "tests": '''from impl import k_smallest_pair_sums
+
+
+def test_basic():
+    assert k_smallest_pair_sums([1, 1, 2], [1, 2, 3], 4) == [2, 2, 3, 3]
+
+
+def test_k_larger_than_pairs():
+    assert k_smallest_pair_sums([1, 2], [3], 5) == [4, 5]
+
+
+def test_empty():
+    assert k_smallest_pair_sums([], [1, 2], 3) == []
+''',
+        "code": [
+            '''def k_smallest_pair_sums(a, b, k):
+    """Return the k smallest sums a[i] + b[j]."""
+    sums = [x + y for x in a for y in b]
+    return sums[:k]
+''',
+            '''def k_smallest_pair_sums(a, b, k):
+    """Return the k smallest sums a[i] + b[j]."""
+    sums = sorted(x + y for x in a for y in b)
+    return [sums[i] for i in range(k)]
+''',
+            '''import heapq
+
+
+def k_smallest_pair_sums(a, b, k):
+    """Return the k smallest sums a[i] + b[j], using a heap over the sorted inputs."""
+    if not a or not b or k <= 0:
+        return []
+    heap = [(a[i] + b[0], i, 0) for i in range(min(k, len(a)))]
+    heapq.heapify(heap)
+    out = []
+    while heap and len(out) < k:
+        total, i, j = heapq.heappop(heap)
+        out.append(total)
+        if j + 1 < len(b):
+            heapq.heappush(heap, (a[i] + b[j + 1], i, j + 1))
+    return out
+''',
+        ],
+        "analyses": [
+            _analysis("Sums are returned in generation order, not sorted.", "logic_error", "Sort the sums."),
+            _analysis("Indexing past the number of pairs raises IndexError.", "boundary_condition", "Stop at the available pairs."),
+        ],
+    },
+    {
+        "name": "reverse_words",
+        "spec": "Write a function that reverses the order of words in a sentence and returns the new sentence.",
+        "parsed": {
+            "name": "reverse_words",
+            "inputs": [{"name": "sentence", "type": "str", "description": "Words separated by whitespace."}],
+            "output": "str",
+            "constraints": [],
+            "edge_cases": ["empty string", "repeated spaces"],
+            "assumptions": [],
+        },
+        "tests": '''from impl import reverse_words
+
+
+def test_reverses():
+    assert reverse_words("the quick brown fox") == "fox brown quick the"
+
+
+def test_collapses_whitespace():
+    assert reverse_words("  a   b ") == "b a"
+
+
+def test_empty():
+    assert reverse_words("") == ""
+''',
+        "code": [
+            '''def reverse_words(sentence: str):
+    """Reverse the order of words in `sentence`."""
+    return sentence.split()[::-1]
+''',
+            '''def reverse_words(sentence: str) -> str:
+    """Reverse the order of words in `sentence`."""
+    return " ".join(sentence.split()[::-1])
+''',
+        ],
+        "analyses": [
+            _analysis("A list is returned instead of a string.", "type_mismatch", "Join the words with spaces."),
+        ],
+    },
+    {
+        "name": "running_median",
+        "spec": "Write a function that returns the running median after each element of a list of numbers.",
+        "parsed": {
+            "name": "running_median",
+            "inputs": [{"name": "values", "type": "list[float]", "description": "Input stream."}],
+            "output": "list[float]",
+            "constraints": [],
+            "edge_cases": ["even number of elements", "empty list"],
+            "assumptions": [],
+        },
+        "tests": '''import statistics
+
+import pytest
+
+from impl import running_median
+
+CASES = [list(range(n, 0, -1)) + [n // 2] * (n % 3) for n in range(1, 41)]
+
+
+@pytest.mark.parametrize("values", CASES)
+def test_matches_statistics(values):
+    expected = [statistics.median(values[: i + 1]) for i in range(len(values))]
+    assert running_median(values) == expected
+
+
+def test_empty():
+    assert running_median([]) == []
+''',
+        "code": [
+            '''def running_median(values):
+    """Return the median of values[:i + 1] for every i."""
+    out = []
+    seen = []
+    for value in values:
+        seen.append(value)
+        ordered = sorted(seen)
+        out.append(ordered[len(ordered) // 2])
+    return out
+''',
+            '''import bisect
+
+
+def running_median(values):
+    """Return the median of values[:i + 1] for every i."""
+    out = []
+    ordered = []
+    for value in values:
+        bisect.insort(ordered, value)
+        mid = len(ordered) // 2
+        if len(ordered) % 2:
+            out.append(ordered[mid])
+        else:
+            out.append((ordered[mid - 1] + ordered[mid]) / 2)
+    return out
+''',
+        ],
+        "analyses": [
+            _analysis("Even-length prefixes return the upper middle element.", "logic_error", "Average the two middle values."),
+        ],
+    },
+    {
+        "name": "flatten",
+        "spec": "Write a function that flattens arbitrarily nested lists and tuples into a flat list.",
+        "max_iterations": 2,
+        "parsed": {
+            "name": "flatten",
+            "inputs": [{"name": "items", "type": "list", "description": "Nested lists and tuples."}],
+            "output": "list",
+            "constraints": [],
+            "edge_cases": ["tuples", "deep nesting"],
+            "assumptions": [],
+        },
+        "tests": '''from impl import flatten
+
+
+def test_nested_lists():
+    assert flatten([1, [2, [3, [4]]]]) == [1, 2, 3, 4]
+
+
+def test_tuples():
+    assert flatten([1, (2, (3,)), [(4,)]]) == [1, 2, 3, 4]
+''',
+        "code": [
+            '''def flatten(items):
+    """Flatten nested lists one level deep."""
+    out = []
+    for item in items:
+        if isinstance(item, list):
+            out.extend(item)
+        else:
+            out.append(item)
+    return out
+''',
+            '''def flatten(items):
+    """Flatten nested lists."""
+    out = []
+    for item in items:
+        if isinstance(item, list):
+            out.extend(flatten(item))
+        else:
+            out.append(item)
+    return out
+''',
+            '''def flatten(items):
+    """Flatten nested lists and tuples."""
+    out = []
+    for item in items:
+        if isinstance(item, list):
+            out.extend(flatten(item))
+        elif isinstance(item, tuple):
+            out.extend(item)
+        else:
+            out.append(item)
+    return out
+''',
+        ],
+        "analyses": [
+            _analysis("Only one level of nesting is flattened.", "logic_error", "Recurse into nested lists."),
+            _analysis("Tuples are not flattened.", "logic_error", "Treat tuples like lists."),
+            _analysis("Nested tuples are only flattened one level.", "logic_error", "Recurse into tuples as well."),
+        ],
+    },
+]
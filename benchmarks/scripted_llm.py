@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk
+
+from self_verifying_agent.patching import unified_diff
+from self_verifying_agent.prompt_context import REFERENCE_HEADER
+from self_verifying_agent.stub_llm import StubChatModel, _parsed_name, _section
+
+from .scenarios import SCENARIOS, Scenario
+
+
+def find_scenario(text: str, scenarios: List[Scenario]) -> Optional[Scenario]:
+    """Scenario a prompt belongs to: by its spec, or by function name in the parsed spec."""
+
+    text = text.split(REFERENCE_HEADER, 1)[0]
+    for scenario in scenarios:
+        if scenario["spec"] in text:
+            return scenario
+    name = _parsed_name(text)
+    return next((s for s in scenarios if s["name"] == name), None)
+
+
+def _version(scenario: Scenario, code: str) -> int:
+    """Index of `code` among the scenario's versions (the last one if unknown)."""
+
+    versions = [v.strip() for v in scenario["code"]]
+    try:
+        return versions.index(code.strip())
+    except ValueError:
+        return len(versions) - 1
+
+
+class ScriptedChatModel(StubChatModel):
+    """Replays the canned replies of `benchmarks.scenarios` for each node prompt.
+
+    The reply depends only on the prompt: the fixer returns the version after the
+    code it is shown (as a unified diff when patch mode asks for edits) and the
+    analyzer the analysis for that version, so repeated
+    and concurrent runs are reproducible. `latency` is added once per call and
+    `chunk_latency` per streamed line, to mimic a remote model.
+    """
+
+    model_name: str = "scripted"
+    chunk_latency: float = 0.0
+    scenarios: List[Dict[str, Any]] = SCENARIOS
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        system = str(messages[0].content) if messages else ""
+        user = str(messages[-1].content) if messages else ""
+        scenario = find_scenario(user, self.scenarios)
+        if scenario is None:
+            return super()._reply(messages)
+
+        if "parse natural-language programming specifications" in system:
+            return json.dumps(scenario["parsed"])
+        if "senior Python engineer" in system:
+            return scenario["code"][0]
+        if "pytest unit tests" in system:
+            return scenario["tests"]
+        if "debugging assistant" in system:
+            index = _version(scenario, _section(user, "Code under test"))
+            analyses = scenario["analyses"] or [{"status": "failure", "summary": "Unexpected failure."}]
+            return json.dumps(analyses[min(index, len(analyses) - 1)])
+        if "refactoring assistant" in system:
+            current = _section(user, "Current code")
+            index = _version(scenario, current)
+            fixed = scenario["code"][min(index + 1, len(scenario["code"]) - 1)]
+            return unified_diff(current, fixed) if "SEARCH" in system else fixed
+        return super()._reply(messages)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        if self.latency:
+            time.sleep(self.latency)
+        for line in self._reply(messages).splitlines(keepends=True):
+            if self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=line))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for line in self._reply(messages).splitlines(keepends=True):
+            if self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=line))
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import argparse
+import json
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main() -> None:
+    # Imported here so the spawned pytest pool workers, which re-import this module
+    # as `__mp_main__`, do not load the agent.
+    from self_verifying_agent.batch import run_batch
+    from self_verifying_agent.pytest_pool import configure_pytest_pool
+
+    parser = argparse.ArgumentParser(description="Run the self-verifying code agent on a JSONL file of specs.")
+    parser.add_argument("input", help="JSONL file with one spec per line ({\"id\": ..., \"spec\": ...} or a JSON string).")
+    parser.add_argument("output", help="JSONL file results are appended to; specs already in it are skipped.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of specs processed at once.",
+    )
+    parser.add_argument(
+        "--max-iterations",
+        type=int,
+        default=3,
+        help="Maximum number of self-repair iterations per spec.",
+    )
+    parser.add_argument(
+        "--pytest-workers",
+        type=int,
+        default=None,
+        help="Size of the shared pytest worker pool (default: same as --concurrency).",
+    )
+
+    args = parser.parse_args()
+
+    configure_pytest_pool(args.pytest_workers if args.pytest_workers is not None else args.concurrency)
+    counts = run_batch(
+        args.input,
+        args.output,
+        concurrency=args.concurrency,
+        max_iterations=args.max_iterations,
+    )
+
+    print("\n=== Batch Summary ===")
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
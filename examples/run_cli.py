@@ -2,16 +2,30 @@ from __future__ import annotations
 
 import argparse
 import json
+import os
 import textwrap
+import time
 
 from dotenv import load_dotenv
 
-from self_verifying_agent.graph import run_self_verifying_agent
-
 load_dotenv()
 
 
 def main() -> None:
+    # The agent is imported here, not at module level: pytest pool workers are spawned
+    # processes that re-import this module as `__mp_main__` and have no use for it.
+    started = time.perf_counter()
+    from self_verifying_agent.code_fixer import FIX_MODES
+    from self_verifying_agent.graph import compiled_graph, run_self_verifying_agent, stream_self_verifying_agent
+    from self_verifying_agent.instrumentation import Tracer, get_metrics, spans_to_jsonl, spans_to_otel
+    from self_verifying_agent.llm_cache import CACHE_MODES, configure_llm_cache
+    from self_verifying_agent.llm_scheduler import DEFAULT_COMPLETION_TOKENS, configure_llm_scheduler
+    from self_verifying_agent.model_routing import configure_model_routing
+    from self_verifying_agent.pytest_pool import configure_pytest_pool
+    from self_verifying_agent.solution_library import configure_solution_library
+
+    import_seconds = time.perf_counter() - started
+
     parser = argparse.ArgumentParser(description="Run the self-verifying code agent on a spec.")
     parser.add_argument("spec", nargs="?", help="Natural-language specification for the function.")
     parser.add_argument(
@@ -20,9 +34,147 @@ def main() -> None:
         default=3,
         help="Maximum number of self-repair iterations.",
     )
+    parser.add_argument(
+        "--fix-candidates",
+        type=int,
+        default=1,
+        help="Fix candidates generated and tested in parallel per repair iteration.",
+    )
+    parser.add_argument(
+        "--fix-mode",
+        choices=FIX_MODES,
+        default=os.getenv("AGENT_FIX_MODE", "rewrite"),
+        help="Have the fixer rewrite the whole module (rewrite) or return edits applied locally (patch).",
+    )
+    parser.add_argument(
+        "--check-performance",
+        action="store_true",
+        default=os.getenv("AGENT_PERF_CHECK", "off").lower() in ("1", "on", "true", "yes"),
+        help="Once the tests pass, time the code on growing inputs against the spec's Big-O target.",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print generated code, tests and fixes token by token as they arrive.",
+    )
+    parser.add_argument(
+        "--llm-cache",
+        choices=CACHE_MODES,
+        default=os.getenv("LLM_CACHE", "off"),
+        help="LLM response cache: bypass it (off), only serve hits (read), or serve and store (readwrite).",
+    )
+    parser.add_argument(
+        "--llm-cache-path",
+        default=None,
+        help="SQLite file backing the LLM response cache.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        default=os.getenv("AGENT_CHECKPOINTS", "off").lower() in ("1", "on", "true", "yes"),
+        help="Save the agent state after every node so the run can be resumed.",
+    )
+    parser.add_argument(
+        "--checkpoint-path",
+        default=None,
+        help="SQLite file backing the checkpoints.",
+    )
+    parser.add_argument(
+        "--solution-library",
+        action="store_true",
+        default=os.getenv("AGENT_SOLUTION_LIBRARY", "off").lower() in ("1", "on", "true", "yes"),
+        help="Reuse verified solutions to the same spec, and start from the most similar one otherwise.",
+    )
+    parser.add_argument(
+        "--solution-library-path",
+        default=None,
+        help="SQLite file backing the solution library.",
+    )
+    parser.add_argument(
+        "--model-routes",
+        default=os.getenv("AGENT_MODEL_ROUTES"),
+        help="JSON routing policy choosing the model and temperature per node (see examples/model_routes.json).",
+    )
+    parser.add_argument(
+        "--pytest-workers",
+        type=int,
+        default=int(os.getenv("PYTEST_POOL_SIZE", "2")),
+        help="Size of the warm pytest worker pool (0: a fresh subprocess per test run).",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=float(os.getenv("LLM_RPM", "0")),
+        help="Requests per minute allowed per model; requests beyond it wait (0: unlimited).",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=float,
+        default=float(os.getenv("LLM_TPM", "0")),
+        help="Tokens per minute allowed per model, estimated before each request (0: unlimited).",
+    )
+    parser.add_argument(
+        "--llm-max-retries",
+        type=int,
+        default=int(os.getenv("LLM_MAX_RETRIES", "5")),
+        help="Retries of LLM requests failing with a rate limit, overload, timeout or connection error.",
+    )
+    parser.add_argument("--run-id", default=None, help="ID to checkpoint this run under (default: a new one).")
+    parser.add_argument("--resume", metavar="RUN_ID", default=None, help="Continue an interrupted checkpointed run.")
+    parser.add_argument("--list-runs", action="store_true", help="List the most recent checkpointed runs and exit.")
+    parser.add_argument(
+        "--trace",
+        default=None,
+        help="Write the run's spans to this file: OTLP/JSON if it ends in .json, JSON lines otherwise.",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Print the aggregate metrics in Prometheus text format at the end.",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report the time spent importing the agent and compiling its graph (then exit if no spec is given).",
+    )
 
     args = parser.parse_args()
 
+    checkpointer = None
+    if args.checkpoint or args.resume or args.list_runs:
+        from self_verifying_agent.checkpointing import configure_checkpointer
+
+        checkpointer = configure_checkpointer(path=args.checkpoint_path)
+
+    if args.profile_startup:
+        started = time.perf_counter()
+        import langgraph.graph  # noqa: F401 - timed on its own; the graph needs it to compile
+
+        langgraph_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        compiled_graph(checkpointer)
+        compile_seconds = time.perf_counter() - started
+        print(
+            f"Startup: agent imports {import_seconds:.3f}s, LangGraph import {langgraph_seconds:.3f}s, "
+            f"graph compile {compile_seconds:.3f}s"
+        )
+        if not args.spec and not args.resume:
+            return
+
+    if args.list_runs:
+        for run in checkpointer.runs():
+            print(f"{run['run_id']}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['updated']))}")
+        return
+
+    run_id = args.run_id
+    saved = {}
+    if args.resume:
+        saved = checkpointer.saved_state(args.resume)
+        if saved is None:
+            raise SystemExit(f"No checkpoint found for run '{args.resume}'.")
+        args.spec = saved.get("spec")
+        run_id = args.resume
+
     if not args.spec:
         print("Please provide a spec, for example:")
         print(
@@ -34,9 +186,51 @@ def main() -> None:
         )
         raise SystemExit(1)
 
+    cache = configure_llm_cache(args.llm_cache, path=args.llm_cache_path)
+    configure_solution_library(args.solution_library, path=args.solution_library_path)
+    configure_model_routing(args.model_routes)
+    configure_pytest_pool(args.pytest_workers)
+    configure_llm_scheduler(
+        rpm=args.rpm,
+        tpm=args.tpm,
+        max_retries=args.llm_max_retries,
+        completion_tokens=int(os.getenv("LLM_COMPLETION_TOKENS", str(DEFAULT_COMPLETION_TOKENS))),
+    )
+
     print(f"Starting agent for spec: {args.spec}\n")
-    
-    final_state_data = run_self_verifying_agent(args.spec, max_iterations=args.max_iterations)
+
+    if args.stream:
+        final_state_data = dict(saved)
+        current = None
+        tracer = Tracer()
+        for node_name, update in stream_self_verifying_agent(
+            args.spec,
+            max_iterations=args.max_iterations,
+            fix_candidates=args.fix_candidates,
+            fix_mode=args.fix_mode,
+            performance_check=args.check_performance,
+            stream_tokens=True,
+            tracer=tracer,
+            run_id=run_id,
+        ):
+            if isinstance(update, str):
+                if node_name != current:
+                    print(f"\n--- {node_name} ---")
+                    current = node_name
+                print(update, end="", flush=True)
+            else:
+                final_state_data.update(update)
+                current = None
+        final_state_data["trace"] = list(tracer.spans)
+    else:
+        final_state_data = run_self_verifying_agent(
+            args.spec,
+            max_iterations=args.max_iterations,
+            fix_candidates=args.fix_candidates,
+            fix_mode=args.fix_mode,
+            performance_check=args.check_performance,
+            run_id=run_id,
+        )
 
     print("\n=== Final Status ===")
     print(json.dumps(final_state_data.get("error_analysis"), indent=2, default=str))
@@ -47,6 +241,23 @@ def main() -> None:
     print("\n=== Tests ===")
     print(final_state_data.get("tests"))
 
+    if cache.enabled:
+        print("\n=== LLM Cache ===")
+        print(json.dumps(cache.stats(), indent=2))
+
+    if args.trace:
+        spans = final_state_data.get("trace") or []
+        with open(args.trace, "w", encoding="utf-8") as fh:
+            if args.trace.endswith(".json"):
+                json.dump(spans_to_otel(spans), fh, indent=2)
+            else:
+                fh.write(spans_to_jsonl(spans))
+        print(f"\nWrote {len(spans)} spans to {args.trace}")
+
+    if args.metrics:
+        print("\n=== Metrics ===")
+        print(get_metrics().render_prometheus(), end="")
+
 
 if __name__ == "__main__":  # pragma: no cover
     main()
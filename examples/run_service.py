@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the self-verifying code agent as a local HTTP job service.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("AGENT_SERVICE_WORKERS", "4")),
+        help="Agent runs executed at once.",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=int(os.getenv("AGENT_SERVICE_QUEUE", "16")),
+        help="Jobs allowed to wait for a worker before submissions get 429.",
+    )
+    parser.add_argument(
+        "--pytest-workers",
+        type=int,
+        default=None,
+        help="Size of the shared pytest worker pool (default: same as --workers).",
+    )
+
+    args = parser.parse_args()
+
+    # Imported here so the spawned pytest pool workers, which re-import this module
+    # as `__mp_main__`, do not load the agent.
+    try:
+        import uvicorn
+    except ImportError as exc:
+        raise SystemExit("The job service requires `pip install uvicorn`.") from exc
+
+    from self_verifying_agent.pytest_pool import configure_pytest_pool
+    from self_verifying_agent.service import JobManager, create_app
+
+    configure_pytest_pool(args.pytest_workers if args.pytest_workers is not None else args.workers)
+    app = create_app(JobManager(workers=args.workers, max_queue=args.max_queue))
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
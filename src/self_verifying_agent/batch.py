@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Set
+
+from .graph import run_self_verifying_agent
+
+
+def spec_id(spec: str) -> str:
+    """Stable identifier for specs that do not carry their own `id`."""
+
+    return hashlib.sha256(spec.encode("utf-8")).hexdigest()[:16]
+
+
+def read_specs(path: Path | str) -> Iterator[Dict[str, Any]]:
+    """Yield `{"id", "spec", ...}` records from a JSONL file.
+
+    Each line is either a JSON object with a `spec` key (and optionally `id` and
+    `max_iterations`) or a bare JSON string.
+    """
+
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"spec": record}
+            record.setdefault("id", spec_id(record["spec"]))
+            yield record
+
+
+def completed_ids(path: Path | str) -> Set[str]:
+    """IDs already present in an output file, so a rerun can skip them."""
+
+    done: Set[str] = set()
+    if not Path(path).exists():
+        return done
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                done.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, KeyError, TypeError):
+                # A partially written last line from an interrupted run is retried.
+                continue
+    return done
+
+
+def run_one(record: Dict[str, Any], max_iterations: int = 3) -> Dict[str, Any]:
+    """Run the agent on one spec record and summarize the outcome.
+
+    The run ID is derived from the record ID, so with checkpointing enabled a spec
+    that was interrupted mid-run continues from its last checkpoint.
+    """
+
+    start = time.perf_counter()
+    result: Dict[str, Any] = {"id": record["id"], "spec": record["spec"]}
+    try:
+        final_state = run_self_verifying_agent(
+            record["spec"],
+            max_iterations=record.get("max_iterations", max_iterations),
+            run_id=f"batch-{record['id']}",
+        )
+    except Exception as exc:  # noqa: BLE001 - one bad spec must not stop the batch
+        result.update({"status": "error", "error": f"{type(exc).__name__}: {exc}"})
+    else:
+        analysis = final_state.get("error_analysis") or {}
+        result.update(
+            {
+                "status": "success" if analysis.get("status") == "success" else "failed",
+                "iterations": final_state.get("iteration", 0),
+                "code": final_state.get("code"),
+                "tests": final_state.get("tests"),
+                "error_analysis": analysis,
+            }
+        )
+    result["wall_time"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_batch(
+    input_path: Path | str,
+    output_path: Path | str,
+    concurrency: int = 4,
+    max_iterations: int = 3,
+) -> Dict[str, int]:
+    """Run every spec in `input_path` concurrently, appending results to `output_path`.
+
+    At most `concurrency` agent runs are in flight at once. Each result is written
+    as one JSONL line as soon as its run finishes, and specs whose `id` is already in
+    the output file are skipped, so an interrupted batch can simply be rerun.
+    """
+
+    done = completed_ids(output_path)
+    counts = {"skipped": 0, "success": 0, "failed": 0, "error": 0}
+    pending: List[Dict[str, Any]] = []
+    for record in read_specs(input_path):
+        if record["id"] in done:
+            counts["skipped"] += 1
+            continue
+        done.add(record["id"])
+        pending.append(record)
+
+    # Results are written from this thread only, in completion order.
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_one, record, max_iterations) for record in pending]
+        for future in as_completed(futures):
+            result = future.result()
+            out.write(json.dumps(result, default=str) + "\n")
+            out.flush()
+            counts[result["status"]] += 1
+
+    return counts
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .prompt_context import truncate_middle
+
+DEFAULT_BLOB_DIR = Path.home() / ".cache" / "self_verifying_agent" / "blobs"
+# Checkpoints reference spilled blobs, so they use the same default retention.
+DEFAULT_MAX_AGE_SECONDS = 14 * 24 * 3600
+DEFAULT_INLINE_CHARS = 4000
+
+# gzip container with a 4 KiB window and small hash tables: logs still compress
+# well, and the compressor needs ~90 KB instead of ~300 KB at zlib's defaults.
+_GZIP_WBITS = 16 + 12
+_GZIP_MEMLEVEL = 5
+
+
+def _compress(data: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, _GZIP_WBITS, _GZIP_MEMLEVEL)
+    return compressor.compress(data) + compressor.flush()
+
+
+class BlobStore:
+    """Content-addressed, gzip-compressed text store on disk.
+
+    Large values (pytest logs, spilled history) are kept here so `AgentState` only
+    carries a short excerpt and a reference. Identical texts share one file, and
+    files untouched for `max_age_seconds` are removed by `prune`.
+    """
+
+    def __init__(self, root: Path | str = DEFAULT_BLOB_DIR, max_age_seconds: Optional[float] = DEFAULT_MAX_AGE_SECONDS) -> None:
+        self.root = Path(root)
+        self.max_age_seconds = max_age_seconds
+
+    def _path(self, ref: str) -> Path:
+        return self.root / ref[:2] / ref[2:]
+
+    def put(self, text: str) -> str:
+        data = text.encode("utf-8")
+        ref = hashlib.sha256(data).hexdigest()
+        path = self._path(ref)
+        if path.exists():
+            os.utime(path)
+            return ref
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so concurrent readers never see a partial file.
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(_compress(data))
+        os.replace(tmp, path)
+        return ref
+
+    def get(self, ref: str) -> str:
+        """Text stored under `ref`; raises `KeyError` if it was never stored or has been pruned."""
+
+        try:
+            return gzip.decompress(self._path(ref).read_bytes()).decode("utf-8")
+        except FileNotFoundError:
+            raise KeyError(ref) from None
+
+    def prune(self) -> int:
+        """Remove blobs older than `max_age_seconds`; returns how many were removed."""
+
+        if self.max_age_seconds is None or not self.root.exists():
+            return 0
+        cutoff = time.time() - self.max_age_seconds
+        removed = 0
+        for path in self.root.glob("*/*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+
+def configure_blob_store(root: Path | str | None = None, **options: Any) -> BlobStore:
+    """Install the process-wide blob store and prune it."""
+
+    global _store
+    with _store_lock:
+        _store = BlobStore(root or os.getenv("AGENT_BLOB_DIR") or DEFAULT_BLOB_DIR, **options)
+        _store.prune()
+        return _store
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide store, created under `AGENT_BLOB_DIR` (default: ~/.cache/self_verifying_agent/blobs) on first use."""
+
+    if _store is None:
+        configure_blob_store()
+    assert _store is not None
+    return _store
+
+
+def inline_chars() -> int:
+    """Longest text kept inline in the state; set with `AGENT_LOG_INLINE_CHARS`."""
+
+    return int(os.getenv("AGENT_LOG_INLINE_CHARS", str(DEFAULT_INLINE_CHARS)))
+
+
+def spill(container: Dict[str, Any], key: str, max_chars: Optional[int] = None) -> None:
+    """Move an oversized `container[key]` text to the blob store.
+
+    The full text goes to the store under `container[key + "_ref"]`, and a middle-truncated
+    excerpt of about `max_chars` stays under `key`.
+    """
+
+    max_chars = inline_chars() if max_chars is None else max_chars
+    text = container.get(key)
+    if not isinstance(text, str) or len(text) <= max_chars:
+        return
+    container[f"{key}_ref"] = get_blob_store().put(text)
+    container[key] = truncate_middle(text, max_chars // 4)
+
+
+def unspill(container: Dict[str, Any], key: str) -> Any:
+    """Full value of `container[key]`, loading it back from the store if it was spilled.
+
+    Falls back to the inline excerpt if the spilled text has been pruned.
+    """
+
+    ref = container.get(f"{key}_ref")
+    if ref:
+        try:
+            return get_blob_store().get(ref)
+        except KeyError:
+            pass
+    return container.get(key)
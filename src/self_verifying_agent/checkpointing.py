@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+
+from .blob_store import DEFAULT_MAX_AGE_SECONDS
+
+DEFAULT_CHECKPOINT_PATH = Path.home() / ".cache" / "self_verifying_agent" / "checkpoints.sqlite3"
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver[str]):
+    """LangGraph checkpointer that stores every checkpoint in a SQLite file.
+
+    A run is a LangGraph thread, so the graph saves `AgentState` after each step
+    under the run ID and an interrupted run continues from its last completed node.
+    The store stays bounded: each run keeps only its `keep_last` most recent
+    checkpoints, and `prune_runs` drops whole runs beyond `max_runs` or older than
+    `max_age_seconds` (it runs when the saver is opened).
+    """
+
+    def __init__(
+        self,
+        path: Path | str = DEFAULT_CHECKPOINT_PATH,
+        keep_last: int = 5,
+        max_runs: Optional[int] = 500,
+        max_age_seconds: Optional[float] = DEFAULT_MAX_AGE_SECONDS,
+        serde: Any = None,
+    ) -> None:
+        super().__init__(serde=serde)
+        self.path = Path(path)
+        self.keep_last = keep_last
+        self.max_runs = max_runs
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, "
+            "parent_checkpoint_id TEXT, type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, "
+            "created REAL NOT NULL, PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS writes ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, "
+            "task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT, value BLOB, "
+            "task_path TEXT NOT NULL DEFAULT '', PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS checkpoints_created ON checkpoints (created)")
+        self._conn.commit()
+        self.prune_runs()
+
+    # -- reads ---------------------------------------------------------------
+
+    def _writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> List[Tuple[str, str, Any]]:
+        rows = self._conn.execute(
+            "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        rows.sort(key=lambda row: writes_sort_key(row[5], row[0], row[1]))
+        return [(task_id, channel, self.serde.loads_typed((type_, value))) for task_id, _, channel, type_, value, _ in rows]
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: Sequence[Any]) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+
+        def config(checkpoint_id: str) -> RunnableConfig:
+            return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+        return CheckpointTuple(
+            config=config(checkpoint_id),
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=config(parent_id) if parent_id else None,
+            pending_writes=self._writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = (
+            "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        params: Tuple[Any, ...] = (thread_id, checkpoint_ns)
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id:
+            query += " AND checkpoint_id = ?"
+            params += (checkpoint_id,)
+        else:
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._lock:
+            row = self._conn.execute(query, params).fetchone()
+            return self._tuple(thread_id, checkpoint_ns, row) if row is not None else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+            "metadata_type, metadata FROM checkpoints"
+        )
+        clauses: List[str] = []
+        params: List[Any] = []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and limit <= 0:
+                return
+            with self._lock:
+                item = self._tuple(thread_id, checkpoint_ns, row)
+            if filter and not all(item.metadata.get(key) == value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    # -- writes --------------------------------------------------------------
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    blob,
+                    metadata_type,
+                    metadata_blob,
+                    time.time(),
+                ),
+            )
+            self._trim(thread_id, checkpoint_ns, self.keep_last)
+            self._conn.commit()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # Regular writes are saved once per task; special ones (errors, interrupts) are replaced.
+        rows: Dict[str, List[Tuple[Any, ...]]] = {"INSERT OR IGNORE": [], "INSERT OR REPLACE": []}
+        for index, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            verb = "INSERT OR REPLACE" if channel in WRITES_IDX_MAP else "INSERT OR IGNORE"
+            rows[verb].append(
+                (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, index), channel, type_, blob, task_path)
+            )
+        with self._lock:
+            for verb, batch in rows.items():
+                if batch:
+                    self._conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            self._conn.commit()
+
+    def _trim(self, thread_id: str, checkpoint_ns: str, keep: int) -> None:
+        """Drop all but the `keep` newest checkpoints of a run, with their writes."""
+
+        self._conn.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT ?)",
+            (thread_id, checkpoint_ns, thread_id, checkpoint_ns, max(keep, 1)),
+        )
+        self._conn.execute(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?)",
+            (thread_id, checkpoint_ns, thread_id, checkpoint_ns),
+        )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+            self._conn.commit()
+
+    def prune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest") -> None:
+        if strategy == "delete":
+            for thread_id in thread_ids:
+                self.delete_thread(thread_id)
+            return
+        if strategy != "keep_latest":
+            raise ValueError(f"Unknown prune strategy '{strategy}'. Expected 'keep_latest' or 'delete'.")
+        with self._lock:
+            for thread_id in thread_ids:
+                namespaces = self._conn.execute(
+                    "SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,)
+                ).fetchall()
+                for (checkpoint_ns,) in namespaces:
+                    self._trim(thread_id, checkpoint_ns, 1)
+            self._conn.commit()
+
+    def prune_runs(self) -> int:
+        """Delete runs older than `max_age_seconds` or beyond the `max_runs` most recent; returns how many."""
+
+        with self._lock:
+            runs = self._conn.execute(
+                "SELECT thread_id, MAX(created) AS last FROM checkpoints GROUP BY thread_id ORDER BY last DESC"
+            ).fetchall()
+        now = time.time()
+        stale = [
+            thread_id
+            for position, (thread_id, last) in enumerate(runs)
+            if (self.max_runs is not None and position >= self.max_runs)
+            or (self.max_age_seconds is not None and now - last > self.max_age_seconds)
+        ]
+        for thread_id in stale:
+            self.delete_thread(thread_id)
+        return len(stale)
+
+    def saved_state(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Latest saved `AgentState` fields of a run, or None if it has no checkpoint."""
+
+        saved = self.get_tuple({"configurable": {"thread_id": run_id}})
+        return dict(saved.checkpoint["channel_values"]) if saved is not None else None
+
+    def runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recently updated runs as `{run_id, updated, checkpoints}`."""
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT thread_id, MAX(created), COUNT(*) FROM checkpoints GROUP BY thread_id "
+                "ORDER BY MAX(created) DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [{"run_id": run_id, "updated": updated, "checkpoints": count} for run_id, updated, count in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # -- async: SQLite calls are short, so these run inline ------------------
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    async def aprune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest") -> None:
+        self.prune(thread_ids, strategy=strategy)
+
+
+_checkpointer: Optional[SqliteCheckpointSaver] = None
+_checkpointer_configured = False
+_checkpointer_lock = threading.Lock()
+
+
+def configure_checkpointer(
+    enabled: bool = True,
+    path: Path | str | None = None,
+    **options: Any,
+) -> Optional[SqliteCheckpointSaver]:
+    """Install (or, with `enabled=False`, remove) the process-wide checkpointer used by the runners."""
+
+    global _checkpointer, _checkpointer_configured
+    with _checkpointer_lock:
+        if _checkpointer is not None:
+            _checkpointer.close()
+        _checkpointer = (
+            SqliteCheckpointSaver(path or os.getenv("AGENT_CHECKPOINT_PATH") or DEFAULT_CHECKPOINT_PATH, **options)
+            if enabled
+            else None
+        )
+        _checkpointer_configured = True
+        return _checkpointer
+
+
+def get_checkpointer() -> Optional[SqliteCheckpointSaver]:
+    """Return the process-wide checkpointer, or None when checkpointing is off.
+
+    Unless `configure_checkpointer` was called, it is enabled on first use when
+    `AGENT_CHECKPOINTS` is "on" (default "off"), storing to `AGENT_CHECKPOINT_PATH`.
+    """
+
+    if not _checkpointer_configured:
+        configure_checkpointer(os.getenv("AGENT_CHECKPOINTS", "off").lower() in ("1", "on", "true", "yes"))
+    return _checkpointer
@@ -1,28 +1,43 @@
 from __future__ import annotations
 
-from .llm_factory import get_llm
+import ast
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from .model_routing import Route, routed
+from .patching import DIVIDER, REPLACE_MARK, SEARCH_MARK, PatchError, apply_patch, unified_diff
+from .prompt_context import failure_context
 from .state import AgentState
-from .utils import strip_markdown
+from .streaming import acomplete, complete
+from .test_impact import tests_digest
+from .test_runner import aexecute_tests, execute_tests
+from .utils import content_text, line_delta, strip_markdown
 
 
-def fix_code(state: AgentState) -> AgentState:
-    """Modify the existing code based on error analysis.
+SYSTEM_PROMPT = (
+    "You are a careful Python refactoring assistant. Given code, a specification, "
+    "and a description of failing tests, you make the smallest possible change to "
+    "fix the bug while preserving style and structure. Return ONLY the updated code."
+)
 
-    The model is instructed to make targeted edits instead of full rewrites where possible.
-    """
+PATCH_SYSTEM_PROMPT = (
+    "You are a careful Python refactoring assistant. Given code, a specification, "
+    "and a description of failing tests, you make the smallest possible change to "
+    "fix the bug while preserving style and structure. Return ONLY edit blocks in "
+    "this exact format, one block per change:\n"
+    f"{SEARCH_MARK}\n<lines copied exactly from the current code>\n{DIVIDER}\n"
+    f"<replacement lines>\n{REPLACE_MARK}\n"
+    "Each SEARCH section must match the current code exactly, including indentation, "
+    "and include enough surrounding lines to be unique. Do not repeat unchanged code."
+)
 
-    if state.code is None or state.error_analysis is None:
-        return state
+FIX_MODES = ("rewrite", "patch")
 
-    print(f">>> Agent is attempting to fix the code (Iteration {state.iteration + 1})...")
-    llm = get_llm()
-
-    system = (
-        "You are a careful Python refactoring assistant. Given code, a specification, "
-        "and a description of failing tests, you make the smallest possible change to "
-        "fix the bug while preserving style and structure. Return ONLY the updated code."
-    )
 
+def _messages(state: AgentState, mode: str = "rewrite") -> List[Dict[str, str]]:
     user = f"""
 Specification:
 {state.spec}
@@ -33,32 +48,320 @@ Current code:
 Error analysis (JSON-like):
 {state.error_analysis}
 
-Raw test results (stdout):
-{state.test_results.get("stdout") if state.test_results else "N/A"}
-
-Raw test results (stderr):
-{state.test_results.get("stderr") if state.test_results else "N/A"}
+Failing tests:
+{failure_context(state.test_results, state.tests) if state.test_results else "N/A"}
 
 Update the code to address the described failures. Do not add unrelated features.
 """
-
-    resp = llm.invoke([
-        {"role": "system", "content": system},
+    return [
+        {"role": "system", "content": PATCH_SYSTEM_PROMPT if mode == "patch" else SYSTEM_PROMPT},
         {"role": "user", "content": user},
-    ])
+    ]
+
+
+def _patched(code: str, reply: str) -> str:
+    """New code from a patch-mode reply; a reply that is a whole module instead of edits is used as-is."""
+
+    try:
+        return apply_patch(code, reply)
+    except PatchError as exc:
+        error = exc
+    candidate = strip_markdown(reply)
+    try:
+        tree = ast.parse(candidate)
+    except SyntaxError:
+        raise error from None
+    if not any(isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) for node in tree.body):
+        raise error
+    return candidate
+
+
+def candidate_temperatures(n: int, base: float = 0.2, step: float = 0.25) -> List[float]:
+    """Temperatures for `n` fix candidates: the default first, then spread up to 1.0."""
+
+    return [round(min(base + i * step, 1.0), 2) for i in range(n)]
+
+
+def _candidate(state: AgentState, llm: Any, messages: List[Dict[str, str]]) -> Tuple[str, Optional[str]]:
+    """One fix candidate's code, plus the patch error if patch mode fell back to a rewrite."""
+
+    reply = content_text(llm.invoke(messages).content)
+    if state.fix_mode != "patch":
+        return strip_markdown(reply), None
+    try:
+        return _patched(state.code or "", reply), None
+    except PatchError as exc:
+        return strip_markdown(content_text(llm.invoke(_messages(state)).content)), str(exc)
+
+
+async def _acandidate(state: AgentState, llm: Any, messages: List[Dict[str, str]]) -> Tuple[str, Optional[str]]:
+    reply = content_text((await llm.ainvoke(messages)).content)
+    if state.fix_mode != "patch":
+        return strip_markdown(reply), None
+    try:
+        return _patched(state.code or "", reply), None
+    except PatchError as exc:
+        return strip_markdown(content_text((await llm.ainvoke(_messages(state))).content)), str(exc)
+
+
+def _failure_count(result: Dict[str, Any]) -> Optional[int]:
+    """Failing tests in a candidate's run, or None if the suite never ran (crash, collection error)."""
+
+    if result.get("exit_code") == 0:
+        return 0
+    records = result.get("tests")
+    if not records or any("::" not in record["nodeid"] for record in records):
+        return None
+    return sum(1 for record in records if record["outcome"] in ("failed", "error"))
+
+
+# Candidates run the suite the way a full `test_runner` run does, so the winner's result can stand in for it.
+_CANDIDATE_ARGS = ["--agent-coverage"]
+
+
+def _new_outcomes(temperatures: List[float]) -> List[Dict[str, Any]]:
+    return [{"candidate": i, "temperature": t, "status": "cancelled"} for i, t in enumerate(temperatures)]
+
+
+def _score(outcome: Dict[str, Any], result: Dict[str, Any]) -> None:
+    outcome.update(
+        {
+            "status": "passed" if result["exit_code"] == 0 else "failed",
+            "exit_code": result["exit_code"],
+            "failures": _failure_count(result),
+            "summary": result.get("summary"),
+        }
+    )
+
+
+def _errored(outcome: Dict[str, Any], exc: Exception) -> None:
+    outcome.update({"status": "error", "error": f"{type(exc).__name__}: {exc}"})
+
+
+def _choose(
+    state: AgentState,
+    outcomes: List[Dict[str, Any]],
+    codes: List[Optional[str]],
+    results: List[Optional[Dict[str, Any]]],
+    errors: List[Exception],
+    winner: Optional[int],
+) -> Tuple[str, Optional[str]]:
+    """Pick the fallback winner if none passed, record all candidates, and return the winning code and patch error.
+
+    Raises the first candidate's error only if no candidate got as far as a test run.
+    The winner's test result is kept in `state.fix_verification` for `test_runner`.
+    """
+
+    if winner is None:
+        tested = [o for o in outcomes if o["status"] == "failed"]
+        if not tested:
+            if errors:
+                raise errors[0]
+            raise RuntimeError("No fix candidate could be generated.")
+        # Candidates whose suite never ran rank below any that produced results.
+        winner = min(tested, key=lambda o: (o["failures"] is None, o["failures"] or 0))["candidate"]
+
+    state.record_snapshot(
+        event="fix_candidates",
+        candidates=[dict(o) for o in outcomes],
+        chosen=winner,
+    )
+    code = codes[winner] or ""
+    result = results[winner]
+    state.fix_verification = (
+        {"code": code, "tests_digest": tests_digest(state.tests or ""), "result": result} if result is not None else None
+    )
+    return code, outcomes[winner].get("patch_error")
+
+
+def _best_of_n(state: AgentState, messages: List[Dict[str, str]], route: Route) -> Tuple[str, Optional[str]]:
+    """Request `state.fix_candidates` fixes in parallel and keep the best one.
+
+    Each candidate is generated on `route`'s model at its own temperature, starting
+    from the route's, and tested against the full
+    suite as soon as it arrives. The first fully passing candidate wins and the rest
+    are cancelled (pending ones never start, in-flight ones skip their test run);
+    otherwise the candidate with the fewest failing tests wins. A candidate whose
+    LLM call or test run raises is recorded as an error and the others go on.
+    Every candidate's outcome is recorded in `state.history`.
+    """
+
+    assert state.tests is not None
+    tests = state.tests
+    temperatures = candidate_temperatures(state.fix_candidates, base=route.temperature)
+    done_event = threading.Event()
+    outcomes = _new_outcomes(temperatures)
+    codes: List[Optional[str]] = [None] * len(temperatures)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(temperatures)
+    errors: List[Exception] = []
+
+    def attempt(index: int) -> int:
+        if done_event.is_set():
+            return index
+        try:
+            code, patch_error = _candidate(state, route.llm(temperatures[index]), messages)
+            codes[index] = code
+            if patch_error:
+                outcomes[index]["patch_error"] = patch_error
+            if done_event.is_set():
+                return index
+            result = execute_tests(code, tests, args=_CANDIDATE_ARGS)
+        except Exception as exc:
+            _errored(outcomes[index], exc)
+            errors.append(exc)
+            return index
+        results[index] = result
+        _score(outcomes[index], result)
+        if result["exit_code"] == 0:
+            done_event.set()
+        return index
+
+    executor = ThreadPoolExecutor(max_workers=len(temperatures))
+    # Each candidate runs in a copy of this context so its spans join the node's trace.
+    pending = {executor.submit(contextvars.copy_context().run, attempt, i) for i in range(len(temperatures))}
+    winner: Optional[int] = None
+    try:
+        while pending and winner is None:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = future.result()
+                if outcomes[index]["status"] == "passed":
+                    winner = index
+                    break
+    finally:
+        done_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return _choose(state, outcomes, codes, results, errors, winner)
+
+
+async def _abest_of_n(state: AgentState, messages: List[Dict[str, str]], route: Route) -> Tuple[str, Optional[str]]:
+    """Async version of `_best_of_n`; losing candidates are cancelled as tasks."""
 
-    content = resp.content
-    if isinstance(content, str):
-        new_code = content
-    else:
-        new_code = "".join(part["text"] for part in content if isinstance(part, dict) and "text" in part)
+    assert state.tests is not None
+    tests = state.tests
+    temperatures = candidate_temperatures(state.fix_candidates, base=route.temperature)
+    outcomes = _new_outcomes(temperatures)
+    codes: List[Optional[str]] = [None] * len(temperatures)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(temperatures)
+    errors: List[Exception] = []
 
-    # Record a lightweight snapshot before overwriting.
+    async def attempt(index: int) -> int:
+        try:
+            code, patch_error = await _acandidate(state, route.llm(temperatures[index]), messages)
+            codes[index] = code
+            if patch_error:
+                outcomes[index]["patch_error"] = patch_error
+            result = await aexecute_tests(code, tests, args=_CANDIDATE_ARGS)
+        except Exception as exc:
+            _errored(outcomes[index], exc)
+            errors.append(exc)
+            return index
+        results[index] = result
+        _score(outcomes[index], result)
+        return index
+
+    tasks = [asyncio.create_task(attempt(i)) for i in range(len(temperatures))]
+    winner: Optional[int] = None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index = await next_done
+            if outcomes[index]["status"] == "passed":
+                winner = index
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return _choose(state, outcomes, codes, results, errors, winner)
+
+
+def _fix_with_patch(state: AgentState, messages: List[Dict[str, str]], llm: Any) -> Tuple[str, Optional[str]]:
+    """Ask for edits and apply them; if they do not apply, fall back to a full rewrite."""
+
+    reply = complete(llm, messages, node="code_fixer")
+    try:
+        return _patched(state.code or "", reply), None
+    except PatchError as exc:
+        print(f">>> Patch did not apply ({exc}); falling back to a full rewrite...")
+        return strip_markdown(complete(llm, _messages(state), node="code_fixer")), str(exc)
+
+
+async def _afix_with_patch(state: AgentState, messages: List[Dict[str, str]], llm: Any) -> Tuple[str, Optional[str]]:
+    reply = await acomplete(llm, messages, node="code_fixer")
+    try:
+        return _patched(state.code or "", reply), None
+    except PatchError as exc:
+        print(f">>> Patch did not apply ({exc}); falling back to a full rewrite...")
+        return strip_markdown(await acomplete(llm, _messages(state), node="code_fixer")), str(exc)
+
+
+def _apply(state: AgentState, new_code: str, patch_error: Optional[str] = None) -> AgentState:
+    # Record a lightweight snapshot before overwriting: what was being fixed, and a
+    # delta from the new code back to the old one so earlier versions can be rebuilt.
+    # In patch mode the applied diff is kept as well, or why it fell back to a rewrite.
+    analysis = state.error_analysis or {}
+    patch: Dict[str, Any] = {}
+    if state.fix_mode == "patch":
+        patch = {"patch_error": patch_error} if patch_error else {"patch": unified_diff(state.code or "", new_code)}
     state.record_snapshot(
         event="fix_code",
-        previous_error_analysis=state.error_analysis,
+        fix_mode=state.fix_mode,
+        previous_error_type=analysis.get("error_type"),
+        previous_error_summary=str(analysis.get("summary") or analysis.get("raw") or "")[:300],
+        code_delta=line_delta(new_code, state.code or ""),
+        **patch,
     )
 
     state.increment_iteration()
-    state.code = strip_markdown(new_code)
+    state.code = new_code
     return state
+
+
+def fix_code(state: AgentState) -> AgentState:
+    """Modify the existing code based on error analysis.
+
+    The model is instructed to make targeted edits instead of full rewrites where possible.
+    With `state.fix_mode == "patch"` it returns only SEARCH/REPLACE edits (unified diffs
+    are accepted too), which are applied locally with fuzzy matching; if they do not
+    apply, the full-rewrite prompt is used instead. With `state.fix_candidates > 1`,
+    several candidates are generated and verified in parallel and the best one is kept
+    (see `_best_of_n`). The model and temperature come from the `code_fixer` route
+    (see `model_routing`), which can escalate as the repair drags on.
+    """
+
+    if state.code is None or state.error_analysis is None:
+        return state
+
+    print(f">>> Agent is attempting to fix the code (Iteration {state.iteration + 1})...")
+    messages = _messages(state, state.fix_mode)
+
+    with routed(state, "code_fixer") as route:
+        if state.fix_candidates > 1 and state.tests is not None:
+            new_code, patch_error = _best_of_n(state, messages, route)
+        elif state.fix_mode == "patch":
+            new_code, patch_error = _fix_with_patch(state, messages, route.llm())
+        else:
+            new_code, patch_error = strip_markdown(complete(route.llm(), messages, node="code_fixer")), None
+
+    return _apply(state, new_code, patch_error)
+
+
+async def afix_code(state: AgentState) -> AgentState:
+    """Async version of `fix_code`."""
+
+    if state.code is None or state.error_analysis is None:
+        return state
+
+    print(f">>> Agent is attempting to fix the code (Iteration {state.iteration + 1})...")
+    messages = _messages(state, state.fix_mode)
+
+    with routed(state, "code_fixer") as route:
+        if state.fix_candidates > 1 and state.tests is not None:
+            new_code, patch_error = await _abest_of_n(state, messages, route)
+        elif state.fix_mode == "patch":
+            new_code, patch_error = await _afix_with_patch(state, messages, route.llm())
+        else:
+            new_code, patch_error = strip_markdown(await acomplete(route.llm(), messages, node="code_fixer")), None
+
+    return _apply(state, new_code, patch_error)
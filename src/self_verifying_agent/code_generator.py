@@ -1,20 +1,15 @@
 from __future__ import annotations
 
-from .llm_factory import get_llm
+from typing import Any, Dict, List
+
+from .model_routing import routed
+from .prompt_context import reference_context
 from .state import AgentState
+from .streaming import acomplete, complete
 from .utils import strip_markdown
 
 
-def generate_code(state: AgentState) -> AgentState:
-    """Generate or regenerate implementation code from the parsed spec.
-
-    For iteration 0, this creates an initial version. For later iterations, this may
-    still be called but typically the code_fixer will handle modifications.
-    """
-
-    print(">>> Agent is generating the implementation code...")
-    llm = get_llm()
-
+def _messages(state: AgentState) -> List[Dict[str, str]]:
     system = (
         "You are a senior Python engineer. Write minimal, readable, well-documented "
         "Python code implementing the requested function. Use only the standard library."
@@ -30,18 +25,35 @@ Write a single Python module that:
 - Avoids overengineering; focus on correctness and clarity.
 - Does not include any test code.
 """
+    user += reference_context(state.reference, "code")
 
-    resp = llm.invoke([
+    return [
         {"role": "system", "content": system},
         {"role": "user", "content": user},
-    ])
+    ]
 
-    content = resp.content
-    if isinstance(content, str):
-        code = content
-    else:
-        # Concatenate parts if needed
-        code = "".join(part["text"] for part in content if isinstance(part, dict) and "text" in part)
 
-    state.code = strip_markdown(code)
-    return state
+def generate_code(state: AgentState) -> Dict[str, Any]:
+    """Generate or regenerate implementation code from the parsed spec.
+
+    For iteration 0, this creates an initial version. For later iterations, this may
+    still be called but typically the code_fixer will handle modifications.
+
+    Runs in parallel with `generate_tests`, so it returns a partial update that only
+    touches `code` (and `model_routes`, whose reducer merges both nodes' entries)
+    instead of the whole state.
+    """
+
+    print(">>> Agent is generating the implementation code...")
+    with routed(state, "code_generator") as route:
+        code = complete(route.llm(), _messages(state), node="code_generator")
+    return {"code": strip_markdown(code), "model_routes": state.model_routes}
+
+
+async def agenerate_code(state: AgentState) -> Dict[str, Any]:
+    """Async version of `generate_code`."""
+
+    print(">>> Agent is generating the implementation code...")
+    with routed(state, "code_generator") as route:
+        code = await acomplete(route.llm(), _messages(state), node="code_generator")
+    return {"code": strip_markdown(code), "model_routes": state.model_routes}
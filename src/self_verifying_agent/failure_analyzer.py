@@ -1,35 +1,49 @@
 from __future__ import annotations
 
-from typing import Any, Dict
+import json
+from typing import Any, Dict, List, Optional
 
-from .llm_factory import get_llm
+from .model_routing import routed
+from .performance import performance_analysis
+from .preflight import rule_based_analysis
+from .prompt_context import failure_context
 from .state import AgentState
-from .utils import strip_markdown
+from .utils import content_text, strip_markdown
 
 
-def analyze_failures(state: AgentState) -> AgentState:
-    """Analyze pytest output to explain failures and classify error types.
-
-    If tests passed, marks the analysis accordingly.
-    """
-
+def _passed(state: AgentState) -> Optional[Dict[str, Any]]:
     results = state.test_results or {}
-    exit_code = results.get("exit_code", 1)
-
-    if exit_code == 0:
-        state.error_analysis = {
+    if results.get("exit_code", 1) == 0:
+        return {
             "status": "success",
             "summary": "All tests passed.",
         }
-        return state
+    return None
 
-    print(">>> Agent is analyzing test failures...")
-    llm = get_llm()
 
+def _local_analysis(state: AgentState) -> Optional[Dict[str, Any]]:
+    """The analysis when it needs no LLM: tests passed, the code is too slow, or the failure is trivially classifiable."""
+
+    analysis = performance_analysis(state.test_results) or _passed(state) or rule_based_analysis(state.test_results)
+    if analysis is not None and analysis["status"] != "success":
+        print(f">>> Agent classified the failure without the LLM ({analysis['error_type']}).")
+    return analysis
+
+
+def _hints(results: Optional[Dict[str, Any]]) -> str:
+    problems = (results or {}).get("preflight_hints")
+    if not problems:
+        return ""
+    lines = "\n".join(f"- {p['message']}" for p in problems)
+    return f"\nStatic checks before the run (may be false positives):\n{lines}\n"
+
+
+def _messages(state: AgentState) -> List[Dict[str, str]]:
     system = (
         "You are an expert Python debugging assistant. Given pytest output, "
         "explain what failed, why it failed, and classify the error type as one of: "
-        "logic_error, boundary_condition, performance_issue, type_mismatch, other. "
+        "logic_error, boundary_condition, performance_issue, type_mismatch, "
+        "syntax_error, import_error, other. "
         "Reference specific lines from the traceback when possible. Return JSON only."
     )
 
@@ -40,34 +54,69 @@ Specification:
 Code under test:
 {state.code}
 
-Tests:
-{state.tests}
-
-Pytest output (stdout):
-{results.get("stdout", "")}
-
-Pytest errors (stderr):
-{results.get("stderr", "")}
-
+Failing tests:
+{failure_context(state.test_results, state.tests)}
+{_hints(state.test_results)}
 Return JSON with keys: status, summary, error_type, focus_lines, suggestions.
 """
 
-    resp = llm.invoke([
+    return [
         {"role": "system", "content": system},
         {"role": "user", "content": user},
-    ])
+    ]
+
+
+def _parse(content: Any) -> Dict[str, Any]:
+    text = strip_markdown(content_text(content))
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return {"raw": text}
 
-    content = resp.content
-    content = strip_markdown(content)
-    if isinstance(content, str):
-        import json
 
-        try:
-            analysis: Dict[str, Any] = json.loads(content)
-        except json.JSONDecodeError:
-            analysis = {"raw": content}
-    else:
-        analysis = {"raw": content}
+def _classify_timeouts(state: AgentState, analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """Tests stopped by a time or CPU limit make this a performance issue, whatever the model says."""
 
-    state.error_analysis = analysis
+    timed_out = (state.test_results or {}).get("timed_out_tests")
+    if timed_out and isinstance(analysis, dict):
+        analysis["error_type"] = "performance_issue"
+        analysis["timed_out_tests"] = timed_out
+    return analysis
+
+
+def analyze_failures(state: AgentState) -> AgentState:
+    """Analyze pytest output to explain failures and classify error types.
+
+    If tests passed, marks the analysis accordingly. Failures that `preflight`
+    classifies by rule (problems found before pytest ran, collection-time syntax or
+    import errors) get a local analysis with `source` set and no LLM call. Otherwise
+    the prompt carries only the failing tests and their relevant frames, within the
+    `failure_context` budget. Runs with tests that hit a time limit, and code the
+    performance check found too slow, are classified as `performance_issue`.
+    """
+
+    local = _local_analysis(state)
+    if local is not None:
+        state.error_analysis = local
+        return state
+
+    print(">>> Agent is analyzing test failures...")
+    with routed(state, "failure_analyzer") as route:
+        resp = route.llm().invoke(_messages(state))
+    state.error_analysis = _classify_timeouts(state, _parse(resp.content))
+    return state
+
+
+async def aanalyze_failures(state: AgentState) -> AgentState:
+    """Async version of `analyze_failures`."""
+
+    local = _local_analysis(state)
+    if local is not None:
+        state.error_analysis = local
+        return state
+
+    print(">>> Agent is analyzing test failures...")
+    with routed(state, "failure_analyzer") as route:
+        resp = await route.llm().ainvoke(_messages(state))
+    state.error_analysis = _classify_timeouts(state, _parse(resp.content))
     return state
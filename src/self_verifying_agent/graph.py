@@ -1,45 +1,72 @@
 from __future__ import annotations
 
-from typing import Callable
-
-from langgraph.graph import StateGraph, END
+import threading
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, Optional, Tuple
 
 from .state import AgentState
-from .spec_parser import parse_spec
-from .code_generator import generate_code
-from .test_generator import generate_tests
-from .test_runner import run_tests
-from .failure_analyzer import analyze_failures
-from .code_fixer import fix_code
+from .spec_parser import aparse_spec, parse_spec
+from .code_generator import agenerate_code, generate_code
+from .test_generator import agenerate_tests, generate_tests
+from .test_runner import arun_tests, run_tests
+from .failure_analyzer import aanalyze_failures, analyze_failures
+from .code_fixer import FIX_MODES, afix_code, fix_code
+from .performance import acheck_performance, check_performance
+from .solution_library import arecall_solution, astore_solution, recall_solution, store_solution
+from .instrumentation import Tracer, traced_node as _node
+from .llm_factory import load_env
+
+if TYPE_CHECKING:
+    from langgraph.graph import StateGraph
 
 
 def build_graph() -> StateGraph:
-    """Build the LangGraph workflow for the self-verifying code agent."""
+    """Build the LangGraph workflow for the self-verifying code agent.
+
+    LangGraph is imported here rather than with the module, so processes that
+    only import the package (CLI `--help`, pytest workers) start without it.
+    """
+
+    from langgraph.graph import END, StateGraph
 
     graph: StateGraph = StateGraph(AgentState)
 
-    # Register nodes
-    graph.add_node("spec_parser", parse_spec)
-    graph.add_node("code_generator", generate_code)
-    graph.add_node("test_generator", generate_tests)
-    graph.add_node("test_runner", run_tests)
-    graph.add_node("failure_analyzer", analyze_failures)
-    graph.add_node("code_fixer", fix_code)
+    # Register nodes. `stream` runs the sync functions, `astream` the async ones.
+    graph.add_node("solution_lookup", _node("solution_lookup", recall_solution, arecall_solution))
+    graph.add_node("spec_parser", _node("spec_parser", parse_spec, aparse_spec))
+    graph.add_node("code_generator", _node("code_generator", generate_code, agenerate_code))
+    graph.add_node("test_generator", _node("test_generator", generate_tests, agenerate_tests))
+    graph.add_node("test_runner", _node("test_runner", run_tests, arun_tests))
+    graph.add_node("failure_analyzer", _node("failure_analyzer", analyze_failures, aanalyze_failures))
+    graph.add_node("code_fixer", _node("code_fixer", fix_code, afix_code))
+    graph.add_node("performance_check", _node("performance_check", check_performance, acheck_performance))
+    graph.add_node("solution_store", _node("solution_store", store_solution, astore_solution))
+
+    # Entry point: a spec already solved ends the run with the stored solution.
+    graph.set_entry_point("solution_lookup")
+
+    def route_after_lookup(state: AgentState) -> str:
+        if (state.error_analysis or {}).get("status") == "success":
+            return END
+        return "spec_parser"
 
-    # Entry point
-    graph.set_entry_point("spec_parser")
+    graph.add_conditional_edges("solution_lookup", route_after_lookup, {"spec_parser": "spec_parser", END: END})
 
-    # Linear path for first pass: parse -> code -> tests -> run -> analyze
+    # First pass: parse, then fan out to the code and test generators. Both only
+    # need `parsed_spec` and write disjoint keys, so they run in the same step and
+    # join before the test runner.
     graph.add_edge("spec_parser", "code_generator")
-    graph.add_edge("code_generator", "test_generator")
-    graph.add_edge("test_generator", "test_runner")
+    graph.add_edge("spec_parser", "test_generator")
+    graph.add_edge(["code_generator", "test_generator"], "test_runner")
     graph.add_edge("test_runner", "failure_analyzer")
 
-    # Conditional edge from failure_analyzer: either stop or go to fixer.
+    # Conditional edge from failure_analyzer: either stop (saving a verified solution), check
+    # performance once the tests pass, or go to fixer.
     def route_after_analysis(state: AgentState) -> str:
         analysis = state.error_analysis or {}
         if analysis.get("status") == "success":
-            return END
+            if state.performance_check and "performance" not in (state.test_results or {}):
+                return "performance_check"
+            return "solution_store"
         if state.iteration >= state.max_iterations:
             return END
         # Otherwise, attempt a fix.
@@ -48,8 +75,22 @@ def build_graph() -> StateGraph:
     graph.add_conditional_edges(
         "failure_analyzer",
         route_after_analysis,
-        {"code_fixer": "code_fixer", END: END},
+        {"code_fixer": "code_fixer", "performance_check": "performance_check", "solution_store": "solution_store", END: END},
+    )
+
+    # Code that misses the complexity target goes back through analysis and repair.
+    def route_after_performance(state: AgentState) -> str:
+        report = (state.test_results or {}).get("performance") or {}
+        if report.get("status") == "too_slow":
+            return "failure_analyzer"
+        return "solution_store"
+
+    graph.add_conditional_edges(
+        "performance_check",
+        route_after_performance,
+        {"failure_analyzer": "failure_analyzer", "solution_store": "solution_store"},
     )
+    graph.add_edge("solution_store", END)
 
     # After fixing code, rerun tests (but reuse tests).
     graph.add_edge("code_fixer", "test_runner")
@@ -57,31 +98,257 @@ def build_graph() -> StateGraph:
     return graph
 
 
-def run_self_verifying_agent(spec: str, max_iterations: int = 3) -> dict:
-    """Run the self-verifying agent loop until tests pass or iterations exhausted."""
+_compiled: Optional[Tuple[Any, Any]] = None
+_compiled_lock = threading.Lock()
+
+
+def compiled_graph(checkpointer: Any = None) -> Any:
+    """The workflow compiled with `checkpointer`, built once and shared by every run.
+
+    A compiled graph holds no per-run state, so concurrent runs (threads, tasks,
+    Streamlit sessions) reuse it. It is recompiled only when the checkpointer changes.
+    """
+
+    global _compiled
+    with _compiled_lock:
+        if _compiled is None or _compiled[0] is not checkpointer:
+            _compiled = (checkpointer, build_graph().compile(checkpointer=checkpointer))
+        return _compiled[1]
+
+
+def _run_result(payload: Any, current: Optional[str]) -> Optional[str]:
+    """Latest analysis status seen in a state update, recorded on the run's root span."""
+
+    if isinstance(payload, dict) and isinstance(payload.get("error_analysis"), dict):
+        return payload["error_analysis"].get("status", current)
+    return current
+
+
+def _prepare(
+    spec: str,
+    max_iterations: int,
+    fix_candidates: int,
+    fix_mode: Optional[str],
+    performance_check: Optional[bool],
+    tracer: Optional[Tracer],
+    run_id: Optional[str],
+) -> Tuple[Any, Optional[AgentState], Dict[str, Any], Tracer, Dict[str, Any]]:
+    """Get the compiled graph and work out where the run starts.
+
+    Returns the compiled app, the graph input (None to continue from the last
+    checkpoint), the run config, the tracer and the state saved so far.
+    """
+
+    if fix_mode is not None and fix_mode not in FIX_MODES:
+        raise ValueError(f"Unknown fix mode '{fix_mode}'. Expected one of: {', '.join(FIX_MODES)}.")
+
+    from .checkpointing import get_checkpointer, new_run_id
+
+    load_env()
+    tracer = tracer or Tracer()
+    checkpointer = get_checkpointer()
+    app = compiled_graph(checkpointer)
+    config: Dict[str, Any] = {"configurable": {"tracer": tracer}}
+    settings: Dict[str, Any] = {"max_iterations": max_iterations, "fix_candidates": fix_candidates}
+    if fix_mode is not None:
+        settings["fix_mode"] = fix_mode
+    if performance_check is not None:
+        settings["performance_check"] = performance_check
+    graph_input: Optional[AgentState] = AgentState(spec=spec, **settings)
+    saved: Dict[str, Any] = {}
 
-    initial_state = AgentState(spec=spec, max_iterations=max_iterations)
+    if checkpointer is not None:
+        run_id = run_id or new_run_id()
+        config["configurable"]["thread_id"] = run_id
+        snapshot = app.get_state(config)
+        if snapshot.values:
+            saved = dict(snapshot.values)
+            graph_input = None
+            if snapshot.next:
+                print(f">>> Agent is resuming run {run_id}...")
+            else:
+                print(f">>> Agent run {run_id} already finished.")
+        else:
+            print(f">>> Agent run ID: {run_id}")
 
-    graph = build_graph()
-    app = graph.compile()
+    if graph_input is None:
+        # A resumed run keeps the settings it was started with, not this call's.
+        max_iterations = saved.get("max_iterations", max_iterations)
+        fix_candidates = saved.get("fix_candidates", fix_candidates)
+    tracer.start_run(
+        max_iterations=max_iterations,
+        fix_candidates=fix_candidates,
+        fix_mode=graph_input.fix_mode if graph_input is not None else saved.get("fix_mode"),
+        run_id=run_id,
+    )
+    return app, graph_input, config, tracer, saved
+
+
+def _stream(
+    app: Any, graph_input: Optional[AgentState], config: Dict[str, Any], tracer: Tracer, stream_tokens: bool
+) -> Iterator[Tuple[str, Any]]:
+    result: Optional[str] = None
+    try:
+        if not stream_tokens:
+            for event in app.stream(graph_input, config=config):
+                for node_name, state_update in event.items():
+                    result = _run_result(state_update, result)
+                    yield node_name, state_update
+        else:
+            for mode, payload in app.stream(graph_input, config=config, stream_mode=["updates", "custom"]):
+                if mode == "custom":
+                    yield payload["node"], payload["delta"]
+                    continue
+                for node_name, state_update in payload.items():
+                    result = _run_result(state_update, result)
+                    yield node_name, state_update
+    except BaseException as exc:
+        tracer.finish_run(error=exc, result=result)
+        raise
+    tracer.finish_run(result=result)
+
+
+async def _astream(
+    app: Any, graph_input: Optional[AgentState], config: Dict[str, Any], tracer: Tracer, stream_tokens: bool
+) -> AsyncIterator[Tuple[str, Any]]:
+    result: Optional[str] = None
+    try:
+        if not stream_tokens:
+            async for event in app.astream(graph_input, config=config):
+                for node_name, state_update in event.items():
+                    result = _run_result(state_update, result)
+                    yield node_name, state_update
+        else:
+            async for mode, payload in app.astream(graph_input, config=config, stream_mode=["updates", "custom"]):
+                if mode == "custom":
+                    yield payload["node"], payload["delta"]
+                    continue
+                for node_name, state_update in payload.items():
+                    result = _run_result(state_update, result)
+                    yield node_name, state_update
+    except BaseException as exc:
+        tracer.finish_run(error=exc, result=result)
+        raise
+    tracer.finish_run(result=result)
+
+
+def run_self_verifying_agent(
+    spec: str,
+    max_iterations: int = 3,
+    fix_candidates: int = 1,
+    fix_mode: Optional[str] = None,
+    performance_check: Optional[bool] = None,
+    run_id: Optional[str] = None,
+) -> dict:
+    """Run the self-verifying agent loop until tests pass or iterations exhausted.
+
+    `fix_candidates` > 1 makes each repair iteration try that many fixes in parallel.
+    `fix_mode` is "rewrite" or "patch" (see `code_fixer.fix_code`); it defaults to
+    `AGENT_FIX_MODE`, else "rewrite". With `performance_check` (default: `AGENT_PERF_CHECK`),
+    code that passes its tests is also timed against the spec's Big-O target (see
+    `performance.check_performance`) and sent back for repair if it scales worse.
+    The returned state's `trace` holds every span of the run.
+
+    When checkpointing is enabled (see `checkpointing`), the state is saved after
+    every node under `run_id` (a new ID if omitted, returned as `run_id`). Calling
+    again with the ID of an interrupted run continues it from its last checkpoint
+    instead of starting over; a finished run just returns its final state.
+    """
 
     # The graph itself handles the self-repair loop and iteration checking.
     # Streaming events to show progress in the terminal.
-    final_state = {}
-    for event in app.stream(initial_state):
-        for node_name, state_update in event.items():
-            print(f"--- Running Node: {node_name} ---")
-            final_state.update(state_update)
+    app, graph_input, config, tracer, final_state = _prepare(
+        spec, max_iterations, fix_candidates, fix_mode, performance_check, None, run_id
+    )
+    for node_name, state_update in _stream(app, graph_input, config, tracer, False):
+        print(f"--- Running Node: {node_name} ---")
+        final_state.update(state_update)
 
+    final_state["trace"] = list(tracer.spans)
+    if "thread_id" in config["configurable"]:
+        final_state["run_id"] = config["configurable"]["thread_id"]
     return final_state
 
 
-def stream_self_verifying_agent(spec: str, max_iterations: int = 3):
-    """Streaming version of the self-verifying agent runner."""
-    initial_state = AgentState(spec=spec, max_iterations=max_iterations)
-    graph = build_graph()
-    app = graph.compile()
+def resume_self_verifying_agent(run_id: str) -> dict:
+    """Continue an interrupted checkpointed run; its spec and settings come from the checkpoint."""
+
+    from .checkpointing import get_checkpointer
+
+    checkpointer = get_checkpointer()
+    if checkpointer is None:
+        raise ValueError("Resuming a run requires checkpointing; set AGENT_CHECKPOINTS=on or call configure_checkpointer().")
+    saved = checkpointer.saved_state(run_id)
+    if saved is None:
+        raise ValueError(f"No checkpoint found for run '{run_id}'.")
+    return run_self_verifying_agent(saved.get("spec", ""), run_id=run_id)
+
 
-    for event in app.stream(initial_state):
-        for node_name, state_update in event.items():
-            yield node_name, state_update
+def stream_self_verifying_agent(
+    spec: str,
+    max_iterations: int = 3,
+    fix_candidates: int = 1,
+    fix_mode: Optional[str] = None,
+    performance_check: Optional[bool] = None,
+    stream_tokens: bool = False,
+    tracer: Optional[Tracer] = None,
+    run_id: Optional[str] = None,
+) -> Iterator[Tuple[str, Any]]:
+    """Streaming version of the self-verifying agent runner.
+
+    Yields `(node_name, state_update)` after every node. With `stream_tokens`, it also
+    yields `(node_name, delta)` for each text chunk the code generator, test generator
+    and fixer receive from the LLM; deltas are `str`, state updates are `dict`.
+    Spans go to `tracer` (a fresh `Tracer` if omitted), which is finished when the
+    stream ends. `run_id` selects or resumes a checkpointed run as in
+    `run_self_verifying_agent`.
+    """
+    app, graph_input, config, tracer, _ = _prepare(
+        spec, max_iterations, fix_candidates, fix_mode, performance_check, tracer, run_id
+    )
+    yield from _stream(app, graph_input, config, tracer, stream_tokens)
+
+
+async def arun_self_verifying_agent(
+    spec: str,
+    max_iterations: int = 3,
+    fix_candidates: int = 1,
+    fix_mode: Optional[str] = None,
+    performance_check: Optional[bool] = None,
+    run_id: Optional[str] = None,
+) -> dict:
+    """Async version of `run_self_verifying_agent`.
+
+    Every node awaits its LLM calls and test runs, so one event loop can drive many
+    runs concurrently, e.g. with `asyncio.gather`.
+    """
+
+    app, graph_input, config, tracer, final_state = _prepare(
+        spec, max_iterations, fix_candidates, fix_mode, performance_check, None, run_id
+    )
+    async for node_name, state_update in _astream(app, graph_input, config, tracer, False):
+        print(f"--- Running Node: {node_name} ---")
+        final_state.update(state_update)
+
+    final_state["trace"] = list(tracer.spans)
+    if "thread_id" in config["configurable"]:
+        final_state["run_id"] = config["configurable"]["thread_id"]
+    return final_state
+
+
+async def astream_self_verifying_agent(
+    spec: str,
+    max_iterations: int = 3,
+    fix_candidates: int = 1,
+    fix_mode: Optional[str] = None,
+    performance_check: Optional[bool] = None,
+    stream_tokens: bool = False,
+    tracer: Optional[Tracer] = None,
+    run_id: Optional[str] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """Async version of `stream_self_verifying_agent`, built on the graph's `astream`."""
+    app, graph_input, config, tracer, _ = _prepare(
+        spec, max_iterations, fix_candidates, fix_mode, performance_check, tracer, run_id
+    )
+    async for event in _astream(app, graph_input, config, tracer, stream_tokens):
+        yield event
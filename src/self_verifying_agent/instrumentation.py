@@ -0,0 +1,501 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import secrets
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .prompt_context import estimate_message_tokens, estimate_tokens
+from .state import AgentState
+
+# Active tracer and span for the code running in this context (thread or task).
+_current_tracer: ContextVar[Optional["Tracer"]] = ContextVar("agent_tracer", default=None)
+_current_span: ContextVar[Optional[Dict[str, Any]]] = ContextVar("agent_span", default=None)
+# Where `collect_llm_usage` gathers the `llm` spans finished in this context.
+_llm_calls: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("agent_llm_calls", default=None)
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_HELP: Dict[str, str] = {
+    "agent_runs_total": "Agent runs finished, by final status.",
+    "agent_run_duration_seconds": "Wall time of whole agent runs.",
+    "agent_node_duration_seconds": "Wall time of graph node executions.",
+    "agent_node_errors_total": "Graph node executions that raised.",
+    "agent_llm_requests_total": "LLM calls, by provider, model and cache status.",
+    "agent_llm_request_duration_seconds": "Wall time of LLM calls.",
+    "agent_llm_tokens_total": "LLM tokens used, by direction (prompt or completion).",
+    "agent_llm_queue_seconds": "Time LLM requests waited for the rate limiter, by provider and model.",
+    "agent_llm_retries_total": "LLM requests retried after a transient failure, by reason.",
+    "agent_pytest_runs_total": "Pytest runs, by exit code.",
+    "agent_pytest_duration_seconds": "Wall time of pytest runs.",
+    "agent_pytest_cpu_seconds_total": "CPU time spent inside pytest sessions.",
+    "agent_pytest_tests_total": "Test records produced by pytest runs.",
+    "agent_service_jobs_submitted_total": "Jobs accepted by the HTTP job service.",
+    "agent_service_rejected_total": "Job submissions rejected with 429 because the queue was full.",
+    "agent_service_jobs_total": "Jobs finished by the HTTP job service, by final status.",
+    "agent_service_queue_wait_seconds": "Time jobs waited for a service worker.",
+    "agent_service_job_duration_seconds": "Wall time of service jobs from start to finish.",
+}
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> _LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: _LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metrics:
+    """Thread-safe counters and histograms aggregated across every run in the process."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[_LabelKey, float]] = {}
+        # Per label set: cumulative count per bucket, then sum and count.
+        self._histograms: Dict[str, Dict[_LabelKey, List[float]]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Plain-dict copy: counter values and histogram sum/count per label set."""
+
+        with self._lock:
+            counters = {
+                name: {_format_labels(key): value for key, value in series.items()}
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: {_format_labels(key): {"sum": values[-2], "count": values[-1]} for key, values in series.items()}
+                for name, series in self._histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def render_prometheus(self) -> str:
+        """Everything recorded so far in the Prometheus text exposition format."""
+
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, values in sorted(self._histograms[name].items()):
+                    for index, bound in enumerate(self.buckets):
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', f'{bound:g}'),))} {values[index]:g}")
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {values[-1]:g}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {values[-2]:g}")
+                    lines.append(f"{name}_count{_format_labels(key)} {values[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Process-wide metrics that every span feeds when it ends."""
+
+    return _metrics
+
+
+def _record_metrics(record: Dict[str, Any]) -> None:
+    attributes = record["attributes"]
+    duration = record["duration_s"]
+    kind = record["kind"]
+
+    if kind == "run":
+        _metrics.inc("agent_runs_total", status=attributes.get("result", record["status"]))
+        _metrics.observe("agent_run_duration_seconds", duration)
+    elif kind == "node":
+        _metrics.observe("agent_node_duration_seconds", duration, node=record["name"])
+        if record["status"] == "error":
+            _metrics.inc("agent_node_errors_total", node=record["name"])
+    elif kind == "llm":
+        labels = {"provider": attributes.get("provider"), "model": attributes.get("model")}
+        _metrics.inc("agent_llm_requests_total", cache=attributes.get("cache"), **labels)
+        _metrics.observe("agent_llm_request_duration_seconds", duration, **labels)
+        _metrics.inc("agent_llm_tokens_total", attributes.get("prompt_tokens", 0), direction="prompt", **labels)
+        _metrics.inc("agent_llm_tokens_total", attributes.get("completion_tokens", 0), direction="completion", **labels)
+    elif kind == "pytest":
+        _metrics.inc("agent_pytest_runs_total", exit_code=attributes.get("exit_code"))
+        _metrics.observe("agent_pytest_duration_seconds", duration)
+        _metrics.inc("agent_pytest_cpu_seconds_total", attributes.get("cpu_time") or 0.0)
+        _metrics.inc("agent_pytest_tests_total", attributes.get("tests", 0))
+
+
+class Tracer:
+    """Collects the spans of one agent run.
+
+    Spans are plain dicts: `trace_id`, `span_id`, `parent_id`, `name`, `kind` (run,
+    node, llm, pytest), `start_time` (epoch seconds), `duration_s`, `status` ("ok",
+    "error" or "cancelled") and free-form `attributes`. They are appended when they
+    end, so children come before their parents.
+    """
+
+    def __init__(self, trace_id: Optional[str] = None) -> None:
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.spans: List[Dict[str, Any]] = []
+        self.root: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(record)
+
+    def start_run(self, **attributes: Any) -> Dict[str, Any]:
+        """Open the root span every node span hangs off."""
+
+        self.root = _start("agent_run", "run", attributes, tracer=self, parent=None)
+        return self.root
+
+    def finish_run(self, error: Optional[BaseException] = None, **attributes: Any) -> None:
+        """Close the root span, as failed or cancelled when `error` is given."""
+
+        if self.root is not None and "duration_s" not in self.root:
+            self.root["attributes"].update(attributes)
+            _finish(self.root, status=_status(error) if error is not None else "ok", error=error)
+
+    def to_jsonl(self) -> str:
+        with self._lock:
+            return spans_to_jsonl(self.spans)
+
+    def to_otel(self, service_name: str = "self-verifying-agent") -> Dict[str, Any]:
+        with self._lock:
+            return spans_to_otel(self.spans, service_name)
+
+
+def spans_to_jsonl(spans: List[Dict[str, Any]]) -> str:
+    """One JSON span per line."""
+
+    return "".join(json.dumps(record, default=str) + "\n" for record in spans)
+
+
+def spans_to_otel(spans: List[Dict[str, Any]], service_name: str = "self-verifying-agent") -> Dict[str, Any]:
+    """Spans as an OTLP/JSON `resourceSpans` document, ready for an OpenTelemetry collector."""
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_otel_attribute("service.name", service_name)]},
+                "scopeSpans": [{"scope": {"name": "self_verifying_agent"}, "spans": [_otel_span(r) for r in spans]}],
+            }
+        ]
+    }
+
+
+def _otel_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": value if isinstance(value, str) else json.dumps(value, default=str)}}
+
+
+def _otel_span(record: Dict[str, Any]) -> Dict[str, Any]:
+    start_ns = int(record["start_time"] * 1e9)
+    return {
+        "traceId": record["trace_id"],
+        "spanId": record["span_id"],
+        "parentSpanId": record["parent_id"] or "",
+        "name": record["name"],
+        # SPAN_KIND_CLIENT for calls out to the LLM provider, INTERNAL otherwise.
+        "kind": 3 if record["kind"] == "llm" else 1,
+        "startTimeUnixNano": str(start_ns),
+        "endTimeUnixNano": str(start_ns + int(record["duration_s"] * 1e9)),
+        "attributes": [_otel_attribute("agent.kind", record["kind"])]
+        + [_otel_attribute(key, value) for key, value in record["attributes"].items() if value is not None],
+        "status": {"code": 2, "message": record.get("error", "")} if record["status"] == "error" else {"code": 1},
+    }
+
+
+def _start(
+    name: str,
+    kind: str,
+    attributes: Dict[str, Any],
+    tracer: Optional[Tracer],
+    parent: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    if parent is None and tracer is not None and tracer.root is not None and kind != "run":
+        parent = tracer.root
+    return {
+        "trace_id": tracer.trace_id if tracer is not None else None,
+        "span_id": secrets.token_hex(8),
+        "parent_id": parent["span_id"] if parent is not None else None,
+        "name": name,
+        "kind": kind,
+        "start_time": time.time(),
+        "status": "ok",
+        "attributes": dict(attributes),
+        "_tracer": tracer,
+        "_started": time.perf_counter(),
+    }
+
+
+def _finish(record: Dict[str, Any], status: str = "ok", error: Optional[BaseException] = None) -> None:
+    record["duration_s"] = round(time.perf_counter() - record.pop("_started"), 6)
+    record["status"] = status
+    if error is not None:
+        record["error"] = f"{type(error).__name__}: {error}"
+    tracer: Optional[Tracer] = record.pop("_tracer")
+    if tracer is not None:
+        tracer.add(record)
+    _record_metrics(record)
+
+
+def _status(exc: BaseException) -> str:
+    return "cancelled" if isinstance(exc, (asyncio.CancelledError, GeneratorExit)) else "error"
+
+
+@contextlib.contextmanager
+def span(name: str, kind: str = "internal", **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """Time the enclosed block as a child of the current span.
+
+    Yields the span dict so callers can add `attributes` once results are known.
+    Outside a traced run the span is not stored, but its metrics are still recorded.
+    """
+
+    record = _start(name, kind, attributes, tracer=_current_tracer.get(), parent=_current_span.get())
+    token = _current_span.set(record)
+    try:
+        yield record
+    except BaseException as exc:
+        _current_span.reset(token)
+        _finish(record, status=_status(exc), error=exc)
+        raise
+    _current_span.reset(token)
+    _finish(record)
+
+
+def current_span() -> Optional[Dict[str, Any]]:
+    """The innermost open span in this context (the node span during LLM calls), if any."""
+
+    return _current_span.get()
+
+
+@contextlib.contextmanager
+def collect_llm_usage() -> Iterator[List[Dict[str, Any]]]:
+    """Yield a list that receives the `llm` span of every call finished in this block.
+
+    Threads and tasks started from the block with a copy of its context add to the
+    same list.
+    """
+
+    calls: List[Dict[str, Any]] = []
+    token = _llm_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _llm_calls.reset(token)
+
+
+@contextlib.contextmanager
+def use_tracer(tracer: Optional[Tracer]) -> Iterator[None]:
+    """Make `tracer` collect the spans opened in this context."""
+
+    token = _current_tracer.set(tracer)
+    try:
+        yield
+    finally:
+        _current_tracer.reset(token)
+
+
+def _tracer_from(config: Optional[Dict[str, Any]]) -> Optional[Tracer]:
+    return ((config or {}).get("configurable") or {}).get("tracer")
+
+
+def traced_node(name: str, func: Callable[[AgentState], Any], afunc: Callable[[AgentState], Any]) -> Any:
+    """Graph node that runs `func` (or `afunc` under `astream`) inside a node span.
+
+    The run's tracer comes from `config["configurable"]["tracer"]`. Spans stay on the
+    tracer rather than in the state, so checkpoints and streamed updates do not
+    grow with the length of the run.
+    """
+
+    from langchain_core.runnables import RunnableLambda
+
+    def run(state: AgentState, config: Dict[str, Any]) -> Any:
+        tracer = _tracer_from(config)
+        with use_tracer(tracer), span(name, "node", iteration=state.iteration):
+            result = func(state)
+        return result
+
+    async def arun(state: AgentState, config: Dict[str, Any]) -> Any:
+        tracer = _tracer_from(config)
+        with use_tracer(tracer), span(name, "node", iteration=state.iteration):
+            result = await afunc(state)
+        return result
+
+    return RunnableLambda(run, afunc=arun, name=name)
+
+
+def _usage(message: Any) -> Optional[Tuple[int, int]]:
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+
+
+class InstrumentedChatModel:
+    """Wraps a chat model so each `invoke`/`stream` (and async form) becomes an `llm` span.
+
+    Spans carry provider, model, temperature, cache status ("hit", "miss" or "off"),
+    prompt/completion tokens from the provider's usage metadata (estimated from text
+    length, with `tokens_estimated`, when it reports none; zero for cache hits) and,
+    for streams, the time to the first chunk.
+    """
+
+    def __init__(self, llm: Any, provider: str, model_name: str, temperature: float, cached: bool) -> None:
+        self.llm = llm
+        self.provider = provider
+        self.model_name = model_name
+        self.temperature = temperature
+        self.cached = cached
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def _open(self, method: str) -> Dict[str, Any]:
+        return _start(
+            "llm",
+            "llm",
+            {
+                "provider": self.provider,
+                "model": self.model_name,
+                "temperature": self.temperature,
+                "method": method,
+                "node": (_current_span.get() or {}).get("name"),
+            },
+            tracer=_current_tracer.get(),
+            parent=_current_span.get(),
+        )
+
+    def _close(self, record: Dict[str, Any], messages: List[Any], text: str, hit: bool, usage: Optional[Tuple[int, int]]) -> None:
+        attributes = record["attributes"]
+        attributes["cache"] = "hit" if hit else ("miss" if self.cached else "off")
+        if hit:
+            attributes.update(prompt_tokens=0, completion_tokens=0)
+        elif usage is not None:
+            attributes.update(prompt_tokens=usage[0], completion_tokens=usage[1])
+        else:
+            attributes.update(
+                prompt_tokens=estimate_message_tokens(messages),
+                completion_tokens=estimate_tokens(text),
+                tokens_estimated=True,
+            )
+        _finish(record)
+        calls = _llm_calls.get()
+        if calls is not None:
+            calls.append(record)
+
+    @staticmethod
+    def _is_hit(message: Any) -> bool:
+        return (getattr(message, "response_metadata", None) or {}).get("cache") == "hit"
+
+    @staticmethod
+    def _add_usage(total: Optional[Tuple[int, int]], chunk: Any) -> Optional[Tuple[int, int]]:
+        usage = _usage(chunk)
+        if usage is None:
+            return total
+        return usage if total is None else (total[0] + usage[0], total[1] + usage[1])
+
+    def invoke(self, messages: List[Any], *args: Any, **kwargs: Any) -> Any:
+        record = self._open("invoke")
+        try:
+            resp = self.llm.invoke(messages, *args, **kwargs)
+        except BaseException as exc:
+            _finish(record, status=_status(exc), error=exc)
+            raise
+        self._close(record, messages, str(resp.content), self._is_hit(resp), _usage(resp))
+        return resp
+
+    async def ainvoke(self, messages: List[Any], *args: Any, **kwargs: Any) -> Any:
+        record = self._open("ainvoke")
+        try:
+            resp = await self.llm.ainvoke(messages, *args, **kwargs)
+        except BaseException as exc:
+            _finish(record, status=_status(exc), error=exc)
+            raise
+        self._close(record, messages, str(resp.content), self._is_hit(resp), _usage(resp))
+        return resp
+
+    def stream(self, messages: List[Any], *args: Any, **kwargs: Any) -> Iterator[Any]:
+        record = self._open("stream")
+        parts: List[str] = []
+        usage: Optional[Tuple[int, int]] = None
+        hit = False
+        try:
+            for chunk in self.llm.stream(messages, *args, **kwargs):
+                if not parts:
+                    record["attributes"]["first_chunk_s"] = round(time.perf_counter() - record["_started"], 6)
+                parts.append(str(chunk.content))
+                usage = self._add_usage(usage, chunk)
+                hit = hit or self._is_hit(chunk)
+                yield chunk
+        except BaseException as exc:
+            _finish(record, status=_status(exc), error=exc)
+            raise
+        self._close(record, messages, "".join(parts), hit, usage)
+
+    async def astream(self, messages: List[Any], *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        record = self._open("astream")
+        parts: List[str] = []
+        usage: Optional[Tuple[int, int]] = None
+        hit = False
+        try:
+            async for chunk in self.llm.astream(messages, *args, **kwargs):
+                if not parts:
+                    record["attributes"]["first_chunk_s"] = round(time.perf_counter() - record["_started"], 6)
+                parts.append(str(chunk.content))
+                usage = self._add_usage(usage, chunk)
+                hit = hit or self._is_hit(chunk)
+                yield chunk
+        except BaseException as exc:
+            _finish(record, status=_status(exc), error=exc)
+            raise
+        self._close(record, messages, "".join(parts), hit, usage)
+
+
+def instrument_llm(llm: Any, provider: str, model_name: str, temperature: float) -> InstrumentedChatModel:
+    from .llm_cache import CachedChatModel
+
+    return InstrumentedChatModel(llm, provider, model_name, temperature, cached=isinstance(llm, CachedChatModel))
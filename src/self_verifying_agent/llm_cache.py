@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+CACHE_MODES = ("off", "read", "readwrite")
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "self_verifying_agent" / "llm_cache.sqlite3"
+
+
+def _normalize_message(message: Any) -> Dict[str, Any]:
+    if isinstance(message, dict):
+        return {"role": message.get("role"), "content": message.get("content")}
+    return {"role": getattr(message, "type", type(message).__name__), "content": getattr(message, "content", str(message))}
+
+
+def make_key(provider: str, model_name: str, temperature: float, messages: List[Any]) -> str:
+    """Content address for one LLM call: provider, model, temperature and the exact messages."""
+
+    payload = json.dumps(
+        {
+            "provider": provider,
+            "model": model_name,
+            "temperature": float(temperature),
+            "messages": [_normalize_message(m) for m in messages],
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Two-level response cache: a bounded in-memory LRU in front of a SQLite file.
+
+    `mode` is one of "off", "read" (serve hits, never write) or "readwrite". Disk
+    entries older than `ttl_seconds` are ignored and purged, and the least recently
+    used entries are evicted once the stored responses exceed `max_disk_bytes`.
+    """
+
+    def __init__(
+        self,
+        path: Path | str = DEFAULT_CACHE_PATH,
+        mode: str = "readwrite",
+        max_memory_entries: int = 256,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+    ) -> None:
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode '{mode}'. Expected one of: {', '.join(CACHE_MODES)}.")
+
+        self.path = Path(path)
+        self.mode = mode
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._memory: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._conn.commit()
+        return self._conn
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[1], now):
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["memory_hits"] += 1
+                return entry[0]
+
+            row = self._db().execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and not self._expired(row[1], now):
+                if self.mode == "readwrite":
+                    self._db().execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._db().commit()
+                self._remember(key, row[0], row[1])
+                self._stats["hits"] += 1
+                self._stats["disk_hits"] += 1
+                return row[0]
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        if self.mode != "readwrite":
+            return
+
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._stats["writes"] += 1
+            self._evict(db, now)
+            db.commit()
+
+    def _remember(self, key: str, value: str, created: float) -> None:
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        if self.ttl_seconds is not None:
+            cur = db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+            self._stats["evictions"] += max(cur.rowcount, 0)
+
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            total -= size
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CachedChatModel:
+    """Wraps a chat model so `invoke`/`stream` and their async forms consult an `LLMCache` first.
+
+    Everything else is delegated to the wrapped model. Cached replies come back as an
+    `AIMessage` (a single chunk when streaming) whose `response_metadata["cache"]` is
+    "hit".
+    """
+
+    def __init__(self, llm: Any, cache: LLMCache, provider: str, model_name: str, temperature: float) -> None:
+        self.llm = llm
+        self.cache = cache
+        self.provider = provider
+        self.model_name = model_name
+        self.temperature = temperature
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def _key(self, messages: List[Any]) -> str:
+        return make_key(self.provider, self.model_name, self.temperature, messages)
+
+    @staticmethod
+    def _hit(value: str) -> Any:
+        from langchain_core.messages import AIMessage
+
+        return AIMessage(content=value, response_metadata={"cache": "hit"})
+
+    @staticmethod
+    def _hit_chunk(value: str) -> Any:
+        from langchain_core.messages import AIMessageChunk
+
+        return AIMessageChunk(content=value, response_metadata={"cache": "hit"})
+
+    def invoke(self, messages: List[Any], *args: Any, **kwargs: Any) -> Any:
+        key = self._key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._hit(cached)
+        resp = self.llm.invoke(messages, *args, **kwargs)
+        if isinstance(resp.content, str):
+            self.cache.put(key, resp.content)
+        return resp
+
+    def stream(self, messages: List[Any], *args: Any, **kwargs: Any) -> Iterator[Any]:
+        key = self._key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield self._hit_chunk(cached)
+            return
+        parts: List[str] = []
+        for chunk in self.llm.stream(messages, *args, **kwargs):
+            if isinstance(chunk.content, str):
+                parts.append(chunk.content)
+            yield chunk
+        self.cache.put(key, "".join(parts))
+
+    async def ainvoke(self, messages: List[Any], *args: Any, **kwargs: Any) -> Any:
+        key = self._key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._hit(cached)
+        resp = await self.llm.ainvoke(messages, *args, **kwargs)
+        if isinstance(resp.content, str):
+            self.cache.put(key, resp.content)
+        return resp
+
+    async def astream(self, messages: List[Any], *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        key = self._key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield self._hit_chunk(cached)
+            return
+        parts: List[str] = []
+        async for chunk in self.llm.astream(messages, *args, **kwargs):
+            if isinstance(chunk.content, str):
+                parts.append(chunk.content)
+            yield chunk
+        self.cache.put(key, "".join(parts))
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def configure_llm_cache(mode: str = "readwrite", path: Path | str | None = None, **options: Any) -> LLMCache:
+    """Install the process-wide LLM response cache used by `get_llm`."""
+
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = LLMCache(path or os.getenv("LLM_CACHE_PATH") or DEFAULT_CACHE_PATH, mode=mode, **options)
+        return _cache
+
+
+def get_llm_cache() -> LLMCache:
+    """Return the process-wide cache, configured from `LLM_CACHE` on first use (default: off)."""
+
+    if _cache is None:
+        configure_llm_cache(os.getenv("LLM_CACHE", "off"))
+    assert _cache is not None
+    return _cache
+
+
+def wrap_llm(llm: Any, provider: str, model_name: str, temperature: float) -> Any:
+    """Return `llm` wrapped by the active cache, or unchanged when caching is off."""
+
+    cache = get_llm_cache()
+    if not cache.enabled:
+        return llm
+    return CachedChatModel(llm, cache, provider, model_name, temperature)
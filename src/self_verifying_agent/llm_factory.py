@@ -1,22 +1,235 @@
 from __future__ import annotations
 
+import asyncio
 import os
-from langchain_groq import ChatGroq
-from dotenv import load_dotenv
+import threading
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from weakref import WeakKeyDictionary
 
-load_dotenv()
+from .instrumentation import instrument_llm
+from .llm_cache import wrap_llm
+from .llm_scheduler import schedule_llm
 
-def get_llm(model_name: str = "llama-3.1-8b-instant", temperature: float = 0.2) -> ChatGroq:
-    """Returns a ChatGroq LLM instance.
-    
-    Defaults to llama-3.1-8b-instant if not specified.
+# A provider factory builds a chat model for a (model, temperature) pair.
+ProviderFactory = Callable[[str, float], Any]
+
+DEFAULT_PROVIDER = "groq"
+
+DEFAULT_MODELS: Dict[str, str] = {
+    "groq": "llama-3.1-8b-instant",
+    "openai": "gpt-4o-mini",
+    "gemini": "gemini-1.5-flash",
+    "stub": "stub",
+}
+
+_PROVIDERS: Dict[str, ProviderFactory] = {}
+_CLIENTS: Dict[Tuple[str, str, float], Any] = {}
+_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def load_env() -> None:
+    """Load `.env` into the environment once per process.
+
+    Called on the first variable read and at the start of every run rather than at
+    import, so importing the package stays cheap.
     """
-    api_key = os.getenv("GROQ_API_KEY")
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+@lru_cache(maxsize=None)
+def _env(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Read an environment variable once per process."""
+
+    load_env()
+    return os.getenv(name, default)
+
+
+def _require_key(name: str) -> str:
+    api_key = _env(name)
     if not api_key:
-        raise ValueError("GROQ_API_KEY not found in environment variables.")
-        
+        raise ValueError(f"{name} not found in environment variables.")
+    return api_key
+
+
+def _http_clients() -> Tuple[Any, Any]:
+    """Build keep-alive connection pools for one client.
+
+    The sync pool is thread-safe. The async pool binds to the event loop that first
+    uses it, which is why `LoopLocalChatModel` builds one client per loop.
+    """
+
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=int(_env("LLM_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(_env("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(_env("LLM_KEEPALIVE_EXPIRY", "30")),
+    )
+    return httpx.Client(limits=limits), httpx.AsyncClient(limits=limits)
+
+
+def _groq(model_name: str, temperature: float) -> Any:
+    from langchain_groq import ChatGroq
+
+    http_client, http_async_client = _http_clients()
     return ChatGroq(
         model_name=model_name,
         temperature=temperature,
-        groq_api_key=api_key
+        groq_api_key=_require_key("GROQ_API_KEY"),
+        # `llm_scheduler` retries, within the shared rate limits; SDK retries would bypass them.
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
     )
+
+
+def _openai(model_name: str, temperature: float) -> Any:
+    try:
+        from langchain_openai import ChatOpenAI
+    except ImportError as exc:  # pragma: no cover - optional provider
+        raise ImportError("The 'openai' provider requires `pip install langchain-openai`.") from exc
+
+    http_client, http_async_client = _http_clients()
+    return ChatOpenAI(
+        model_name=model_name,
+        temperature=temperature,
+        openai_api_key=_require_key("OPENAI_API_KEY"),
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+
+def _gemini(model_name: str, temperature: float) -> Any:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=model_name,
+        temperature=temperature,
+        google_api_key=_require_key("GOOGLE_API_KEY"),
+        max_retries=0,
+    )
+
+
+def _stub(model_name: str, temperature: float) -> Any:
+    from .stub_llm import StubChatModel
+
+    return StubChatModel(
+        model_name=model_name,
+        temperature=temperature,
+        latency=float(_env("STUB_LLM_LATENCY", "0")),
+    )
+
+
+class LoopLocalChatModel:
+    """Chat model whose async calls use a client built for the running event loop.
+
+    Sync calls share one client. Async connection pools cannot outlive their loop, so
+    each loop (one per `asyncio.run`, or one per thread) gets its own client, dropped
+    along with the loop.
+    """
+
+    def __init__(self, factory: ProviderFactory, model_name: str, temperature: float) -> None:
+        self.llm = factory(model_name, temperature)
+        self._factory = factory
+        self._model_name = model_name
+        self._temperature = temperature
+        self._loops: "WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def _loop_llm(self) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            llm = self._loops.get(loop)
+            if llm is None:
+                llm = self._loops[loop] = self._factory(self._model_name, self._temperature)
+        return llm
+
+    def invoke(self, messages: List[Any], *args: Any, **kwargs: Any) -> Any:
+        return self.llm.invoke(messages, *args, **kwargs)
+
+    def stream(self, messages: List[Any], *args: Any, **kwargs: Any) -> Iterator[Any]:
+        return self.llm.stream(messages, *args, **kwargs)
+
+    async def ainvoke(self, messages: List[Any], *args: Any, **kwargs: Any) -> Any:
+        return await self._loop_llm().ainvoke(messages, *args, **kwargs)
+
+    async def astream(self, messages: List[Any], *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        async for chunk in self._loop_llm().astream(messages, *args, **kwargs):
+            yield chunk
+
+
+def register_provider(name: str, factory: ProviderFactory, default_model: Optional[str] = None) -> None:
+    """Register (or replace) an LLM provider under `name`."""
+
+    with _LOCK:
+        _PROVIDERS[name] = factory
+        if default_model is not None:
+            DEFAULT_MODELS[name] = default_model
+        for key in [key for key in _CLIENTS if key[0] == name]:
+            del _CLIENTS[key]
+
+
+def default_provider() -> str:
+    """Provider used when callers do not pass one; set with `LLM_PROVIDER`."""
+
+    return (_env("LLM_PROVIDER") or DEFAULT_PROVIDER).lower()
+
+
+def get_llm(
+    model_name: Optional[str] = None,
+    temperature: float = 0.2,
+    provider: Optional[str] = None,
+) -> Any:
+    """Returns a shared chat model for (provider, model, temperature).
+
+    Clients are built once per process (and once per event loop for async calls) and
+    reused by every node, so HTTP connections stay pooled between calls. Defaults to the `LLM_PROVIDER` provider (Groq unless
+    configured) and its default model, llama-3.1-8b-instant for Groq. When the
+    response cache is enabled the client is wrapped so identical calls are served
+    from `llm_cache`; calls the cache cannot answer go through the process-wide
+    rate limiter and retry policy (`llm_scheduler`). Every call is recorded as an
+    `llm` span (see `instrumentation`).
+    """
+
+    provider = (provider or default_provider()).lower()
+    model_name = model_name or DEFAULT_MODELS.get(provider, "")
+    key = (provider, model_name, float(temperature))
+
+    client = _CLIENTS.get(key)
+    if client is not None:
+        return instrument_llm(wrap_llm(schedule_llm(client, provider, model_name), *key), *key)
+
+    with _LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            factory = _PROVIDERS.get(provider)
+            if factory is None:
+                raise ValueError(
+                    f"Unknown LLM provider '{provider}'. Registered providers: {', '.join(sorted(_PROVIDERS))}."
+                )
+            client = LoopLocalChatModel(factory, model_name, float(temperature))
+            _CLIENTS[key] = client
+    return instrument_llm(wrap_llm(schedule_llm(client, provider, model_name), *key), *key)
+
+
+def clear_llm_clients() -> None:
+    """Drop every cached client and re-read the environment on next use."""
+
+    with _LOCK:
+        _CLIENTS.clear()
+    _env.cache_clear()
+
+
+register_provider("groq", _groq)
+register_provider("openai", _openai)
+register_provider("gemini", _gemini)
+register_provider("stub", _stub)
@@ -0,0 +1,466 @@
+"""Process-wide scheduler every LLM request goes through.
+
+Requests to one (provider, model) share a lane with two token buckets: requests per
+minute and tokens per minute. A request takes one request and its estimated tokens
+(prompt estimated from the messages plus an expected completion size) before it is
+sent, and the token bucket is corrected once the real usage is known. Requests
+wait in priority order, so repair iterations of runs already in flight go before
+the first calls of new runs. Transient failures (429, 5xx, timeouts, dropped
+connections) are retried with jittered exponential backoff; a 429 also pauses the
+whole lane for its `Retry-After`. Time spent waiting is reported as
+`agent_llm_queue_seconds` and on the node span as `llm_queue_s`.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .instrumentation import current_span, get_metrics
+from .prompt_context import estimate_message_tokens, estimate_tokens
+
+DEFAULT_COMPLETION_TOKENS = 512
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 30.0
+
+# Lower is served first.
+PRIORITY_REPAIR = 0
+PRIORITY_RUNNING = 1
+PRIORITY_NEW = 2
+
+_TRANSIENT_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+_TRANSIENT_NAMES = ("RateLimit", "Timeout", "APIConnectionError", "ServiceUnavailable", "InternalServerError", "Overloaded")
+
+Lane = Tuple[str, str]
+
+
+class TokenBucket:
+    """Refills `per_minute` units a minute up to a minute's worth; None means unlimited.
+
+    The level can go negative when a request used more than it reserved, which
+    delays the next requests until the debt is paid off.
+    """
+
+    def __init__(self, per_minute: Optional[float]) -> None:
+        self.capacity = per_minute
+        self.level = per_minute or 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60.0)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` (at most the capacity) is available."""
+
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) * 60.0 / self.capacity
+
+    def take(self, amount: float) -> None:
+        if self.capacity:
+            self.level -= amount
+
+    def give(self, amount: float) -> None:
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "tokens", "wake")
+
+    def __init__(self, priority: int, seq: int, tokens: int, wake: Optional[Callable[[], None]]) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.wake = wake
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _LaneState:
+    def __init__(self, rpm: Optional[float], tpm: Optional[float]) -> None:
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.waiting: List[_Ticket] = []
+        self.paused_until = 0.0
+
+
+def request_priority() -> int:
+    """Priority of an LLM call made now, from the graph node it is made in."""
+
+    span = current_span()
+    if span is None:
+        return PRIORITY_NEW
+    if span["attributes"].get("iteration", 0) > 0 or span["name"] in ("failure_analyzer", "code_fixer"):
+        return PRIORITY_REPAIR
+    if span["name"] == "spec_parser":
+        return PRIORITY_NEW
+    return PRIORITY_RUNNING
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether retrying the request may succeed: rate limits, overload, timeouts, dropped connections."""
+
+    code = _status_code(exc)
+    if code is not None:
+        return code in _TRANSIENT_STATUS
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return any(name in type(exc).__name__ for name in _TRANSIENT_NAMES)
+
+
+def _used_tokens(message: Any, messages: List[Any], text: str) -> int:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return int(usage.get("input_tokens", 0)) + int(usage.get("output_tokens", 0))
+    return estimate_message_tokens(messages) + estimate_tokens(text)
+
+
+def _record_wait(lane: Lane, seconds: float) -> None:
+    get_metrics().observe("agent_llm_queue_seconds", seconds, provider=lane[0], model=lane[1])
+    span = current_span()
+    if span is not None and seconds > 0:
+        attributes = span["attributes"]
+        attributes["llm_queue_s"] = round(attributes.get("llm_queue_s", 0.0) + seconds, 6)
+
+
+class LLMScheduler:
+    """Rate limits, orders and retries LLM requests for the whole process.
+
+    `rpm` and `tpm` (None: unlimited) apply to each (provider, model) separately.
+    `completion_tokens` is the completion size assumed before a request is sent.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        completion_tokens: int = DEFAULT_COMPLETION_TOKENS,
+    ) -> None:
+        self.rpm = rpm or None
+        self.tpm = tpm or None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.completion_tokens = completion_tokens
+
+        self._cond = threading.Condition()
+        self._lanes: Dict[Lane, _LaneState] = {}
+        self._seq = itertools.count()
+        self._stats: Dict[str, float] = {"requests": 0, "retries": 0, "failures": 0, "queued_seconds": 0.0}
+
+    def _lane(self, lane: Lane) -> _LaneState:
+        state = self._lanes.get(lane)
+        if state is None:
+            state = self._lanes[lane] = _LaneState(self.rpm, self.tpm)
+        return state
+
+    def estimate(self, messages: List[Any]) -> int:
+        """Tokens reserved for a request before it is sent."""
+
+        return estimate_message_tokens(messages) + self.completion_tokens
+
+    def _wake(self, state: _LaneState) -> None:
+        self._cond.notify_all()
+        for ticket in state.waiting:
+            if ticket.wake is not None:
+                ticket.wake()
+
+    def _try_take(self, state: _LaneState, ticket: _Ticket) -> Optional[float]:
+        """Take the ticket's budget if it is first in line and the buckets allow: 0.
+
+        Otherwise the seconds until the buckets allow it (first in line), or None.
+        """
+
+        if state.waiting[0] is not ticket:
+            return None
+        now = time.monotonic()
+        wait = max(
+            state.paused_until - now,
+            state.requests.wait_time(1, now),
+            state.tokens.wait_time(ticket.tokens, now),
+        )
+        if wait > 0:
+            return wait
+        heapq.heappop(state.waiting)
+        state.requests.take(1)
+        state.tokens.take(ticket.tokens)
+        self._wake(state)
+        return 0.0
+
+    def _leave(self, state: _LaneState, ticket: _Ticket) -> None:
+        if ticket in state.waiting:
+            state.waiting.remove(ticket)
+            heapq.heapify(state.waiting)
+            self._wake(state)
+
+    def _done_waiting(self, lane: Lane, started: float) -> None:
+        waited = time.monotonic() - started
+        with self._cond:
+            self._stats["requests"] += 1
+            self._stats["queued_seconds"] += waited
+        _record_wait(lane, waited)
+
+    def acquire(self, lane: Lane, tokens: int, priority: int = PRIORITY_NEW) -> None:
+        """Block until the lane lets a request of `tokens` estimated tokens through."""
+
+        started = time.monotonic()
+        with self._cond:
+            state = self._lane(lane)
+            ticket = _Ticket(priority, next(self._seq), tokens, None)
+            heapq.heappush(state.waiting, ticket)
+            try:
+                while True:
+                    wait = self._try_take(state, ticket)
+                    if wait == 0:
+                        break
+                    self._cond.wait(wait)
+            except BaseException:
+                self._leave(state, ticket)
+                raise
+        self._done_waiting(lane, started)
+
+    async def aacquire(self, lane: Lane, tokens: int, priority: int = PRIORITY_NEW) -> None:
+        """Async version of `acquire`; waits without blocking the event loop."""
+
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        ticket = _Ticket(priority, next(self._seq), tokens, lambda: loop.call_soon_threadsafe(wake.set))
+        with self._cond:
+            state = self._lane(lane)
+            heapq.heappush(state.waiting, ticket)
+        try:
+            while True:
+                # Cleared before checking, so a wake-up after the check is not lost.
+                wake.clear()
+                with self._cond:
+                    wait = self._try_take(state, ticket)
+                if wait == 0:
+                    break
+                try:
+                    await asyncio.wait_for(wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._cond:
+                self._leave(state, ticket)
+            raise
+        self._done_waiting(lane, started)
+
+    def settle(self, lane: Lane, reserved: int, used: int) -> None:
+        """Correct the lane's token bucket once a request's real usage is known."""
+
+        with self._cond:
+            state = self._lane(lane)
+            if used < reserved:
+                state.tokens.give(reserved - used)
+                self._wake(state)
+            else:
+                state.tokens.take(used - reserved)
+
+    def retry_delay(self, lane: Lane, exc: BaseException, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying after `exc` on try number `attempt` (from 0), or None to give up.
+
+        A 429 pauses the whole lane for that long, so other requests back off too.
+        """
+
+        if attempt >= self.max_retries or not is_transient(exc):
+            with self._cond:
+                self._stats["failures"] += 1
+            return None
+        delay = _retry_after(exc)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+        status = _status_code(exc)
+        with self._cond:
+            self._stats["retries"] += 1
+            if status == 429:
+                state = self._lane(lane)
+                state.paused_until = max(state.paused_until, time.monotonic() + delay)
+        get_metrics().inc("agent_llm_retries_total", provider=lane[0], model=lane[1], reason=status or type(exc).__name__)
+        print(f">>> LLM request failed ({type(exc).__name__}); retrying in {delay:.1f}s (attempt {attempt + 1} of {self.max_retries})...")
+        return delay
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["waiting"] = sum(len(state.waiting) for state in self._lanes.values())
+        return stats
+
+
+class ScheduledChatModel:
+    """Wraps a chat model so every `invoke`/`stream` (and async form) goes through an `LLMScheduler`.
+
+    Streams are retried only until their first chunk arrives. Each try's token
+    reservation is settled in `finally`, so cancelled calls and closed streams give
+    back what they did not use. Everything else is delegated to the wrapped model.
+    """
+
+    def __init__(self, llm: Any, scheduler: LLMScheduler, provider: str, model_name: str) -> None:
+        self.llm = llm
+        self.scheduler = scheduler
+        self.lane: Lane = (provider, model_name)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def _streamed(self, messages: List[Any], parts: List[str], last: Any, finished: bool) -> int:
+        """Tokens a stream used: the reported usage once finished, else an estimate (0 before any chunk)."""
+
+        if finished:
+            return _used_tokens(last, messages, "".join(parts))
+        return estimate_message_tokens(messages) + estimate_tokens("".join(parts)) if parts else 0
+
+    def invoke(self, messages: List[Any], *args: Any, **kwargs: Any) -> Any:
+        reserved = self.scheduler.estimate(messages)
+        priority = request_priority()
+        for attempt in itertools.count():
+            self.scheduler.acquire(self.lane, reserved, priority)
+            used = 0
+            try:
+                resp = self.llm.invoke(messages, *args, **kwargs)
+                used = _used_tokens(resp, messages, str(resp.content))
+                return resp
+            except Exception as exc:
+                delay = self.scheduler.retry_delay(self.lane, exc, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self.scheduler.settle(self.lane, reserved, used)
+            time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    async def ainvoke(self, messages: List[Any], *args: Any, **kwargs: Any) -> Any:
+        reserved = self.scheduler.estimate(messages)
+        priority = request_priority()
+        for attempt in itertools.count():
+            await self.scheduler.aacquire(self.lane, reserved, priority)
+            used = 0
+            try:
+                resp = await self.llm.ainvoke(messages, *args, **kwargs)
+                used = _used_tokens(resp, messages, str(resp.content))
+                return resp
+            except Exception as exc:
+                delay = self.scheduler.retry_delay(self.lane, exc, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self.scheduler.settle(self.lane, reserved, used)
+            await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def stream(self, messages: List[Any], *args: Any, **kwargs: Any) -> Iterator[Any]:
+        reserved = self.scheduler.estimate(messages)
+        priority = request_priority()
+        for attempt in itertools.count():
+            self.scheduler.acquire(self.lane, reserved, priority)
+            parts: List[str] = []
+            last: Any = None
+            finished = False
+            try:
+                for chunk in self.llm.stream(messages, *args, **kwargs):
+                    parts.append(str(chunk.content))
+                    last = chunk if getattr(chunk, "usage_metadata", None) else last
+                    yield chunk
+                finished = True
+                return
+            except Exception as exc:
+                delay = None if parts else self.scheduler.retry_delay(self.lane, exc, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self.scheduler.settle(self.lane, reserved, self._streamed(messages, parts, last, finished))
+            time.sleep(delay)
+
+    async def astream(self, messages: List[Any], *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        reserved = self.scheduler.estimate(messages)
+        priority = request_priority()
+        for attempt in itertools.count():
+            await self.scheduler.aacquire(self.lane, reserved, priority)
+            parts: List[str] = []
+            last: Any = None
+            finished = False
+            try:
+                async for chunk in self.llm.astream(messages, *args, **kwargs):
+                    parts.append(str(chunk.content))
+                    last = chunk if getattr(chunk, "usage_metadata", None) else last
+                    yield chunk
+                finished = True
+                return
+            except Exception as exc:
+                delay = None if parts else self.scheduler.retry_delay(self.lane, exc, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self.scheduler.settle(self.lane, reserved, self._streamed(messages, parts, last, finished))
+            await asyncio.sleep(delay)
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def configure_llm_scheduler(
+    rpm: Optional[float] = None,
+    tpm: Optional[float] = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    **options: Any,
+) -> LLMScheduler:
+    """Install the process-wide scheduler used by `get_llm`."""
+
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = LLMScheduler(rpm=rpm, tpm=tpm, max_retries=max_retries, **options)
+        return _scheduler
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Return the process-wide scheduler, configured on first use from `LLM_RPM` and
+    `LLM_TPM` (default: unlimited), `LLM_MAX_RETRIES` (default 5) and
+    `LLM_COMPLETION_TOKENS` (default 512)."""
+
+    if _scheduler is None:
+        configure_llm_scheduler(
+            rpm=float(os.getenv("LLM_RPM", "0")),
+            tpm=float(os.getenv("LLM_TPM", "0")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", str(DEFAULT_MAX_RETRIES))),
+            completion_tokens=int(os.getenv("LLM_COMPLETION_TOKENS", str(DEFAULT_COMPLETION_TOKENS))),
+        )
+    assert _scheduler is not None
+    return _scheduler
+
+
+def schedule_llm(llm: Any, provider: str, model_name: str) -> ScheduledChatModel:
+    """Return `llm` wrapped so its requests go through the process-wide scheduler."""
+
+    return ScheduledChatModel(llm, get_llm_scheduler(), provider, model_name)
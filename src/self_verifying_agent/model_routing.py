@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .instrumentation import collect_llm_usage
+from .llm_factory import DEFAULT_MODELS, default_provider, get_llm
+from .state import AgentState
+
+DEFAULT_TEMPERATURE = 0.2
+
+_ROUTE_KEYS = {"provider", "model", "temperature"}
+_CONDITION_KEYS = {"min_iteration", "repeated_error"}
+
+
+class Route:
+    """The model one node's LLM calls use: provider, model, temperature and why."""
+
+    def __init__(
+        self,
+        node: str,
+        provider: Optional[str] = None,
+        model: Optional[str] = None,
+        temperature: float = DEFAULT_TEMPERATURE,
+        reasons: Optional[List[str]] = None,
+    ) -> None:
+        self.node = node
+        self.provider = provider
+        self.model = model
+        self.temperature = temperature
+        self.reasons = reasons or []
+
+    def llm(self, temperature: Optional[float] = None) -> Any:
+        """The shared client for this route, at `temperature` if given."""
+
+        return get_llm(self.model, self.temperature if temperature is None else temperature, self.provider)
+
+
+def _check_route(where: str, route: Any, allowed: set) -> Dict[str, Any]:
+    if not isinstance(route, dict):
+        raise ValueError(f"Model routing: {where} must be an object.")
+    unknown = set(route) - allowed
+    if unknown:
+        raise ValueError(f"Model routing: unknown keys in {where}: {', '.join(sorted(unknown))}.")
+    if "temperature" in route and not isinstance(route["temperature"], (int, float)):
+        raise ValueError(f"Model routing: temperature in {where} must be a number.")
+    return route
+
+
+def repeated_error(state: AgentState, node: Optional[str] = None) -> Tuple[Optional[str], int]:
+    """The latest failure's `error_type` and how many analyses in a row reported it.
+
+    Each `fix_code` history entry records the analysis that fix acted on. Only the
+    fixer sees an analysis no fix has recorded yet; for `failure_analyzer`, which is
+    about to replace it, `state.error_analysis` is the one the last fix recorded.
+    """
+
+    analysis = state.error_analysis or {}
+    if analysis.get("status") == "success":
+        return None, 0
+    fixes = [entry for entry in reversed(state.history) if entry.get("event") == "fix_code"]
+    if node == "failure_analyzer":
+        error_type = fixes[0].get("previous_error_type") if fixes else None
+    else:
+        error_type = analysis.get("error_type")
+        fixes.insert(0, {"previous_error_type": error_type})
+    if not error_type:
+        return None, 0
+    count = 0
+    for entry in fixes:
+        if entry.get("previous_error_type") != error_type:
+            break
+        count += 1
+    return error_type, count
+
+
+class ModelRouter:
+    """Chooses the model and temperature for each node from a routing policy.
+
+    A policy is a dict (usually loaded from JSON):
+
+        {
+          "default": {"model": "llama-3.1-8b-instant", "temperature": 0.2},
+          "nodes": {
+            "spec_parser": {"temperature": 0.0},
+            "code_fixer": {
+              "escalate": [
+                {"min_iteration": 2, "model": "llama-3.3-70b-versatile"},
+                {"repeated_error": 2, "model": "llama-3.3-70b-versatile", "temperature": 0.0}
+              ]
+            }
+          },
+          "prices": {"llama-3.3-70b-versatile": {"prompt": 0.59, "completion": 0.79}}
+        }
+
+    A node's route is `default` overridden by its `nodes` entry (`provider`, `model`,
+    `temperature`), then by every `escalate` step whose conditions all hold:
+    `min_iteration` (the repair iteration has reached it) and `repeated_error` (the
+    same `error_type` was reported that many times in a row). Later steps win.
+    `prices` (USD per million prompt/completion tokens) lets decisions carry a cost.
+    """
+
+    def __init__(self, policy: Dict[str, Any]) -> None:
+        if not isinstance(policy, dict):
+            raise ValueError("Model routing policy must be a JSON object.")
+        unknown = set(policy) - {"default", "nodes", "prices"}
+        if unknown:
+            raise ValueError(f"Model routing: unknown top-level keys: {', '.join(sorted(unknown))}.")
+        self.default = _check_route("default", policy.get("default", {}), _ROUTE_KEYS)
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        for node, route in (policy.get("nodes") or {}).items():
+            route = _check_route(f"nodes.{node}", route, _ROUTE_KEYS | {"escalate"})
+            for index, step in enumerate(route.get("escalate", [])):
+                step = _check_route(f"nodes.{node}.escalate[{index}]", step, _ROUTE_KEYS | _CONDITION_KEYS)
+                if not _CONDITION_KEYS & set(step):
+                    raise ValueError(
+                        f"Model routing: nodes.{node}.escalate[{index}] needs min_iteration or repeated_error."
+                    )
+            self.nodes[node] = route
+        self.prices: Dict[str, Dict[str, float]] = policy.get("prices") or {}
+
+    @classmethod
+    def from_file(cls, path: Path | str) -> "ModelRouter":
+        with open(path, encoding="utf-8") as fh:
+            return cls(json.load(fh))
+
+    def route(self, node: str, state: AgentState) -> Route:
+        """The route for `node`'s next LLM calls, given how the run has gone so far."""
+
+        settings = dict(self.default)
+        node_policy = self.nodes.get(node, {})
+        settings.update({k: v for k, v in node_policy.items() if k in _ROUTE_KEYS})
+        reasons: List[str] = []
+
+        error_type, repeats = repeated_error(state, node)
+        for step in node_policy.get("escalate", []):
+            conditions: List[str] = []
+            if "min_iteration" in step:
+                if state.iteration < step["min_iteration"]:
+                    continue
+                conditions.append(f"iteration {state.iteration} >= {step['min_iteration']}")
+            if "repeated_error" in step:
+                if repeats < step["repeated_error"]:
+                    continue
+                conditions.append(f"{error_type} reported {repeats} times in a row")
+            settings.update({k: v for k, v in step.items() if k in _ROUTE_KEYS})
+            reasons.append(" and ".join(conditions))
+
+        provider = (settings.get("provider") or default_provider()).lower()
+        return Route(
+            node,
+            provider=provider,
+            model=settings.get("model") or DEFAULT_MODELS.get(provider, ""),
+            temperature=float(settings.get("temperature", DEFAULT_TEMPERATURE)),
+            reasons=reasons,
+        )
+
+    def cost(self, model: Optional[str], prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+        """USD cost of the tokens on `model`, or None without a price for it."""
+
+        price = self.prices.get(model or "")
+        if not price:
+            return None
+        return (prompt_tokens * price.get("prompt", 0.0) + completion_tokens * price.get("completion", 0.0)) / 1e6
+
+
+_router: Optional[ModelRouter] = None
+_router_configured = False
+_router_lock = threading.Lock()
+
+
+def configure_model_routing(policy: Dict[str, Any] | Path | str | None) -> Optional[ModelRouter]:
+    """Install the process-wide routing policy (a dict or a JSON file); None turns routing off."""
+
+    global _router, _router_configured
+    with _router_lock:
+        if policy is None:
+            _router = None
+        elif isinstance(policy, dict):
+            _router = ModelRouter(policy)
+        else:
+            _router = ModelRouter.from_file(policy)
+        _router_configured = True
+        return _router
+
+
+def get_model_router() -> Optional[ModelRouter]:
+    """Return the process-wide router, or None when every node uses the default model.
+
+    Unless `configure_model_routing` was called, the policy is read on first use from
+    the JSON file named by `AGENT_MODEL_ROUTES` (unset: routing off).
+    """
+
+    if not _router_configured:
+        configure_model_routing(os.getenv("AGENT_MODEL_ROUTES") or None)
+    return _router
+
+
+@contextlib.contextmanager
+def routed(state: AgentState, node: str) -> Iterator[Route]:
+    """Route `node`'s LLM calls made in this block and record the decision.
+
+    Without a routing policy this yields the default route, the same client every
+    node used before, and records nothing. With one, an entry in `state.model_routes`
+    gets the route, why it escalated, and the latency, tokens and cost of the calls
+    made through it. Nodes that return partial updates return `model_routes` too;
+    the channel's reducer merges them.
+    """
+
+    router = get_model_router()
+    if router is None:
+        yield Route(node)
+        return
+
+    route = router.route(node, state)
+    if route.reasons:
+        print(f">>> Agent is escalating {node} to {route.model} at temperature {route.temperature}...")
+    with collect_llm_usage() as calls:
+        yield route
+
+    prompt_tokens = sum(call["attributes"].get("prompt_tokens", 0) for call in calls)
+    completion_tokens = sum(call["attributes"].get("completion_tokens", 0) for call in calls)
+    entry: Dict[str, Any] = {
+        "iteration": state.iteration,
+        "node": node,
+        "provider": route.provider,
+        "model": route.model,
+        "temperature": route.temperature,
+        "escalated": route.reasons,
+        "llm_calls": len(calls),
+        "llm_seconds": round(sum(call["duration_s"] for call in calls), 6),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+    }
+    cost = router.cost(route.model, prompt_tokens, completion_tokens)
+    if cost is not None:
+        entry["cost_usd"] = round(cost, 6)
+    state.model_routes.append(entry)
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import difflib
+import re
+from typing import List, Optional, Tuple
+
+SEARCH_MARK = "<<<<<<< SEARCH"
+DIVIDER = "======="
+REPLACE_MARK = ">>>>>>> REPLACE"
+
+# Lowest similarity at which a SEARCH block that matches nowhere exactly is still applied.
+FUZZY_THRESHOLD = 0.85
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@")
+
+# One edit: the lines to find, the lines to put in their place, and a 0-based line hint.
+Edit = Tuple[List[str], List[str], Optional[int]]
+
+
+class PatchError(ValueError):
+    """Raised when a model reply holds no edits or an edit cannot be located in the code."""
+
+
+def _parse_search_replace(lines: List[str]) -> List[Edit]:
+    edits: List[Edit] = []
+    i = 0
+    while i < len(lines):
+        if lines[i].strip() != SEARCH_MARK:
+            i += 1
+            continue
+        search: List[str] = []
+        replace: List[str] = []
+        i += 1
+        while i < len(lines) and lines[i].strip() != DIVIDER:
+            search.append(lines[i])
+            i += 1
+        i += 1
+        while i < len(lines) and lines[i].strip() != REPLACE_MARK:
+            replace.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            raise PatchError("unterminated SEARCH/REPLACE block")
+        edits.append((search, replace, None))
+        i += 1
+    return edits
+
+
+def _parse_unified(lines: List[str]) -> List[Edit]:
+    edits: List[Edit] = []
+    hunk: Optional[Edit] = None
+    for index, line in enumerate(lines):
+        header = _HUNK_HEADER.match(line)
+        if header:
+            # An empty old range ("-5,0") names the line the hunk goes after.
+            start = int(header.group(1)) if header.group(2) == "0" else int(header.group(1)) - 1
+            hunk = ([], [], max(start, 0))
+            edits.append(hunk)
+            continue
+        if line.startswith("--- ") and index + 1 < len(lines) and lines[index + 1].startswith("+++ "):
+            hunk = None
+            continue
+        if hunk is None or line.startswith("\\"):
+            continue
+        search, replace, _ = hunk
+        if line.startswith("-"):
+            search.append(line[1:])
+        elif line.startswith("+"):
+            replace.append(line[1:])
+        elif line.startswith(" ") or not line:
+            # Models often drop the leading space of blank context lines.
+            search.append(line[1:])
+            replace.append(line[1:])
+        else:
+            hunk = None
+    # Trailing blank context lines are usually padding, not part of the file.
+    for search, replace, _ in edits:
+        while search and replace and not search[-1].strip() and not replace[-1].strip():
+            search.pop()
+            replace.pop()
+    return edits
+
+
+def parse_edits(text: str) -> List[Edit]:
+    """Edits in a model reply: SEARCH/REPLACE blocks or unified diff hunks, code fences ignored."""
+
+    lines = [line for line in text.splitlines() if not line.lstrip().startswith("```")]
+    if any(line.strip() == SEARCH_MARK for line in lines):
+        edits = _parse_search_replace(lines)
+    elif any(_HUNK_HEADER.match(line) for line in lines):
+        edits = _parse_unified(lines)
+    else:
+        edits = []
+    if not edits:
+        raise PatchError("reply contains no edits")
+    return edits
+
+
+def _lead(lines: List[str]) -> str:
+    for line in lines:
+        if line.strip():
+            return line[: len(line) - len(line.lstrip())]
+    return ""
+
+
+def _reindent(replace: List[str], found: List[str], search: List[str]) -> List[str]:
+    """Shift `replace` by the indentation difference between the located lines and the SEARCH block."""
+
+    actual, expected = _lead(found), _lead(search)
+    if actual == expected:
+        return replace
+    if actual.startswith(expected):
+        extra = actual[len(expected) :]
+        return [extra + line if line.strip() else line for line in replace]
+    if expected.startswith(actual):
+        excess = expected[len(actual) :]
+        return [line[len(excess) :] if line.startswith(excess) else line for line in replace]
+    return replace
+
+
+def _nearest(matches: List[int], hint: Optional[int], what: str) -> int:
+    if len(matches) == 1:
+        return matches[0]
+    if hint is None:
+        raise PatchError(f"{what} matches {len(matches)} places; add more context")
+    return min(matches, key=lambda start: abs(start - hint))
+
+
+def _locate(lines: List[str], search: List[str], hint: Optional[int]) -> int:
+    """Start line of `search` in `lines`: exact, then ignoring whitespace, then by similarity."""
+
+    n = len(search)
+    windows = range(len(lines) - n + 1)
+    preview = next((line.strip() for line in search if line.strip()), "")[:60]
+    what = f"edit at '{preview}'"
+
+    for normalize in (lambda s: s, str.rstrip, str.strip):
+        wanted = [normalize(line) for line in search]
+        matches = [i for i in windows if [normalize(line) for line in lines[i : i + n]] == wanted]
+        if matches:
+            return _nearest(matches, hint, what)
+
+    wanted_text = "\n".join(line.strip() for line in search)
+    best, best_ratio = [], FUZZY_THRESHOLD
+    for i in windows:
+        matcher = difflib.SequenceMatcher(None, "\n".join(line.strip() for line in lines[i : i + n]), wanted_text)
+        if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+            continue
+        ratio = matcher.ratio()
+        if ratio > best_ratio:
+            best, best_ratio = [i], ratio
+        elif ratio == best_ratio:
+            best.append(i)
+    if not best:
+        raise PatchError(f"{what} not found in the code")
+    return _nearest(best, hint, what)
+
+
+def apply_patch(source: str, text: str) -> str:
+    """Apply the edits in `text` to `source` and return the new code.
+
+    Each edit is located by content: an exact match first, then one that ignores
+    whitespace and indentation (the replacement is re-indented to fit), then the
+    most similar block above `FUZZY_THRESHOLD`. Unified diff line numbers only break
+    ties between several matches. Raises `PatchError` when an edit cannot be placed.
+    """
+
+    lines = source.splitlines()
+    shift = 0
+    for search, replace, hint in parse_edits(text):
+        hint = None if hint is None else hint + shift
+        if not any(line.strip() for line in search):
+            # Pure insertion: only placeable by line number, or into empty code.
+            if lines and hint is None:
+                raise PatchError("edit has an empty SEARCH section")
+            start = hint or 0
+        else:
+            start = _locate(lines, search, hint)
+            replace = _reindent(replace, lines[start : start + len(search)], search)
+        lines[start : start + len(search)] = replace
+        shift += len(replace) - len(search)
+
+    return "\n".join(lines) + ("\n" if source.endswith("\n") else "")
+
+
+def unified_diff(old: str, new: str, context: int = 2) -> str:
+    """Unified diff from `old` to `new`, as recorded in history for applied patches."""
+
+    diff = difflib.unified_diff(
+        old.splitlines(), new.splitlines(), fromfile="a/impl.py", tofile="b/impl.py", n=context, lineterm=""
+    )
+    return "\n".join(diff)
@@ -0,0 +1,89 @@
+"""Time the generated function on growing inputs, in a fresh interpreter.
+
+Run by `performance.measure` as `python -m self_verifying_agent.perf_probe WORKDIR CONFIG`,
+where WORKDIR holds `impl.py` and `perf_inputs.py` (defining `make_input(n)`, which
+returns `(args, kwargs)`) and CONFIG is a JSON object with `function`, `sizes`,
+`max_call_seconds`, `budget`, `cpu_seconds` and `memory_mb`. Prints one JSON line per
+size, `{"n": ..., "seconds": ...}` or `{"n": ..., "error": ...}`, as soon as it is
+measured, so a killed probe still reports the sizes it finished.
+"""
+from __future__ import annotations
+
+import gc
+import importlib
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None  # type: ignore[assignment]
+
+# Calls are batched until one batch takes this long, so fast calls are timed accurately.
+_MIN_BATCH_SECONDS = 0.005
+_MAX_BATCH = 1000
+_REPEATS = 3
+
+
+def _apply_rlimits(config: Dict[str, Any]) -> None:
+    if resource is None:
+        return
+    limits = [(resource.RLIMIT_CPU, config.get("cpu_seconds")), (resource.RLIMIT_AS, config.get("memory_mb"))]
+    for kind, value in limits:
+        if not value:
+            continue
+        if kind == resource.RLIMIT_AS:
+            value *= 1024 * 1024
+        _, hard = resource.getrlimit(kind)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(kind, (int(value), hard))
+
+
+def _seconds_per_call(func: Callable[..., Any], make_input: Callable[[int], Any], n: int) -> float:
+    """Best of a few batches; inputs are built outside the timed region, fresh for every call."""
+
+    best = float("inf")
+    number = 1
+    for _ in range(_REPEATS):
+        while True:
+            inputs: List[Any] = [make_input(n) for _ in range(number)]
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                for args, kwargs in inputs:
+                    func(*args, **kwargs)
+                elapsed = time.perf_counter() - start
+            finally:
+                gc.enable()
+            if elapsed >= _MIN_BATCH_SECONDS or number >= _MAX_BATCH:
+                break
+            number *= 10
+        best = min(best, elapsed / number)
+    return best
+
+
+def main(argv: List[str]) -> int:
+    workdir, config = argv[1], json.loads(argv[2])
+    _apply_rlimits(config)
+    sys.path.insert(0, workdir)
+    func = getattr(importlib.import_module("impl"), config["function"])
+    make_input = importlib.import_module("perf_inputs").make_input
+
+    deadline = time.perf_counter() + config["budget"]
+    for n in config["sizes"]:
+        try:
+            seconds = _seconds_per_call(func, make_input, n)
+        except Exception as exc:  # the generated code or generator broke on this size
+            print(json.dumps({"n": n, "error": f"{type(exc).__name__}: {exc}"}), flush=True)
+            return 1
+        print(json.dumps({"n": n, "seconds": seconds}), flush=True)
+        if seconds > config["max_call_seconds"] or time.perf_counter() > deadline:
+            break
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main(sys.argv))
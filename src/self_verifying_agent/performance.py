@@ -0,0 +1,327 @@
+"""Empirical complexity check of generated code against the spec's Big-O target.
+
+`check_performance` runs after the tests pass. It times the function on inputs of
+doubling size in a separate interpreter (`perf_probe`) and fits the slope of
+log(time) against log(n). When the growth is clearly worse than the target, the
+report is attached to `test_results` and `performance_analysis` turns it into a
+`performance_issue` for the fixer.
+"""
+from __future__ import annotations
+
+import ast
+import asyncio
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .instrumentation import span
+from .model_routing import routed
+from .sandbox import get_run_limits, kill_process_group
+from .state import AgentState
+from .utils import content_text, strip_markdown
+
+DEFAULT_BUDGET_SECONDS = 10.0
+SIZES = [2**k for k in range(4, 21)]
+MAX_CALL_SECONDS = 0.2
+# Slack on the fitted log-log slope before growth counts as worse than the target.
+SLOPE_TOLERANCE = 0.4
+# Extra log-log slope a log factor adds at the measured sizes (1 / ln n, about 0.1 to 0.15).
+_LOG_SLOPE = 0.15
+MIN_POINTS = 4
+
+_BIG_O = re.compile(r"O\(([^()]*(?:\([^()]*\)[^()]*)*)\)")
+
+# Growth classes reported for a measured slope.
+_CLASSES = [(0.0, "O(1)"), (0.5, "O(sqrt n)"), (1.0, "O(n)"), (1.0 + _LOG_SLOPE, "O(n log n)"), (2.0, "O(n^2)"), (3.0, "O(n^3)")]
+
+_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def parse_complexity(text: str) -> Optional[Tuple[float, bool]]:
+    """Polynomial degree and whether there is a log factor, for the first `O(...)` in `text`.
+
+    Every input is assumed to grow with n, so `O(n * m)` has degree 2 and `O(n + k log k)`
+    degree 1 with a log factor. Returns None for no Big-O or a non-polynomial one like `O(2^n)`.
+    """
+
+    match = _BIG_O.search(text or "")
+    if not match:
+        return None
+    expr = match.group(1).lower().replace("**", "^").replace(" ", "")
+    if re.search(r"\d\^[a-z]|[a-z]!|^[a-z]\^[a-z]", expr):
+        return None
+    best: Optional[Tuple[float, bool]] = None
+    for term in expr.split("+"):
+        has_log = "log" in term
+        term = re.sub(r"log\w*\(?[a-z0-9]*\)?", "", term)
+        degree = 0.5 * len(re.findall(r"sqrt\(?[a-z]\)?", term))
+        term = re.sub(r"sqrt\(?[a-z]\)?", "", term)
+        for _, power in re.findall(r"([a-z])(?:\^\(?(\d+(?:\.\d+)?(?:/\d+)?)\)?)?", term):
+            if "/" in power:
+                num, den = power.split("/")
+                degree += float(num) / float(den)
+            else:
+                degree += float(power) if power else 1.0
+        if best is None or (degree, has_log) > best:
+            best = (degree, has_log)
+    return best
+
+
+def complexity_target(state: AgentState) -> Optional[str]:
+    """The Big-O the spec asks for: `parsed_spec["complexity"]`, a constraint, or the spec text."""
+
+    parsed = state.parsed_spec or {}
+    candidates = [str(parsed.get("complexity") or "")]
+    candidates += [str(c) for c in parsed.get("constraints") or []]
+    candidates.append(state.spec)
+    for text in candidates:
+        match = _BIG_O.search(text)
+        if match and parse_complexity(match.group(0)) is not None:
+            return match.group(0)
+    return None
+
+
+def _function_name(state: AgentState) -> Optional[str]:
+    """The function under test: the parsed spec's name if the code defines it, else its only public function."""
+
+    try:
+        tree = ast.parse(state.code or "")
+    except SyntaxError:
+        return None
+    defined = [n.name for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) and not n.name.startswith("_")]
+    name = (state.parsed_spec or {}).get("name")
+    if name in defined:
+        return name
+    return defined[0] if len(defined) == 1 else None
+
+
+def _value_expr(type_name: str, description: str) -> Optional[str]:
+    """Expression building a size-n value of `type_name` in `make_input`, or None if the type is not known."""
+
+    t = re.sub(r"\s|typing\.", "", type_name.lower())
+    if t in ("int", "integer"):
+        return "n"
+    if t == "float":
+        return "float(n)"
+    if t in ("str", "string"):
+        return "' '.join(''.join(rng.choice(LETTERS) for _ in range(5)) for _ in range(max(1, n // 6)))"
+    container = re.match(r"(list|sequence|iterable|tuple|set)(?:\[(\w*)\])?$", t)
+    if container is None:
+        return None
+    kind, element = container.group(1), container.group(2) or "int"
+    if element in ("int", "float"):
+        make = "rng.random() * n" if element == "float" else "rng.randrange(n * 10)"
+        values = f"[{make} for _ in range(n)]"
+        if "sorted" in description.lower():
+            values = f"sorted({values})"
+    elif element == "str":
+        values = "[''.join(rng.choice(LETTERS) for _ in range(5)) for _ in range(n)]"
+    else:
+        return None
+    return {"tuple": f"tuple({values})", "set": f"set({values})"}.get(kind, values)
+
+
+def input_generator(parsed_spec: Dict[str, Any]) -> Optional[str]:
+    """Source of `make_input(n)` built from the parsed spec's input types, or None if one is not supported."""
+
+    exprs: List[str] = []
+    for item in parsed_spec.get("inputs") or []:
+        if not isinstance(item, dict):
+            return None
+        expr = _value_expr(str(item.get("type") or ""), str(item.get("description") or ""))
+        if expr is None:
+            return None
+        exprs.append(expr)
+    if not exprs:
+        return None
+    return (
+        "import random\n\n"
+        f"LETTERS = {_LETTERS!r}\n\n\n"
+        "def make_input(n):\n"
+        "    rng = random.Random(n)\n"
+        f"    return ({', '.join(exprs)},), {{}}\n"
+    )
+
+
+def _generator_messages(state: AgentState) -> List[Dict[str, str]]:
+    system = (
+        "You write input generators for benchmarking a single Python function. "
+        "Return ONLY Python code, using only the standard library."
+    )
+
+    user = f"""
+Parsed spec:
+{state.parsed_spec}
+
+Write a module defining `make_input(n)` that returns `(args, kwargs)` for one call of
+the function on a valid input of size n. Every input that can grow should grow
+linearly with n. Seed any randomness with n so the inputs are deterministic.
+"""
+
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+
+
+def _llm_generator(state: AgentState) -> Optional[str]:
+    print(">>> Agent is writing an input generator for the performance check...")
+    with routed(state, "performance_check") as route:
+        source = strip_markdown(content_text(route.llm().invoke(_generator_messages(state)).content))
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+    defines = any(isinstance(n, ast.FunctionDef) and n.name == "make_input" for n in tree.body)
+    return source if defines else None
+
+
+def fit_growth(points: List[Tuple[int, float]]) -> Optional[Dict[str, Any]]:
+    """Least-squares slope of log(seconds) on log(n) over the largest sizes, with the nearest growth class."""
+
+    points = [(n, s) for n, s in points if s > 0][-6:]
+    if len(points) < MIN_POINTS:
+        return None
+    xs = [math.log(n) for n, _ in points]
+    ys = [math.log(s) for _, s in points]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    var = sum((x - mean_x) ** 2 for x in xs)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var
+    label = min(_CLASSES, key=lambda c: abs(c[0] - slope))[1]
+    return {"slope": round(slope, 2), "measured": label}
+
+
+def measure(code: str, function: str, generator: str, budget: float = DEFAULT_BUDGET_SECONDS) -> Dict[str, Any]:
+    """Time `function` on inputs from `generator` in a fresh interpreter, under the run limits.
+
+    Returns the `timings` as `[n, seconds]` pairs, plus `error` if the function or the
+    generator raised or the probe was killed.
+    """
+
+    limits = get_run_limits()
+    config = {
+        "function": function,
+        "sizes": SIZES,
+        "max_call_seconds": MAX_CALL_SECONDS,
+        "budget": budget,
+        "cpu_seconds": limits.cpu_seconds,
+        "memory_mb": limits.memory_mb,
+    }
+    with tempfile.TemporaryDirectory() as tmpdir:
+        Path(tmpdir, "impl.py").write_text(code, encoding="utf-8")
+        Path(tmpdir, "perf_inputs.py").write_text(generator, encoding="utf-8")
+        env = dict(os.environ)
+        package_root = str(Path(__file__).resolve().parent.parent)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (package_root, env.get("PYTHONPATH")) if p)
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "self_verifying_agent.perf_probe", tmpdir, json.dumps(config)],
+            cwd=tmpdir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            env=env,
+            start_new_session=True,
+        )
+        error: Optional[str] = None
+        try:
+            stdout, stderr = proc.communicate(timeout=budget * 2 + 5)
+        except subprocess.TimeoutExpired:
+            kill_process_group(proc.pid)
+            stdout, stderr = proc.communicate()
+            error = f"Killed after {budget * 2 + 5:g} seconds."
+        finally:
+            kill_process_group(proc.pid)
+
+    timings: List[List[float]] = []
+    for line in stdout.splitlines():
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if "error" in row:
+            error = f"n={row['n']}: {row['error']}"
+        else:
+            timings.append([row["n"], row["seconds"]])
+    if proc.returncode and error is None:
+        error = (stderr.strip().splitlines() or [f"exit code {proc.returncode}"])[-1]
+    report: Dict[str, Any] = {"timings": timings}
+    if error:
+        report["error"] = error
+    return report
+
+
+def _budget() -> float:
+    return float(os.getenv("AGENT_PERF_BUDGET", str(DEFAULT_BUDGET_SECONDS)))
+
+
+def _verdict(target: str, fit: Optional[Dict[str, Any]]) -> str:
+    parsed = parse_complexity(target)
+    if fit is None or parsed is None:
+        return "inconclusive"
+    degree, has_log = parsed
+    allowed = degree + (_LOG_SLOPE if has_log else 0.0) + SLOPE_TOLERANCE
+    return "too_slow" if fit["slope"] > allowed else "ok"
+
+
+def check_performance(state: AgentState) -> AgentState:
+    """Measure how the running time grows with input size and compare it to the spec's target.
+
+    Skipped when the spec states no Big-O target. Inputs come from `make_input(n)`,
+    built from the parsed input types or, when a type is not supported, written by
+    the LLM once per run (`state.perf_inputs`). The report (`target`, `timings`,
+    `slope`, `measured`, `status`) goes to `test_results["performance"]`; `status`
+    is "ok", "too_slow" or "inconclusive" (too few sizes measured, or an error).
+    """
+
+    target = complexity_target(state)
+    function = _function_name(state)
+    if target is None or function is None or state.code is None:
+        return state
+
+    print(f">>> Agent is measuring how the code scales (target {target})...")
+    if state.perf_inputs is None:
+        state.perf_inputs = input_generator(state.parsed_spec or {}) or _llm_generator(state)
+    if state.perf_inputs is None:
+        report: Dict[str, Any] = {"target": target, "status": "inconclusive", "error": "No input generator."}
+    else:
+        with span("performance_probe", target=target) as record:
+            report = {"target": target, **measure(state.code, function, state.perf_inputs, _budget())}
+            fit = fit_growth([(int(n), s) for n, s in report["timings"]])
+            report.update(fit or {})
+            report["status"] = _verdict(target, fit)
+            record["attributes"].update(status=report["status"], slope=report.get("slope"), sizes=len(report["timings"]))
+    state.test_results = {**(state.test_results or {}), "performance": report}
+    state.record_snapshot(performance=report["status"], slope=report.get("slope"), target=target)
+    return state
+
+
+async def acheck_performance(state: AgentState) -> AgentState:
+    """Async version of `check_performance`; the probe runs on a worker thread."""
+
+    return await asyncio.to_thread(check_performance, state)
+
+
+def performance_analysis(results: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """A `performance_issue` analysis when the last performance check found the code too slow, else None."""
+
+    report = (results or {}).get("performance") or {}
+    if report.get("status") != "too_slow":
+        return None
+    return {
+        "status": "failure",
+        "summary": (
+            f"All tests pass, but the running time grows like {report['measured']} "
+            f"(log-log slope {report['slope']}) and the spec requires {report['target']}."
+        ),
+        "error_type": "performance_issue",
+        "focus_lines": [],
+        "suggestions": [f"Use an algorithm that runs in {report['target']}; keep the behavior the tests check."],
+        "timings": report["timings"],
+        "source": "performance",
+    }
@@ -0,0 +1,373 @@
+"""Deterministic checks on generated code and tests, and rule-based failure analysis.
+
+`check_sources` compiles and AST-inspects `impl.py` and `test_impl.py` before
+pytest runs. It reports syntax errors, imports that cannot resolve, names the tests
+import from `impl` that it does not define, and test calls whose arguments cannot
+bind to the function's signature. `execute_tests` skips pytest only on syntax
+errors. The other checks can be wrong, so their problems go to the analyzer as
+hints. `rule_based_analysis` turns skipped runs, and pytest runs that failed at
+collection with a syntax or import error, into an `error_analysis` without the LLM.
+"""
+from __future__ import annotations
+
+import ast
+import functools
+import importlib.util
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+IMPL_MODULE = "impl"
+
+# Collection-time exceptions whose cause is clear from the exception alone.
+_TRIVIAL_COLLECTION_ERRORS = {
+    "SyntaxError": "syntax_error",
+    "IndentationError": "syntax_error",
+    "TabError": "syntax_error",
+    "ImportError": "import_error",
+    "ModuleNotFoundError": "import_error",
+    "NameError": "import_error",
+}
+
+# Problems that make running pytest pointless; the others are only hints.
+BLOCKING_ERRORS = frozenset({"syntax_error"})
+
+# Handlers that make an import in the `try` body optional, or a call in it allowed to fail.
+_IMPORT_HANDLERS = {"ImportError", "ModuleNotFoundError", "Exception", "BaseException"}
+_CALL_HANDLERS = {"TypeError", "Exception", "BaseException"}
+
+_SUGGESTIONS = {
+    "syntax_error": "Fix the syntax error so the module compiles.",
+    "import_error": "Define or import every name the tests use, and only import modules that are installed.",
+    "type_mismatch": "Match the function signature to how the tests call it.",
+}
+
+
+def _problem(kind: str, file: str, line: Optional[int], message: str) -> Dict[str, Any]:
+    return {"error_type": kind, "file": file, "line": line, "message": message}
+
+
+# A call from the tests to an `impl` function: name, line, positional count, keywords.
+Call = Tuple[str, int, int, FrozenSet[str]]
+
+
+def _compile(source: str, filename: str) -> Tuple[Optional[ast.Module], Optional[Dict[str, Any]]]:
+    try:
+        tree = ast.parse(source, filename)
+        # Compiling the tree also catches errors the parser lets through, e.g. `return` outside a function.
+        compile(tree, filename, "exec", dont_inherit=True)
+        return tree, None
+    except SyntaxError as exc:
+        message = f"{filename}:{exc.lineno}: {type(exc).__name__}: {exc.msg}"
+        return None, _problem("syntax_error", filename, exc.lineno, message)
+
+
+def _catches(node: ast.Try, names: Set[str]) -> bool:
+    """Whether one of the `try` statement's handlers catches any of `names` (a bare `except` does)."""
+
+    for handler in node.handlers:
+        if handler.type is None:
+            return True
+        types = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+        for expr in types:
+            name = expr.attr if isinstance(expr, ast.Attribute) else getattr(expr, "id", None)
+            if name in names:
+                return True
+    return False
+
+
+def _is_type_checking(node: ast.If) -> bool:
+    test = node.test
+    name = test.attr if isinstance(test, ast.Attribute) else getattr(test, "id", None)
+    return name == "TYPE_CHECKING"
+
+
+def _top_level(tree: ast.Module, required_only: bool = False) -> List[ast.stmt]:
+    """Module-level statements, including those nested in `if`/`try`/`with` blocks.
+
+    With `required_only`, statements that may fail or never run without breaking
+    the module are left out: the bodies of `if TYPE_CHECKING:` and of `try` blocks
+    that handle `ImportError`.
+    """
+
+    statements: List[ast.stmt] = []
+    pending = list(tree.body)
+    while pending:
+        node = pending.pop(0)
+        statements.append(node)
+        if isinstance(node, ast.If) and required_only and _is_type_checking(node):
+            pending.extend(node.orelse)
+        elif isinstance(node, (ast.If, ast.For, ast.While, ast.With)):
+            pending.extend(node.body + getattr(node, "orelse", []))
+        elif isinstance(node, ast.Try):
+            optional = required_only and _catches(node, _IMPORT_HANDLERS)
+            pending.extend(([] if optional else node.body + node.orelse) + node.finalbody)
+            for handler in node.handlers:
+                pending.extend(handler.body)
+    return statements
+
+
+def _definitions(tree: ast.Module) -> Tuple[Optional[Set[str]], Dict[str, ast.FunctionDef]]:
+    """Names defined at module level, or None if they cannot be known statically, and plain functions."""
+
+    names: Set[str] = set()
+    functions: Dict[str, ast.FunctionDef] = {}
+    for node in _top_level(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            names.add(node.name)
+            if node.name == "__getattr__":
+                return None, functions
+            if not node.decorator_list:
+                functions[node.name] = node  # type: ignore[assignment]
+            else:
+                functions.pop(node.name, None)
+        elif isinstance(node, ast.ClassDef):
+            names.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == "*":
+                    return None, functions
+                names.add(alias.asname or alias.name.split(".")[0])
+        else:
+            # Blocks were flattened by `_top_level`; only their own targets bind names here.
+            if isinstance(node, ast.For):
+                targets: List[ast.AST] = [node.target]
+            elif isinstance(node, ast.With):
+                targets = [item.optional_vars for item in node.items if item.optional_vars is not None]
+            elif isinstance(node, (ast.If, ast.While, ast.Try)):
+                targets = []
+            else:
+                targets = [node]
+            for target in targets:
+                for child in ast.walk(target):
+                    if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
+                        names.add(child.id)
+                        functions.pop(child.id, None)
+    return names, functions
+
+
+def _missing_modules(tree: ast.Module, filename: str) -> List[Dict[str, Any]]:
+    problems: List[Dict[str, Any]] = []
+    for node in _top_level(tree, required_only=True):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+            modules = [node.module]
+        else:
+            continue
+        for module in modules:
+            top = module.split(".")[0]
+            if top == IMPL_MODULE or importlib.util.find_spec(top) is not None:
+                continue
+            message = f"{filename}:{node.lineno}: ModuleNotFoundError: No module named '{top}'"
+            problems.append(_problem("import_error", filename, node.lineno, message))
+    return problems
+
+
+def _imported_from_impl(tree: ast.Module) -> Tuple[Dict[str, str], Set[str], List[Tuple[str, int]]]:
+    """Local name -> impl name for `from impl import ...`, aliases of `import impl`, and every (name, line) used."""
+
+    local: Dict[str, str] = {}
+    modules: Set[str] = set()
+    used: List[Tuple[str, int]] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module == IMPL_MODULE and not node.level:
+            for alias in node.names:
+                if alias.name != "*":
+                    local[alias.asname or alias.name] = alias.name
+                    used.append((alias.name, node.lineno))
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == IMPL_MODULE:
+                    modules.add(alias.asname or alias.name)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id in modules:
+            used.append((node.attr, node.lineno))
+    return local, modules, used
+
+
+def _callee(node: ast.Call, local: Dict[str, str], modules: Set[str]) -> Optional[str]:
+    func = node.func
+    if isinstance(func, ast.Name):
+        return local.get(func.id)
+    if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.value.id in modules:
+        return func.attr
+    return None
+
+
+def _expects_error(node: ast.AST) -> bool:
+    """Whether a block may be testing that a bad call raises.
+
+    That is `with pytest.raises(...)`, `with self.assertRaises(...)`, and `try`
+    blocks that handle `TypeError`.
+    """
+
+    if isinstance(node, ast.Try):
+        return _catches(node, _CALL_HANDLERS)
+    if not isinstance(node, ast.With):
+        return False
+    for item in node.items:
+        expr = item.context_expr
+        if isinstance(expr, ast.Call) and isinstance(expr.func, (ast.Attribute, ast.Name)):
+            name = expr.func.attr if isinstance(expr.func, ast.Attribute) else expr.func.id
+            if name in ("raises", "assertRaises", "assertRaisesRegex"):
+                return True
+    return False
+
+
+def _binding_error(func: ast.FunctionDef, n_positional: int, keywords: FrozenSet[str]) -> Optional[str]:
+    """Why a call cannot bind to `func`'s parameters, or None if it can."""
+
+    spec = func.args
+    positional = [a.arg for a in spec.posonlyargs + spec.args]
+    defaults = len(spec.defaults)
+    required = positional[: len(positional) - defaults] if defaults else positional
+
+    if n_positional > len(positional) and spec.vararg is None:
+        plural = "" if len(positional) == 1 else "s"
+        return f"takes {len(positional)} positional argument{plural} but {n_positional} were given"
+    named = {a.arg for a in spec.args + spec.kwonlyargs}
+    unknown = sorted(keywords - named)
+    if unknown and spec.kwarg is None:
+        return f"got an unexpected keyword argument '{unknown[0]}'"
+    missing = [name for name in required[n_positional:] if name not in keywords]
+    required_kwonly = [a.arg for a, d in zip(spec.kwonlyargs, spec.kw_defaults) if d is None]
+    missing += [name for name in required_kwonly if name not in keywords]
+    if missing:
+        return f"missing required argument '{missing[0]}'"
+    return None
+
+
+def _impl_calls(tests_tree: ast.Module, local: Dict[str, str], modules: Set[str]) -> List[Call]:
+    """Calls to `impl` functions whose binding can be checked: not `*args`/`**kwargs`, not expected to raise."""
+
+    calls: List[Call] = []
+
+    def visit(node: ast.AST, guarded: bool) -> None:
+        if isinstance(node, ast.Call) and not guarded:
+            name = _callee(node, local, modules)
+            starred = any(isinstance(arg, ast.Starred) for arg in node.args) or any(kw.arg is None for kw in node.keywords)
+            if name and not starred:
+                calls.append((name, node.lineno, len(node.args), frozenset(kw.arg for kw in node.keywords if kw.arg)))
+        if isinstance(node, ast.Try) and _expects_error(node):
+            # Only the `try` body is expected to raise; handlers and `else` are checked.
+            for child in node.body:
+                visit(child, True)
+            for child in [*node.handlers, *node.orelse, *node.finalbody]:
+                visit(child, guarded)
+            return
+        guarded = guarded or _expects_error(node)
+        for child in ast.iter_child_nodes(node):
+            visit(child, guarded)
+
+    visit(tests_tree, False)
+    return calls
+
+
+@functools.lru_cache(maxsize=16)
+def _inspect_tests(tests: str) -> Tuple[Tuple[Dict[str, Any], ...], Tuple[Tuple[str, int], ...], Tuple[Call, ...]]:
+    """Problems in the tests on their own, the names they use from `impl`, and their checkable calls.
+
+    Tests rarely change between fix iterations, so this summary is cached and the
+    tests are parsed once rather than on every run.
+    """
+
+    tree, error = _compile(tests, "test_impl.py")
+    if error is not None:
+        return (error,), (), ()
+    assert tree is not None
+    problems = _missing_modules(tree, "test_impl.py")
+    local, modules, used = _imported_from_impl(tree)
+    return tuple(problems), tuple(used), tuple(_impl_calls(tree, local, modules))
+
+
+def _signature_problems(functions: Dict[str, ast.FunctionDef], calls: Tuple[Call, ...]) -> List[Dict[str, Any]]:
+    problems: List[Dict[str, Any]] = []
+    seen: Set[str] = set()
+    for name, line, n_positional, keywords in calls:
+        error = _binding_error(functions[name], n_positional, keywords) if name in functions else None
+        if error and name not in seen:
+            seen.add(name)
+            message = f"test_impl.py:{line}: TypeError: {name}() {error} (defined at impl.py:{functions[name].lineno})"
+            problems.append(_problem("type_mismatch", "test_impl.py", line, message))
+    return problems
+
+
+def check_sources(code: str, tests: str) -> List[Dict[str, Any]]:
+    """Problems that would make the test run fail in an obvious way; empty if none are found.
+
+    Each problem has `error_type` (`syntax_error`, `import_error` or `type_mismatch`),
+    `file`, `line` and a pytest-like `message`. Checks that cannot be decided
+    statically (star imports, decorated functions, `*args` calls, calls expected to
+    raise, optional imports) are skipped rather than guessed. Only problems in
+    `BLOCKING_ERRORS` are certain to fail the run.
+    """
+
+    code_tree, code_error = _compile(code, "impl.py")
+    problems = [code_error] if code_error is not None else []
+    if code_tree is not None:
+        problems += _missing_modules(code_tree, "impl.py")
+    tests_problems, used, calls = _inspect_tests(tests)
+    problems += [dict(p) for p in tests_problems]
+    if problems or code_tree is None:
+        return problems
+
+    names, functions = _definitions(code_tree)
+    if names is not None:
+        for name, line in used:
+            if name not in names:
+                message = f"test_impl.py:{line}: ImportError: cannot import name '{name}' from 'impl'"
+                problems.append(_problem("import_error", "test_impl.py", line, message))
+    if problems:
+        return problems
+    return _signature_problems(functions, calls)
+
+
+def is_blocking(problems: List[Dict[str, Any]]) -> bool:
+    """Whether `problems` make running pytest pointless."""
+
+    return any(p["error_type"] in BLOCKING_ERRORS for p in problems)
+
+
+def preflight_result(problems: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Test result standing in for a pytest run that `problems` make pointless."""
+
+    return {
+        "exit_code": 2,
+        "stdout": "",
+        "stderr": "\n".join(p["message"] for p in problems),
+        "tests": None,
+        "cpu_time": None,
+        "preflight": problems,
+    }
+
+
+def _analysis(error_type: str, summary: str, focus: List[str], source: str) -> Dict[str, Any]:
+    return {
+        "status": "failure",
+        "summary": summary,
+        "error_type": error_type,
+        "focus_lines": focus,
+        "suggestions": [_SUGGESTIONS.get(error_type, "Fix the reported error.")],
+        "source": source,
+    }
+
+
+def rule_based_analysis(results: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """An `error_analysis` for failures that need no LLM to explain, else None.
+
+    Covers problems found by `check_sources`, and pytest runs where every failure is
+    a collection error caused by a syntax or import error.
+    """
+
+    results = results or {}
+    problems = results.get("preflight")
+    if problems:
+        focus = [f"{p['file']}:{p['line']}" for p in problems if p.get("line")]
+        return _analysis(problems[0]["error_type"], "; ".join(p["message"] for p in problems), focus, "preflight")
+
+    failing = [r for r in results.get("tests") or [] if r.get("outcome") in ("failed", "error")]
+    if not failing or any(r.get("when") != "collect" or r.get("exc_type") not in _TRIVIAL_COLLECTION_ERRORS for r in failing):
+        return None
+    error_type = _TRIVIAL_COLLECTION_ERRORS[failing[0]["exc_type"]]
+    summary = "; ".join(f"{r['exc_type']}: {r.get('message') or ''}".rstrip(": ") for r in failing)
+    focus = [f"{frame['file']}:{frame['line']}" for r in failing for frame in r.get("frames") or []]
+    return _analysis(error_type, f"Collection failed: {summary}", focus, "rules")
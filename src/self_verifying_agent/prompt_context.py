@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import ast
+import os
+import textwrap
+from typing import Any, Dict, List, Optional
+
+DEFAULT_FAILURE_TOKEN_BUDGET = 1500
+
+_FAILING = ("failed", "error")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token), good enough for budgeting."""
+
+    return (len(text) + 3) // 4
+
+
+def estimate_message_tokens(messages: List[Any]) -> int:
+    """Rough prompt size of chat messages given as dicts or LangChain message objects."""
+
+    text = "\n".join(
+        str(m.get("content", "")) if isinstance(m, dict) else str(getattr(m, "content", m)) for m in messages
+    )
+    return estimate_tokens(text)
+
+
+def truncate_middle(text: str, max_tokens: int) -> str:
+    """Shorten `text` to roughly `max_tokens`, keeping whole lines from both ends.
+
+    The tail gets the larger share since pytest puts the error and summary last.
+    """
+
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    max_chars = max_tokens * 4
+    head_chars, tail_chars = max_chars // 3, max_chars - max_chars // 3
+    head = text[:head_chars].rsplit("\n", 1)[0]
+    tail = text[-tail_chars:].split("\n", 1)[-1]
+    omitted = len(text) - len(head) - len(tail)
+    return f"{head}\n... [{omitted} characters omitted] ...\n{tail}"
+
+
+def source_for_nodeid(tests: Optional[str], nodeid: str) -> Optional[str]:
+    """Source of the test function behind a pytest node id, decorators included."""
+
+    if not tests or "::" not in nodeid:
+        return None
+    name = nodeid.split("::")[-1].split("[", 1)[0]
+    try:
+        tree = ast.parse(tests)
+    except SyntaxError:
+        return None
+
+    lines = tests.splitlines()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == name:
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            return textwrap.dedent("\n".join(lines[start - 1 : node.end_lineno]))
+    return None
+
+
+def _format_failure(record: Dict[str, Any], source: Optional[str]) -> str:
+    parts = [f"[{record['outcome'].upper()}] {record['nodeid']}"]
+    exc = record.get("exc_type") or "Error"
+    message = record.get("message") or ""
+    parts.append(f"{exc}: {message}" if message else exc)
+    for frame in record.get("frames") or []:
+        where = f"{frame['file']}:{frame['line']}"
+        if frame.get("function"):
+            where += f" in {frame['function']}"
+        parts.append(f"  {where}: {frame['source']}" if frame.get("source") else f"  {where}")
+    if source:
+        parts.append("Test source:")
+        parts.append(source)
+    return "\n".join(parts)
+
+
+def _raw_output(results: Dict[str, Any], token_budget: int) -> str:
+    stdout = results.get("stdout") or results.get("reason") or ""
+    stderr = results.get("stderr") or ""
+    return (
+        f"Pytest output (stdout):\n{truncate_middle(stdout, token_budget * 2 // 3)}\n\n"
+        f"Pytest errors (stderr):\n{truncate_middle(stderr, token_budget // 3)}"
+    )
+
+
+def failure_context(results: Optional[Dict[str, Any]], tests: Optional[str], token_budget: Optional[int] = None) -> str:
+    """Compact description of the failing tests for analyzer/fixer prompts.
+
+    Uses the structured records from `pytest_report` when available: one block per
+    failing test with its exception, relevant frames and (once per test function)
+    its source, added in order until `token_budget` is spent. Falls back to
+    truncated raw pytest output when there are no records, e.g. after a crash.
+    The default budget comes from `FAILURE_TOKEN_BUDGET`.
+    """
+
+    if token_budget is None:
+        token_budget = int(os.getenv("FAILURE_TOKEN_BUDGET", str(DEFAULT_FAILURE_TOKEN_BUDGET)))
+    results = results or {}
+
+    records = results.get("tests")
+    failing: List[Dict[str, Any]] = [r for r in records or [] if r.get("outcome") in _FAILING]
+    if not failing:
+        return _raw_output(results, token_budget)
+
+    summary = results.get("summary") or {}
+    header = ", ".join(f"{count} {outcome}" for outcome, count in summary.items() if count)
+    blocks: List[str] = [header] if header else []
+    if results.get("regressions"):
+        blocks.append(f"Regressions (passed before the last change): {', '.join(results['regressions'])}")
+    if results.get("timed_out_tests"):
+        blocks.append(f"Timed out (stopped at the time limit): {', '.join(results['timed_out_tests'])}")
+    used = estimate_tokens("\n\n".join(blocks))
+    seen_sources = set()
+
+    for index, record in enumerate(failing):
+        source = source_for_nodeid(tests, record["nodeid"])
+        if source in seen_sources:
+            source = None
+        block = _format_failure(record, source)
+        cost = estimate_tokens(block)
+        if used + cost > token_budget:
+            if index == 0:
+                blocks.append(truncate_middle(block, max(token_budget - used, 1)))
+                index += 1
+            remaining = len(failing) - index
+            if remaining:
+                blocks.append(f"({remaining} more failing tests omitted to fit the token budget)")
+            break
+        blocks.append(block)
+        used += cost
+        if source:
+            seen_sources.add(source)
+
+    return "\n\n".join(blocks)
+
+
+REFERENCE_HEADER = "Verified solution to a similar spec"
+
+
+def reference_context(reference: Optional[Dict[str, Any]], part: str) -> str:
+    """Prompt section showing the `part` ("code" or "tests") of a similar verified solution, or ""."""
+
+    if not reference or not reference.get(part):
+        return ""
+    label = "Implementation" if part == "code" else "Tests"
+    return f"""
+{REFERENCE_HEADER} (similarity {reference.get('similarity', 0):.2f}):
+{reference['spec']}
+
+{label} that passed for it:
+{reference[part]}
+
+Reuse what carries over, but where the two specs differ, the current spec wins.
+"""
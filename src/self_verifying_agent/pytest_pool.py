@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import atexit
+import contextlib
+import io
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .pytest_report import disable_plugin_autoload, load_report, plugin_args
+from .sandbox import kill_process_group
+
+# Modules written by the runner; purged between runs so each run imports fresh code.
+_RUN_MODULES = ("impl", "test_impl")
+
+
+def _execute(
+    code: str,
+    tests: str,
+    args: List[str],
+    select: Optional[List[str]] = None,
+    workdir: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Run pytest in-process against `code`/`tests` and capture its output.
+
+    `select` limits the run to the given node ids instead of the whole test file.
+    Structured per-test records from `pytest_report` are returned under `tests` and
+    the session's CPU time under `cpu_time`. The run happens in `workdir` if given
+    (the pool's parent reads the progress file from there if it has to kill the
+    worker), otherwise in a fresh temporary directory.
+    """
+
+    import pytest
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    cwd = os.getcwd()
+    saved_path = list(sys.path)
+    with contextlib.ExitStack() as stack:
+        tmpdir = Path(workdir) if workdir else Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        impl_path = tmpdir / "impl.py"
+        test_path = tmpdir / "test_impl.py"
+        impl_path.write_text(code, encoding="utf-8")
+        test_path.write_text(tests, encoding="utf-8")
+
+        targets = select or [str(test_path)]
+        for name in _RUN_MODULES:
+            sys.modules.pop(name, None)
+        try:
+            os.chdir(tmpdir)
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                exit_code = int(pytest.main([*targets, "-p", "no:cacheprovider", *plugin_args(tmpdir), *args]))
+        finally:
+            os.chdir(cwd)
+            sys.path[:] = saved_path
+            for name in _RUN_MODULES:
+                sys.modules.pop(name, None)
+        report = load_report(tmpdir)
+
+    return {
+        "exit_code": exit_code,
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        **report,
+    }
+
+
+def _warm_up() -> None:
+    """Import pytest and load its plugins once so the first real run is fast."""
+
+    with tempfile.TemporaryDirectory() as tmpdir_str:
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stdout):
+            import pytest
+
+            pytest.main([tmpdir_str, "-q", "--collect-only", "-p", "no:cacheprovider"])
+
+
+def _worker_main(conn: Any) -> None:
+    """Worker loop: receive (code, tests, args, select, workdir) jobs and send back result dicts."""
+
+    # Lead a process group of our own so a kill also reaches processes the tests spawn.
+    if hasattr(os, "setsid"):
+        os.setsid()
+    disable_plugin_autoload(os.environ)
+    _warm_up()
+    conn.send("ready")
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        try:
+            result = _execute(*job)
+        except BaseException as exc:  # noqa: BLE001 - report anything the run raised
+            result = {"exit_code": 3, "stdout": "", "stderr": f"pytest worker error: {exc!r}"}
+        conn.send(result)
+
+
+class _Worker:
+    def __init__(self, ctx: Any) -> None:
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.runs = 0
+        self.ready = False
+
+    def wait_ready(self, timeout: Optional[float]) -> bool:
+        if not self.ready and self.conn.poll(timeout):
+            self.ready = self.conn.recv() == "ready"
+        return self.ready
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=1)
+        # Also reaps anything the tests left running in the worker's process group.
+        self.kill()
+        self.conn.close()
+
+    def kill(self) -> None:
+        if self.process.pid is not None:
+            kill_process_group(self.process.pid)
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=1)
+
+
+class PytestWorkerPool:
+    """Pool of warm worker processes that run generated test suites.
+
+    Each worker imports pytest and loads its plugins once at start-up, then serves
+    runs in a fresh temporary directory with `impl`/`test_impl` purged from
+    `sys.modules`. Workers are replaced after they crash, hit the `timeout`, or
+    serve `max_runs_per_worker` runs, since generated code can leave the
+    interpreter in a bad state. A worker that hits the `timeout` is killed with
+    its whole process group at once. `run` is thread-safe and blocks while all
+    workers are busy.
+    """
+
+    def __init__(self, size: int = 2, max_runs_per_worker: int = 50) -> None:
+        self.size = size
+        self.max_runs_per_worker = max_runs_per_worker
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(_Worker(self._ctx))
+
+    def run(
+        self,
+        code: str,
+        tests: str,
+        args: Optional[List[str]] = None,
+        timeout: Optional[float] = None,
+        select: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """Run `tests` against `code` and return `exit_code`/`stdout`/`stderr`.
+
+        `args` are extra pytest arguments; `select` restricts the run to node ids.
+        If the worker is killed (`timeout`) or dies (e.g. on its CPU rlimit), the
+        result has `limit` set and `tests` holds whatever the run recorded.
+        """
+
+        if self._closed:
+            raise RuntimeError("PytestWorkerPool is closed.")
+
+        worker = self._idle.get()
+        recycle = True
+        with tempfile.TemporaryDirectory() as workdir:
+            try:
+                if not worker.wait_ready(None):
+                    raise EOFError
+                worker.conn.send((code, tests, list(args or []), list(select) if select else None, workdir))
+                if not worker.conn.poll(timeout):
+                    worker.kill()
+                    return {
+                        "exit_code": 1,
+                        "stdout": "",
+                        "stderr": f"pytest worker timed out after {timeout} seconds.",
+                        "timed_out": True,
+                        "limit": "suite_timeout",
+                        **load_report(Path(workdir)),
+                    }
+                result: Dict[str, Any] = worker.conn.recv()
+                worker.runs += 1
+                recycle = worker.runs >= self.max_runs_per_worker
+                return result
+            except (EOFError, BrokenPipeError, OSError):
+                worker.process.join(timeout=1)
+                exitcode = worker.process.exitcode
+                crashed: Dict[str, Any] = {
+                    "exit_code": 1,
+                    "stdout": "",
+                    "stderr": f"pytest worker crashed (exit code {exitcode}).",
+                    **load_report(Path(workdir)),
+                }
+                if exitcode == -getattr(signal, "SIGXCPU", 0):
+                    crashed["limit"] = "cpu_time"
+                return crashed
+            finally:
+                if recycle:
+                    worker.stop()
+                    worker = _Worker(self._ctx)
+                self._idle.put(worker)
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+_pool: Optional[PytestWorkerPool] = None
+_pool_configured = False
+_pool_lock = threading.Lock()
+
+
+def configure_pytest_pool(size: int, max_runs_per_worker: int = 50) -> Optional[PytestWorkerPool]:
+    """Replace the process-wide pool; a `size` of 0 makes `run_tests` use a cold subprocess.
+
+    Call it from under `if __name__ == "__main__":`, since workers are spawned and
+    re-import the main module.
+    """
+
+    with _pool_lock:
+        return _install_pool(size, max_runs_per_worker)
+
+
+def _spawned_child() -> bool:
+    """Whether this process was started by multiprocessing (and may still be importing `__main__`).
+
+    Starting workers from there fails, e.g. when a script without a `__main__` guard
+    is re-imported by a spawned process, so such processes run tests without a pool.
+    """
+
+    return multiprocessing.parent_process() is not None or getattr(multiprocessing.current_process(), "_inheriting", False)
+
+
+def _install_pool(size: int, max_runs_per_worker: int) -> Optional[PytestWorkerPool]:
+    global _pool, _pool_configured
+    if _pool is not None:
+        _pool.close()
+    if _spawned_child():
+        size = 0
+    _pool = PytestWorkerPool(size=size, max_runs_per_worker=max_runs_per_worker) if size > 0 else None
+    if _pool is not None:
+        atexit.register(_pool.close)
+    _pool_configured = True
+    return _pool
+
+
+def get_pytest_pool() -> Optional[PytestWorkerPool]:
+    """Return the process-wide pool, or None when pooling is disabled.
+
+    Unless `configure_pytest_pool` was called, the pool is created on first use from
+    `PYTEST_POOL_SIZE` (default 0: a cold subprocess per run) and
+    `PYTEST_WORKER_MAX_RUNS` (default 50). The entry points in `examples` turn the
+    pool on; library callers opt in with `configure_pytest_pool` or the variable.
+    """
+
+    if not _pool_configured:
+        with _pool_lock:
+            if not _pool_configured:
+                _install_pool(
+                    int(os.getenv("PYTEST_POOL_SIZE", "0")),
+                    int(os.getenv("PYTEST_WORKER_MAX_RUNS", "50")),
+                )
+    return _pool
@@ -0,0 +1,385 @@
+"""Pytest plugin that records structured per-test results for the agent.
+
+Loaded with `-p self_verifying_agent.pytest_report --agent-report PATH`; writes
+`{"tests": [...], "cpu_time": seconds}` to PATH when the session finishes, with one
+`{nodeid, outcome, exc_type, message, frames}` record per test and the CPU time the
+session used. With `--agent-coverage`, each record also lists the lines of
+`impl.py` the test executed under `covered_lines`.
+
+It also enforces the `sandbox.RunLimits` passed as options: `--agent-test-timeout`
+fails a test that runs too long with `TestTimeout` (the record gets `timed_out`),
+and `--agent-cpu-limit` / `--agent-memory-limit` set `RLIMIT_CPU` / `RLIMIT_AS`
+for the session. Records are also appended to a progress file as tests finish, so
+a run killed by the suite timeout still yields the tests it completed and the one
+it was stuck in.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, MutableMapping, Optional, Set
+
+import pytest
+
+# Only frames from the generated files are useful to the analyzer and fixer.
+_RELEVANT_FILES = ("impl.py", "test_impl.py")
+MAX_FRAMES = 5
+MAX_MESSAGE_CHARS = 500
+REPORT_FILE = "agent_report.json"
+PROGRESS_FILE = "agent_progress.jsonl"
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None  # type: ignore[assignment]
+
+_FILE_LINE = re.compile(r"\b((?:test_)?impl\.py)(?:\", line |:)(\d+)")
+_EXC_LINE = re.compile(r"^E\s+([A-Za-z_][\w.]*(?:Error|Exception|Exit|Interrupt|Warning))(?::\s*(.*))?$", re.MULTILINE)
+
+
+def _frames(excinfo: Any) -> List[Dict[str, Any]]:
+    frames: List[Dict[str, Any]] = []
+    for entry in excinfo.traceback:
+        path = str(entry.path)
+        if os.path.basename(path) not in _RELEVANT_FILES:
+            continue
+        try:
+            source = str(entry.statement).strip()
+        except Exception:  # noqa: BLE001 - source may be unavailable for broken files
+            source = ""
+        frames.append(
+            {
+                "file": os.path.basename(path),
+                "line": entry.lineno + 1,
+                "function": entry.name,
+                "source": source,
+            }
+        )
+    return frames[-MAX_FRAMES:]
+
+
+def _from_text(text: str) -> Dict[str, Any]:
+    """Best-effort exception type/message from a rendered report (collection errors)."""
+
+    frames: List[Dict[str, Any]] = []
+    for file, line in _FILE_LINE.findall(text):
+        frame = {"file": file, "line": int(line), "function": None, "source": ""}
+        if frame not in frames:
+            frames.append(frame)
+
+    matches = _EXC_LINE.findall(text)
+    if not matches:
+        message = text.strip().splitlines()[-1] if text.strip() else ""
+        return {"exc_type": None, "message": message[:MAX_MESSAGE_CHARS], "frames": frames[-MAX_FRAMES:]}
+    exc_type, message = matches[-1]
+    return {
+        "exc_type": exc_type.rsplit(".", 1)[-1],
+        "message": message[:MAX_MESSAGE_CHARS],
+        "frames": frames[-MAX_FRAMES:],
+    }
+
+
+class TestTimeout(pytest.fail.Exception):
+    """Raised inside a test that runs longer than `--agent-test-timeout`.
+
+    Derives from pytest's `Failed` (a `BaseException`), so `except Exception` in
+    generated code cannot swallow it.
+    """
+
+    __test__ = False
+
+
+def _alarm_supported() -> bool:
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+def _set_rlimit(kind: int, limit: int) -> Any:
+    """Lower the soft limit of `kind` to `limit` (capped by the hard limit); returns the old limits."""
+
+    old = resource.getrlimit(kind)
+    hard = old[1]
+    soft = limit if hard == resource.RLIM_INFINITY else min(limit, hard)
+    try:
+        resource.setrlimit(kind, (soft, hard))
+    except (ValueError, OSError):
+        return None
+    return old
+
+
+def _line_tracer(lines: Set[int]) -> Any:
+    """`sys.settrace` hook that records executed lines of `impl.py` only."""
+
+    def local(frame: Any, event: str, arg: Any) -> Any:
+        if event == "line":
+            lines.add(frame.f_lineno)
+        return local
+
+    def global_(frame: Any, event: str, arg: Any) -> Any:
+        if os.path.basename(frame.f_code.co_filename) != "impl.py":
+            return None
+        lines.add(frame.f_lineno)
+        return local
+
+    return global_
+
+
+class ResultCollector:
+    """Collects one record per test (and per failed collection) during a session."""
+
+    def __init__(self, coverage: bool = False, test_timeout: Optional[float] = None, progress: Optional[str] = None) -> None:
+        self.results: List[Dict[str, Any]] = []
+        self.coverage = coverage
+        self.test_timeout = test_timeout if test_timeout and _alarm_supported() else None
+        self._progress = open(progress, "a", encoding="utf-8", buffering=1) if progress else None
+        self._excinfo: Dict[str, Any] = {}
+        self._covered: Dict[str, Set[int]] = {}
+        # Measured from here so a long-lived worker only counts this session.
+        self._cpu_start = time.process_time()
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item: Any, nextitem: Any):
+        if not self.coverage:
+            yield
+            return
+        lines = self._covered.setdefault(item.nodeid, set())
+        previous = sys.gettrace()
+        sys.settrace(_line_tracer(lines))
+        try:
+            yield
+        finally:
+            sys.settrace(previous)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item: Any):
+        if not self.test_timeout:
+            yield
+            return
+        timeout = self.test_timeout
+
+        def on_alarm(signum: int, frame: Any) -> None:
+            raise TestTimeout(f"Test exceeded the {timeout:g}s per-test timeout.", pytrace=False)
+
+        previous = signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+    def pytest_runtest_logstart(self, nodeid: str, location: Any) -> None:
+        self._write_progress({"started": nodeid})
+
+    def _write_progress(self, entry: Dict[str, Any]) -> None:
+        if self._progress is not None:
+            self._progress.write(json.dumps(entry) + "\n")
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item: Any, call: Any):
+        yield
+        if call.excinfo is not None and item.nodeid not in self._excinfo:
+            self._excinfo[item.nodeid] = call.excinfo
+
+    def pytest_runtest_logreport(self, report: Any) -> None:
+        # Passing setup/teardown phases carry no information of their own.
+        if report.when != "call" and report.passed:
+            return
+
+        # Keep one record per test: the first non-passing phase wins.
+        existing = next((r for r in self.results if r["nodeid"] == report.nodeid), None)
+        if existing is not None:
+            if existing["outcome"] != "passed":
+                return
+            self.results.remove(existing)
+
+        record: Dict[str, Any] = {
+            "nodeid": report.nodeid,
+            "outcome": "error" if report.failed and report.when != "call" else report.outcome,
+            "when": report.when,
+            "duration": round(report.duration, 6),
+            "exc_type": None,
+            "message": "",
+            "frames": [],
+        }
+        excinfo = self._excinfo.pop(report.nodeid, None)
+        if report.failed and excinfo is not None:
+            record["exc_type"] = excinfo.typename
+            record["message"] = str(excinfo.value)[:MAX_MESSAGE_CHARS]
+            record["frames"] = _frames(excinfo)
+            if excinfo.errisinstance(TestTimeout):
+                record["timed_out"] = True
+        elif report.failed:
+            record.update(_from_text(report.longreprtext))
+        self.results.append(record)
+        self._write_progress({"record": record})
+
+    def pytest_collectreport(self, report: Any) -> None:
+        if not report.failed:
+            return
+        record: Dict[str, Any] = {
+            "nodeid": report.nodeid or "test_impl.py",
+            "outcome": "error",
+            "when": "collect",
+            "duration": 0.0,
+            "frames": [],
+        }
+        record.update(_from_text(report.longreprtext))
+        self.results.append(record)
+        self._write_progress({"record": record})
+
+    def finalize(self) -> Dict[str, Any]:
+        if self.coverage:
+            for record in self.results:
+                if "::" in record["nodeid"]:
+                    record["covered_lines"] = sorted(self._covered.get(record["nodeid"], ()))
+        return {"tests": self.results, "cpu_time": round(time.process_time() - self._cpu_start, 6)}
+
+
+def pytest_addoption(parser: Any) -> None:
+    parser.addoption("--agent-report", default=None, help="Write structured per-test results as JSON to this path.")
+    parser.addoption(
+        "--agent-coverage",
+        action="store_true",
+        default=False,
+        help="Record the impl.py lines each test executes in the agent report.",
+    )
+    parser.addoption("--agent-test-timeout", type=float, default=None, help="Fail tests that run longer than this many seconds.")
+    parser.addoption("--agent-cpu-limit", type=float, default=None, help="CPU seconds this session may use (RLIMIT_CPU).")
+    parser.addoption("--agent-memory-limit", type=int, default=None, help="Address space limit in MB (RLIMIT_AS).")
+
+
+def _apply_rlimits(config: Any) -> List[Any]:
+    """Set the session's CPU and memory rlimits; returns what to restore afterwards.
+
+    The CPU limit counts from the CPU time already used, so a long-lived pool worker
+    gets the full budget for each run.
+    """
+
+    if resource is None:
+        return []
+    restore: List[Any] = []
+    cpu = config.getoption("--agent-cpu-limit")
+    if cpu:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        old = _set_rlimit(resource.RLIMIT_CPU, int(usage.ru_utime + usage.ru_stime + cpu) + 1)
+        if old is not None:
+            restore.append((resource.RLIMIT_CPU, old))
+    memory = config.getoption("--agent-memory-limit")
+    if memory:
+        old = _set_rlimit(resource.RLIMIT_AS, memory * 1024 * 1024)
+        if old is not None:
+            restore.append((resource.RLIMIT_AS, old))
+    return restore
+
+
+def pytest_configure(config: Any) -> None:
+    config._agent_rlimits = _apply_rlimits(config)
+    path: Optional[str] = config.getoption("--agent-report")
+    if path:
+        config._agent_collector = ResultCollector(
+            coverage=config.getoption("--agent-coverage"),
+            test_timeout=config.getoption("--agent-test-timeout"),
+            progress=str(Path(path).with_name(PROGRESS_FILE)),
+        )
+        config.pluginmanager.register(config._agent_collector, "agent_result_collector")
+
+
+def pytest_unconfigure(config: Any) -> None:
+    collector: Optional[ResultCollector] = getattr(config, "_agent_collector", None)
+    if collector is not None and collector._progress is not None:
+        collector._progress.close()
+    for kind, old in getattr(config, "_agent_rlimits", []):
+        resource.setrlimit(kind, old)
+
+
+def pytest_sessionfinish(session: Any) -> None:
+    path: Optional[str] = session.config.getoption("--agent-report")
+    collector: Optional[ResultCollector] = getattr(session.config, "_agent_collector", None)
+    if path and collector is not None:
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(collector.finalize(), fh)
+
+
+def plugin_args(tmpdir: Path) -> List[str]:
+    """Pytest arguments that load this plugin and write its report into `tmpdir`."""
+
+    return ["-p", __name__, "--agent-report", str(tmpdir / REPORT_FILE)]
+
+
+def disable_plugin_autoload(env: MutableMapping[str, str]) -> None:
+    """Keep pytest from importing every installed plugin when it starts in `env`.
+
+    Generated suites need only this plugin, which `plugin_args` loads explicitly, and
+    third-party plugins (e.g. the ones langsmith and anyio register) can add seconds to
+    each cold pytest start. Set `PYTEST_DISABLE_PLUGIN_AUTOLOAD` to an empty string to
+    load them anyway.
+    """
+
+    env.setdefault("PYTEST_DISABLE_PLUGIN_AUTOLOAD", "1")
+
+
+def _load_progress(path: Path) -> Optional[List[Dict[str, Any]]]:
+    """Records of a session that never finished, from its progress file.
+
+    The test it was running when it died gets an `unfinished` error record.
+    """
+
+    if not path.exists():
+        return None
+    records: List[Dict[str, Any]] = []
+    running: Optional[str] = None
+    for line in path.read_text(encoding="utf-8").splitlines():
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            break  # a line cut short by the kill
+        if "started" in entry:
+            running = entry["started"]
+        else:
+            records = [r for r in records if r["nodeid"] != entry["record"]["nodeid"]] + [entry["record"]]
+            if entry["record"]["nodeid"] == running:
+                running = None
+    if running is not None:
+        records.append(
+            {
+                "nodeid": running,
+                "outcome": "error",
+                "when": "call",
+                "duration": 0.0,
+                "exc_type": None,
+                "message": "The test did not finish.",
+                "frames": [],
+                "unfinished": True,
+            }
+        )
+    return records or None
+
+
+def load_report(tmpdir: Path) -> Dict[str, Any]:
+    """Read the report written by `plugin_args` as `{"tests", "cpu_time"}`.
+
+    If pytest was killed before writing it, `tests` holds what its progress file
+    recorded (see `_load_progress`); both values are None if it never started a test.
+    """
+
+    path = tmpdir / REPORT_FILE
+    try:
+        report = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"tests": _load_progress(tmpdir / PROGRESS_FILE), "cpu_time": None}
+    return {"tests": report.get("tests"), "cpu_time": report.get("cpu_time")}
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Count records per outcome."""
+
+    counts: Dict[str, int] = {"passed": 0, "failed": 0, "error": 0, "skipped": 0}
+    for record in results:
+        counts[record["outcome"]] = counts.get(record["outcome"], 0) + 1
+    return counts
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import os
+import signal
+import threading
+from typing import List, Optional
+
+DEFAULT_SUITE_TIMEOUT = 120.0
+DEFAULT_TEST_TIMEOUT = 10.0
+DEFAULT_CPU_SECONDS = 60
+DEFAULT_MEMORY_MB = 2048
+
+
+class RunLimits:
+    """Limits applied to every pytest run of generated code; 0 or None disables one.
+
+    - `suite_timeout`: wall-clock seconds for the whole run, after which the process
+      group running pytest is killed;
+    - `test_timeout`: wall-clock seconds per test, after which that test fails with
+      `TestTimeout` and the run goes on;
+    - `cpu_seconds`: CPU-time rlimit (`RLIMIT_CPU`) for the run;
+    - `memory_mb`: address-space rlimit (`RLIMIT_AS`) for the process running pytest.
+
+    The per-test timeout and rlimits are enforced by the `pytest_report` plugin
+    inside the pytest process (POSIX only); the suite timeout by the runner.
+    """
+
+    def __init__(
+        self,
+        suite_timeout: Optional[float] = DEFAULT_SUITE_TIMEOUT,
+        test_timeout: Optional[float] = DEFAULT_TEST_TIMEOUT,
+        cpu_seconds: Optional[int] = DEFAULT_CPU_SECONDS,
+        memory_mb: Optional[int] = DEFAULT_MEMORY_MB,
+    ) -> None:
+        self.suite_timeout = suite_timeout or None
+        self.test_timeout = test_timeout or None
+        self.cpu_seconds = cpu_seconds or None
+        self.memory_mb = memory_mb or None
+
+    def pytest_args(self) -> List[str]:
+        """Arguments that make the `pytest_report` plugin enforce these limits."""
+
+        args: List[str] = []
+        if self.test_timeout:
+            args += ["--agent-test-timeout", str(self.test_timeout)]
+        if self.cpu_seconds:
+            args += ["--agent-cpu-limit", str(self.cpu_seconds)]
+        if self.memory_mb:
+            args += ["--agent-memory-limit", str(self.memory_mb)]
+        return args
+
+
+_limits: Optional[RunLimits] = None
+_limits_lock = threading.Lock()
+
+
+def configure_run_limits(
+    suite_timeout: Optional[float] = DEFAULT_SUITE_TIMEOUT,
+    test_timeout: Optional[float] = DEFAULT_TEST_TIMEOUT,
+    cpu_seconds: Optional[int] = DEFAULT_CPU_SECONDS,
+    memory_mb: Optional[int] = DEFAULT_MEMORY_MB,
+) -> RunLimits:
+    """Install the process-wide limits; unspecified ones keep their defaults."""
+
+    global _limits
+    with _limits_lock:
+        _limits = RunLimits(suite_timeout, test_timeout, cpu_seconds, memory_mb)
+        return _limits
+
+
+def get_run_limits() -> RunLimits:
+    """Return the process-wide limits, read on first use from `AGENT_SUITE_TIMEOUT`,
+    `AGENT_TEST_TIMEOUT`, `AGENT_TEST_CPU_SECONDS` and `AGENT_TEST_MEMORY_MB`."""
+
+    if _limits is None:
+        configure_run_limits(
+            suite_timeout=float(os.getenv("AGENT_SUITE_TIMEOUT", str(DEFAULT_SUITE_TIMEOUT))),
+            test_timeout=float(os.getenv("AGENT_TEST_TIMEOUT", str(DEFAULT_TEST_TIMEOUT))),
+            cpu_seconds=int(os.getenv("AGENT_TEST_CPU_SECONDS", str(DEFAULT_CPU_SECONDS))),
+            memory_mb=int(os.getenv("AGENT_TEST_MEMORY_MB", str(DEFAULT_MEMORY_MB))),
+        )
+    assert _limits is not None
+    return _limits
+
+
+def kill_process_group(pid: int) -> None:
+    """SIGKILL `pid` and every process in its group, so children of generated code die too."""
+
+    if not hasattr(os, "killpg"):
+        os.kill(pid, signal.SIGTERM)
+        return
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass  # the group is already gone
@@ -0,0 +1,440 @@
+"""HTTP job service around the agent: submit specs, follow their runs, fetch results.
+
+`create_app` returns a Starlette (ASGI) application with these endpoints:
+
+- `POST /jobs` with `{"spec": ..., "max_iterations"?, "fix_candidates"?, "fix_mode"?,
+  "performance_check"?, "stream_tokens"?}` queues a run and answers 202 with the job.
+  When every worker is busy and the queue is full it answers 429 with `Retry-After`.
+- `GET /jobs/{id}`: the job's status (`queued`, `running`, `succeeded`, `failed`,
+  `cancelled` or `error`), last node and timings.
+- `GET /jobs/{id}/result`: the final code, tests and analysis; 202 while the job runs.
+- `GET /jobs/{id}/events`: server-sent events for the run, replayed from its start:
+  `status` when a worker picks it up, `node` after every graph node, `delta` for LLM
+  text chunks if the job asked for `stream_tokens`, and a final `end` with the job.
+- `POST /jobs/{id}/cancel`: cancel a queued job, or stop a running one at its next
+  LLM chunk or node boundary.
+- `GET /healthz` and `GET /metrics` (Prometheus text, see `instrumentation`).
+
+Runs execute on a `JobManager` thread pool in this process, so the service needs
+nothing but the LLM provider; with `LLM_PROVIDER=stub` it runs fully offline.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from .code_fixer import FIX_MODES
+from .graph import stream_self_verifying_agent
+from .instrumentation import Tracer, get_metrics
+
+FINISHED = ("succeeded", "failed", "cancelled", "error")
+
+# Seconds between keep-alive comments on an idle event stream.
+HEARTBEAT_SECONDS = 15.0
+
+# State kept per job for its result; finished jobs are held in memory, so not the whole state.
+_RESULT_KEYS = ("parsed_spec", "code", "tests", "error_analysis", "iteration")
+
+
+class QueueFull(Exception):
+    """Raised by `JobManager.submit` when every worker is busy and the queue is full."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("The job queue is full; retry later.")
+        self.retry_after = retry_after
+
+
+class Job:
+    """One agent run: its settings, progress, result and the events published so far."""
+
+    def __init__(self, spec: str, options: Dict[str, Any], stream_tokens: bool) -> None:
+        self.id = uuid.uuid4().hex
+        self.spec = spec
+        self.options = options
+        self.stream_tokens = stream_tokens
+        self.status = "queued"
+        self.node: Optional[str] = None
+        self.state: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.cancel_requested = threading.Event()
+        self.future: Optional[Future] = None
+
+        self._lock = threading.Lock()
+        # (sequence number, event, data); followers resume after the last number they saw.
+        self._events: List[Tuple[int, str, Dict[str, Any]]] = []
+        self._next_seq = 0
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "node": self.node,
+            "iteration": self.state.get("iteration", 0),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+        }
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            **self.summary(),
+            "spec": self.spec,
+            "parsed_spec": self.state.get("parsed_spec"),
+            "code": self.state.get("code"),
+            "tests": self.state.get("tests"),
+            "error_analysis": self.state.get("error_analysis"),
+        }
+
+    def publish(self, event: str, data: Dict[str, Any], status: Optional[str] = None) -> None:
+        """Append an event for the job's followers, moving it to `status` at the same time.
+
+        Once the job finishes its `delta` events are dropped, so finished jobs kept for
+        replay hold only their `status`, `node` and `end` events, not every token.
+        """
+
+        with self._lock:
+            if status is not None:
+                self.status = status
+            self._events.append((self._next_seq, event, data))
+            self._next_seq += 1
+            if self.done:
+                self._events = [entry for entry in self._events if entry[1] != "delta"]
+            waiters = list(self._waiters)
+        for loop, wake in waiters:
+            # The follower's loop may have shut down since it subscribed.
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(wake.set)
+
+    async def follow(self, heartbeat: float = HEARTBEAT_SECONDS) -> AsyncIterator[Optional[Tuple[str, Dict[str, Any]]]]:
+        """Every event published so far, then new ones as they come, until the `end` event.
+
+        Following a finished job replays it without its `delta` events.
+
+        Yields None after `heartbeat` seconds without an event.
+        """
+
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        waiter = (loop, wake)
+        with self._lock:
+            self._waiters.append(waiter)
+        seen = -1
+        try:
+            while True:
+                # Cleared before reading, so an event published after the read wakes us.
+                wake.clear()
+                with self._lock:
+                    pending = self._events[bisect.bisect_right(self._events, seen, key=lambda entry: entry[0]):]
+                    done = self.done
+                if pending:
+                    seen = pending[-1][0]
+                for _, event, data in pending:
+                    yield event, data
+                if done:
+                    return
+                try:
+                    await asyncio.wait_for(wake.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                self._waiters.remove(waiter)
+
+
+def _node_event(node: str, update: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of a state update sent in `node` events; the full state is in the result."""
+
+    analysis = update.get("error_analysis") or {}
+    event: Dict[str, Any] = {"node": node, "iteration": update.get("iteration", 0), "status": analysis.get("status")}
+    summary = (update.get("test_results") or {}).get("summary")
+    if summary:
+        event["tests"] = summary
+    return event
+
+
+class JobManager:
+    """Runs jobs on a fixed pool of `workers` threads with at most `max_queue` waiting.
+
+    `submit` raises `QueueFull` rather than queueing without bound, so callers see
+    backpressure as soon as the service is saturated. The last `max_finished`
+    finished jobs are kept for status and result queries.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 16, max_finished: int = 1000) -> None:
+        if workers < 1:
+            raise ValueError("JobManager needs at least one worker.")
+        if max_queue < 0:
+            raise ValueError("max_queue must not be negative.")
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_finished = max_finished
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-service")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._finished: Deque[str] = deque()
+        self._active = 0
+        self._running = 0
+        # Moving average of job durations, for the `Retry-After` hint.
+        self._mean_duration = 1.0
+
+    def submit(self, spec: str, stream_tokens: bool = False, **options: Any) -> Job:
+        """Queue a run of `spec`; `options` are passed to `stream_self_verifying_agent`."""
+
+        job = Job(spec, options, stream_tokens)
+        with self._lock:
+            if self._active >= self.workers + self.max_queue:
+                get_metrics().inc("agent_service_rejected_total")
+                raise QueueFull(max(1, math.ceil(self._mean_duration / self.workers)))
+            self._active += 1
+            self._jobs[job.id] = job
+        get_metrics().inc("agent_service_jobs_submitted_total")
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel the job; a running one stops at its next LLM chunk or node boundary."""
+
+        job = self.get(job_id)
+        if job is None or job.done:
+            return job
+        job.cancel_requested.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, "cancelled")
+        return job
+
+    def _run(self, job: Job) -> None:
+        if job.cancel_requested.is_set():
+            self._finish(job, "cancelled")
+            return
+        with self._lock:
+            self._running += 1
+        job.started = time.time()
+        job.publish("status", {"status": "running"}, status="running")
+
+        status, error = "cancelled", None
+        # Tokens are always streamed so a cancel takes effect between LLM chunks.
+        stream = stream_self_verifying_agent(job.spec, stream_tokens=True, tracer=Tracer(), **job.options)
+        try:
+            for node, update in stream:
+                if job.cancel_requested.is_set():
+                    break
+                if isinstance(update, str):
+                    if job.stream_tokens:
+                        job.publish("delta", {"node": node, "delta": update})
+                    continue
+                job.state.update({key: update[key] for key in _RESULT_KEYS if key in update})
+                job.node = node
+                job.publish("node", _node_event(node, update))
+            else:
+                succeeded = (job.state.get("error_analysis") or {}).get("status") == "success"
+                status = "succeeded" if succeeded else "failed"
+        except Exception as exc:  # noqa: BLE001 - reported on the job instead of killing the worker
+            status, error = "error", f"{type(exc).__name__}: {exc}"
+        finally:
+            stream.close()
+            with self._lock:
+                self._running -= 1
+            job.error = error
+            self._finish(job, status)
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.finished = time.time()
+        metrics = get_metrics()
+        metrics.inc("agent_service_jobs_total", status=status)
+        metrics.observe("agent_service_queue_wait_seconds", (job.started or job.finished) - job.created)
+        with self._lock:
+            self._active -= 1
+            if job.started is not None:
+                duration = job.finished - job.started
+                self._mean_duration = 0.8 * self._mean_duration + 0.2 * duration
+                metrics.observe("agent_service_job_duration_seconds", duration)
+            self._finished.append(job.id)
+            while len(self._finished) > self.max_finished:
+                self._jobs.pop(self._finished.popleft(), None)
+        job.publish("end", {**job.summary(), "status": status}, status=status)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._active - self._running,
+            }
+
+    def shutdown(self) -> None:
+        """Cancel every unfinished job and stop the workers."""
+
+        with self._lock:
+            unfinished = [job.id for job in self._jobs.values() if not job.done]
+        for job_id in unfinished:
+            self.cancel(job_id)
+        self._executor.shutdown(wait=True)
+
+
+def _error(status_code: int, message: str, **headers: str) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status_code, headers=headers or None)
+
+
+def _options(body: Any) -> Dict[str, Any]:
+    """Validate a submit request body into `JobManager.submit` arguments."""
+
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object.")
+    spec = body.get("spec")
+    if not isinstance(spec, str) or not spec.strip():
+        raise ValueError("'spec' must be a non-empty string.")
+    options: Dict[str, Any] = {"spec": spec}
+    for name, kind, minimum in (("max_iterations", int, 0), ("fix_candidates", int, 1)):
+        if name in body:
+            value = body[name]
+            if not isinstance(value, kind) or isinstance(value, bool) or value < minimum:
+                raise ValueError(f"'{name}' must be an integer of at least {minimum}.")
+            options[name] = value
+    if body.get("fix_mode") is not None:
+        if body["fix_mode"] not in FIX_MODES:
+            raise ValueError(f"'fix_mode' must be one of: {', '.join(FIX_MODES)}.")
+        options["fix_mode"] = body["fix_mode"]
+    for name in ("performance_check", "stream_tokens"):
+        if body.get(name) is not None:
+            if not isinstance(body[name], bool):
+                raise ValueError(f"'{name}' must be true or false.")
+            options[name] = body[name]
+    unknown = set(body) - {"spec", "max_iterations", "fix_candidates", "fix_mode", "performance_check", "stream_tokens"}
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+    return options
+
+
+def _sse(event: Optional[Tuple[str, Dict[str, Any]]]) -> str:
+    if event is None:
+        return ": keep-alive\n\n"
+    name, data = event
+    return f"event: {name}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def create_app(manager: Optional[JobManager] = None) -> Starlette:
+    """The job service as an ASGI application.
+
+    Without a `manager`, one is built with `AGENT_SERVICE_WORKERS` workers (default 4)
+    and a queue of `AGENT_SERVICE_QUEUE` jobs (default 16). It is shut down with the app.
+    """
+
+    if manager is None:
+        manager = JobManager(
+            workers=int(os.getenv("AGENT_SERVICE_WORKERS", "4")),
+            max_queue=int(os.getenv("AGENT_SERVICE_QUEUE", "16")),
+        )
+
+    def find_job(request: Request) -> Optional[Job]:
+        return manager.get(request.path_params["job_id"])
+
+    async def submit(request: Request) -> Response:
+        try:
+            options = _options(json.loads(await request.body() or b"null"))
+        except json.JSONDecodeError:
+            return _error(400, "Request body must be valid JSON.")
+        except ValueError as exc:
+            return _error(400, str(exc))
+        try:
+            job = manager.submit(**options)
+        except QueueFull as exc:
+            return _error(429, str(exc), **{"Retry-After": str(exc.retry_after)})
+        return JSONResponse(job.summary(), status_code=202, headers={"Location": f"/jobs/{job.id}"})
+
+    async def status(request: Request) -> Response:
+        job = find_job(request)
+        if job is None:
+            return _error(404, "Unknown job.")
+        return JSONResponse(job.summary())
+
+    async def result(request: Request) -> Response:
+        job = find_job(request)
+        if job is None:
+            return _error(404, "Unknown job.")
+        if not job.done:
+            return JSONResponse(job.summary(), status_code=202)
+        return Response(json.dumps(job.result(), default=str), media_type="application/json")
+
+    async def events(request: Request) -> Response:
+        job = find_job(request)
+        if job is None:
+            return _error(404, "Unknown job.")
+
+        async def stream() -> AsyncIterator[str]:
+            async for event in job.follow():
+                yield _sse(event)
+
+        return StreamingResponse(
+            stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def cancel(request: Request) -> Response:
+        job = manager.cancel(request.path_params["job_id"])
+        if job is None:
+            return _error(404, "Unknown job.")
+        return JSONResponse(job.summary())
+
+    async def health(request: Request) -> Response:
+        return JSONResponse({"status": "ok", **manager.stats()})
+
+    async def metrics(request: Request) -> Response:
+        stats = manager.stats()
+        gauges = [
+            "# HELP agent_service_jobs Jobs in the service, by state.",
+            "# TYPE agent_service_jobs gauge",
+            f'agent_service_jobs{{state="queued"}} {stats["queued"]}',
+            f'agent_service_jobs{{state="running"}} {stats["running"]}',
+        ]
+        return PlainTextResponse(get_metrics().render_prometheus() + "\n".join(gauges) + "\n")
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        yield
+        await asyncio.to_thread(manager.shutdown)
+
+    app = Starlette(
+        routes=[
+            Route("/jobs", submit, methods=["POST"]),
+            Route("/jobs/{job_id}", status, methods=["GET"]),
+            Route("/jobs/{job_id}/result", result, methods=["GET"]),
+            Route("/jobs/{job_id}/events", events, methods=["GET"]),
+            Route("/jobs/{job_id}/cancel", cancel, methods=["POST"]),
+            Route("/healthz", health, methods=["GET"]),
+            Route("/metrics", metrics, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+    app.state.jobs = manager
+    return app
@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from .state import AgentState
+
+DEFAULT_LIBRARY_PATH = Path.home() / ".cache" / "self_verifying_agent" / "solutions.sqlite3"
+DEFAULT_MIN_SIMILARITY = 0.5
+
+# Words too common in specs to tell two of them apart.
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "be", "by", "for", "from", "function", "given", "if", "in",
+    "is", "it", "of", "or", "return", "returns", "that", "the", "to", "which", "with", "write",
+}
+
+
+def normalize_spec(spec: str) -> str:
+    """Lowercase `spec` and reduce punctuation and whitespace runs to single spaces."""
+
+    return re.sub(r"[^a-z0-9]+", " ", spec.lower()).strip()
+
+
+def spec_key(spec: str) -> str:
+    """Exact-match key: specs that normalize to the same text share it."""
+
+    return hashlib.sha256(normalize_spec(spec).encode("utf-8")).hexdigest()
+
+
+def _terms(normalized: str) -> Counter:
+    """Term counts of a normalized spec: content words and adjacent word pairs."""
+
+    words = [w for w in normalized.split() if w not in _STOPWORDS]
+    return Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+
+class SolutionLibrary:
+    """Verified solutions (spec, parsed spec, code, tests) in a SQLite file, searchable by spec.
+
+    `lookup` finds a solution to the same spec up to case, punctuation and spacing.
+    `search` ranks solutions by TF-IDF cosine similarity of their specs over an
+    in-memory inverted index, loaded on first use, so only solutions sharing a term
+    with the query are scored. Past `max_entries`, the least recently used
+    solutions are dropped.
+    """
+
+    def __init__(
+        self,
+        path: Path | str = DEFAULT_LIBRARY_PATH,
+        min_similarity: float = DEFAULT_MIN_SIMILARITY,
+        max_entries: int = 5000,
+    ) -> None:
+        self.path = Path(path)
+        self.min_similarity = min_similarity
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Inverted index: key -> term counts, term -> keys containing it.
+        self._docs: Optional[Dict[str, Counter]] = None
+        self._postings: Dict[str, Set[str]] = {}
+        self._stats: Dict[str, int] = {"exact_hits": 0, "near_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS solutions ("
+                "key TEXT PRIMARY KEY, spec TEXT NOT NULL, normalized TEXT NOT NULL, parsed_spec TEXT NOT NULL, "
+                "code TEXT NOT NULL, tests TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS solutions_accessed ON solutions (accessed)")
+            self._conn.commit()
+        return self._conn
+
+    def _index(self) -> Dict[str, Counter]:
+        if self._docs is None:
+            self._docs = {}
+            self._postings = {}
+            for key, normalized in self._db().execute("SELECT key, normalized FROM solutions"):
+                self._index_add(key, normalized)
+        return self._docs
+
+    def _index_add(self, key: str, normalized: str) -> None:
+        assert self._docs is not None
+        terms = _terms(normalized)
+        self._docs[key] = terms
+        for term in terms:
+            self._postings.setdefault(term, set()).add(key)
+
+    def _index_remove(self, key: str) -> None:
+        assert self._docs is not None
+        for term in self._docs.pop(key, ()):
+            keys = self._postings.get(term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[term]
+
+    def _fetch(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._db().execute(
+            "SELECT spec, parsed_spec, code, tests FROM solutions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._db().execute("UPDATE solutions SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._db().commit()
+        return {"spec": row[0], "parsed_spec": json.loads(row[1]), "code": row[2], "tests": row[3]}
+
+    def lookup(self, spec: str) -> Optional[Dict[str, Any]]:
+        """The verified solution stored for this exact spec, or None."""
+
+        with self._lock:
+            solution = self._fetch(spec_key(spec))
+            if solution is not None:
+                self._stats["exact_hits"] += 1
+            return solution
+
+    def search(self, spec: str, limit: int = 1) -> List[Dict[str, Any]]:
+        """Up to `limit` solutions whose specs are at least `min_similarity` similar, best first.
+
+        Each solution has a `similarity` in [0, 1].
+        """
+
+        with self._lock:
+            docs = self._index()
+            query = _terms(normalize_spec(spec))
+            n = len(docs)
+
+            def idf(term: str) -> float:
+                return math.log((1 + n) / (1 + len(self._postings.get(term, ())))) + 1
+
+            def norm(terms: Counter) -> float:
+                return math.sqrt(sum((count * idf(term)) ** 2 for term, count in terms.items()))
+
+            candidates: Set[str] = set()
+            for term in query:
+                candidates |= self._postings.get(term, set())
+            query_norm = norm(query)
+            scored = []
+            for key in candidates:
+                terms = docs[key]
+                dot = sum(count * terms[term] * idf(term) ** 2 for term, count in query.items() if term in terms)
+                scored.append((dot / (query_norm * norm(terms)), key))
+            scored.sort(reverse=True)
+
+            found: List[Dict[str, Any]] = []
+            for similarity, key in scored[:limit]:
+                if similarity < self.min_similarity:
+                    break
+                solution = self._fetch(key)
+                if solution is not None:
+                    solution["similarity"] = round(similarity, 3)
+                    found.append(solution)
+            self._stats["near_hits" if found else "misses"] += 1
+            return found
+
+    def add(self, spec: str, parsed_spec: Dict[str, Any], code: str, tests: str) -> str:
+        """Store a verified solution, replacing any for the same spec; returns its key."""
+
+        key = spec_key(spec)
+        normalized = normalize_spec(spec)
+        now = time.time()
+        with self._lock:
+            self._index()
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO solutions (key, spec, normalized, parsed_spec, code, tests, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, spec, normalized, json.dumps(parsed_spec, default=str), code, tests, now, now),
+            )
+            self._index_remove(key)
+            self._index_add(key, normalized)
+            self._stats["writes"] += 1
+            self._evict(db)
+            db.commit()
+        return key
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        total = db.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        if total <= self.max_entries:
+            return
+        stale = db.execute(
+            "SELECT key FROM solutions ORDER BY accessed ASC LIMIT ?", (total - self.max_entries,)
+        ).fetchall()
+        for (key,) in stale:
+            db.execute("DELETE FROM solutions WHERE key = ?", (key,))
+            self._index_remove(key)
+            self._stats["evictions"] += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index())
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._docs = None
+
+
+_library: Optional[SolutionLibrary] = None
+_library_configured = False
+_library_lock = threading.Lock()
+
+
+def configure_solution_library(
+    enabled: bool = True,
+    path: Path | str | None = None,
+    **options: Any,
+) -> Optional[SolutionLibrary]:
+    """Install (or, with `enabled=False`, remove) the process-wide solution library used by the graph."""
+
+    global _library, _library_configured
+    with _library_lock:
+        if _library is not None:
+            _library.close()
+        _library = (
+            SolutionLibrary(path or os.getenv("AGENT_SOLUTION_LIBRARY_PATH") or DEFAULT_LIBRARY_PATH, **options)
+            if enabled
+            else None
+        )
+        _library_configured = True
+        return _library
+
+
+def get_solution_library() -> Optional[SolutionLibrary]:
+    """Return the process-wide solution library, or None when it is off.
+
+    Unless `configure_solution_library` was called, it is enabled on first use when
+    `AGENT_SOLUTION_LIBRARY` is "on" (default "off"), storing to
+    `AGENT_SOLUTION_LIBRARY_PATH`.
+    """
+
+    if not _library_configured:
+        configure_solution_library(os.getenv("AGENT_SOLUTION_LIBRARY", "off").lower() in ("1", "on", "true", "yes"))
+    return _library
+
+
+def recall_solution(state: AgentState) -> AgentState:
+    """Look the spec up in the solution library before any LLM call.
+
+    An exact match fills in the stored parsed spec, code and tests with a
+    successful analysis, and the run ends there. Otherwise the most similar
+    verified solution, if any, becomes `state.reference` for the code and test
+    generators.
+    """
+
+    library = get_solution_library()
+    if library is None:
+        return state
+
+    solution = library.lookup(state.spec)
+    if solution is not None:
+        print(">>> Agent found a verified solution to this spec in the solution library.")
+        state.parsed_spec = solution["parsed_spec"]
+        state.code = solution["code"]
+        state.tests = solution["tests"]
+        state.error_analysis = {
+            "status": "success",
+            "summary": "Reused a verified solution from the solution library.",
+            "source": "library",
+        }
+        return state
+
+    similar = library.search(state.spec)
+    if similar:
+        reference = similar[0]
+        print(f">>> Agent is using a verified solution to a similar spec as a reference (similarity {reference['similarity']:.2f})...")
+        state.reference = {k: reference[k] for k in ("spec", "code", "tests", "similarity")}
+    return state
+
+
+async def arecall_solution(state: AgentState) -> AgentState:
+    """Async version of `recall_solution`."""
+
+    return recall_solution(state)
+
+
+def store_solution(state: AgentState) -> AgentState:
+    """Add the run's code and tests to the solution library once every test has passed."""
+
+    library = get_solution_library()
+    passed = (state.test_results or {}).get("exit_code") == 0
+    if library is not None and passed and state.code and state.tests:
+        print(">>> Agent is saving the verified solution to the solution library...")
+        library.add(state.spec, state.parsed_spec, state.code, state.tests)
+    return state
+
+
+async def astore_solution(state: AgentState) -> AgentState:
+    """Async version of `store_solution`."""
+
+    return store_solution(state)
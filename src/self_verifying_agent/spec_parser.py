@@ -1,51 +1,62 @@
 from __future__ import annotations
 
-from typing import Any, Dict
+import json
+from typing import Any, Dict, List
 
-from .llm_factory import get_llm
+from .model_routing import routed
 from .state import AgentState
-from .utils import strip_markdown
+from .utils import content_text, strip_markdown
 
 
-def parse_spec(state: AgentState) -> AgentState:
-    """Parse the natural-language spec into a structured representation.
-
-    Extracts function name, inputs, outputs, constraints, and edge cases.
-    """
-
-    print(">>> Agent is parsing the specification...")
-    llm = get_llm()
-
+def _messages(state: AgentState) -> List[Dict[str, str]]:
     system = (
         "You parse natural-language programming specifications into a JSON schema. "
         "Extract function name, inputs (name + type + description), output, constraints, "
-        "and explicit edge cases. Be concise and only return JSON."
+        "explicit edge cases, and the required time complexity if one is stated. "
+        "Be concise and only return JSON."
     )
 
     user = f"""
 Specification:
 {state.spec}
 
-Return JSON with keys: name, inputs, output, constraints, edge_cases, assumptions.
+Return JSON with keys: name, inputs, output, constraints, edge_cases, assumptions,
+complexity (Big-O such as "O(n log n)", or null if the spec states none).
 """
 
-    resp = llm.invoke([
+    return [
         {"role": "system", "content": system},
         {"role": "user", "content": user},
-    ])
-
-    content = resp.content
-    content = strip_markdown(content)
-    if isinstance(content, str):
-        # Best-effort parse, falling back to an empty dict if parsing fails.
-        import json
-
-        try:
-            parsed: Dict[str, Any] = json.loads(content)
-        except json.JSONDecodeError:
-            parsed = {"raw": content}
-    else:
-        parsed = {"raw": content}
-
-    state.parsed_spec = parsed
+    ]
+
+
+def _parse(content: Any) -> Dict[str, Any]:
+    # Best-effort parse, falling back to the raw text if parsing fails.
+    text = strip_markdown(content_text(content))
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return {"raw": text}
+
+
+def parse_spec(state: AgentState) -> AgentState:
+    """Parse the natural-language spec into a structured representation.
+
+    Extracts function name, inputs, outputs, constraints, and edge cases.
+    """
+
+    print(">>> Agent is parsing the specification...")
+    with routed(state, "spec_parser") as route:
+        resp = route.llm().invoke(_messages(state))
+    state.parsed_spec = _parse(resp.content)
+    return state
+
+
+async def aparse_spec(state: AgentState) -> AgentState:
+    """Async version of `parse_spec`."""
+
+    print(">>> Agent is parsing the specification...")
+    with routed(state, "spec_parser") as route:
+        resp = await route.llm().ainvoke(_messages(state))
+    state.parsed_spec = _parse(resp.content)
     return state
@@ -1,9 +1,28 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import json
+import os
+from typing import Annotated, Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
+from .blob_store import get_blob_store
+from .utils import apply_line_delta
+
+# Entries kept inline; older history is spilled to the blob store, older test runs are merged.
+MAX_HISTORY = int(os.getenv("AGENT_MAX_HISTORY", "20"))
+MAX_TEST_OUTCOME_RUNS = int(os.getenv("AGENT_MAX_TEST_OUTCOME_RUNS", "10"))
+
+
+def merge_entries(current: List[Dict[str, Any]], update: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """LangGraph reducer appending the entries of `update` that `current` does not hold yet.
+
+    Full-state nodes write the whole list back, and nodes running in parallel each
+    write theirs; every entry still ends up in the channel once.
+    """
+
+    return current + [entry for entry in update if entry not in current]
+
 
 class AgentState(BaseModel):
     """Shared state for the self-verifying code agent.
@@ -16,6 +35,10 @@ class AgentState(BaseModel):
 
     code: Optional[str] = Field(default=None, description="Current implementation under test.")
     tests: Optional[str] = Field(default=None, description="Pytest test file content for the current spec.")
+    reference: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Verified solution to a similar spec from the solution library: spec, code, tests and similarity.",
+    )
 
     test_results: Optional[Dict[str, Any]] = Field(
         default=None,
@@ -27,28 +50,120 @@ class AgentState(BaseModel):
         description="Structured explanation of failures, including type, likely cause, and suggested fix focus.",
     )
 
+    test_outcomes: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Per-test outcomes of every test run: iteration, phase, and a node id -> outcome map.",
+    )
+
+    coverage: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Per-test impl.py line coverage from the last full test run, with the code and tests digest it was recorded against.",
+    )
+
+    fix_verification: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Full test run of the winning fix candidate with the code and tests digest it ran against; reused by test_runner.",
+    )
+
     iteration: int = Field(default=0, description="Current repair iteration counter.")
     max_iterations: int = Field(default=5, description="Maximum number of repair iterations before giving up.")
+    fix_candidates: int = Field(default=1, description="Fix candidates generated and tested in parallel per repair iteration.")
+    fix_mode: str = Field(
+        default_factory=lambda: os.getenv("AGENT_FIX_MODE", "rewrite"),
+        description="How the fixer returns changes: 'rewrite' (whole module) or 'patch' (edits applied locally).",
+    )
+    performance_check: bool = Field(
+        default_factory=lambda: os.getenv("AGENT_PERF_CHECK", "off").lower() in ("1", "on", "true", "yes"),
+        description="Whether code that passes its tests is also timed against the spec's Big-O target.",
+    )
+    perf_inputs: Optional[str] = Field(
+        default=None,
+        description="Source of the `make_input(n)` generator used by the performance check, kept for later checks.",
+    )
 
     history: List[Dict[str, Any]] = Field(
         default_factory=list,
         description="History of code/test versions with failure summaries and fix rationales.",
     )
+    model_routes: Annotated[List[Dict[str, Any]], merge_entries] = Field(
+        default_factory=list,
+        description="Model routing decisions with the calls, tokens and cost of each; see `model_routing`.",
+    )
+    history_spilled: List[str] = Field(
+        default_factory=list,
+        description="Blob store references of the oldest history entries, moved out once history exceeds MAX_HISTORY.",
+    )
 
     def increment_iteration(self) -> None:
         self.iteration += 1
 
+    def latest_test_outcomes(self) -> Dict[str, str]:
+        """Most recent known outcome of every test node id across all runs so far."""
+
+        latest: Dict[str, str] = {}
+        for run in self.test_outcomes:
+            latest.update(run["outcomes"])
+        return latest
+
+    def add_test_outcomes(self, phase: str, outcomes: Dict[str, str]) -> None:
+        """Record one test run's outcomes, merging the oldest runs once there are more than MAX_TEST_OUTCOME_RUNS."""
+
+        self.test_outcomes.append({"iteration": self.iteration, "phase": phase, "outcomes": outcomes})
+        if len(self.test_outcomes) > MAX_TEST_OUTCOME_RUNS:
+            oldest, newer = self.test_outcomes[:2], self.test_outcomes[2:]
+            merged = {
+                "iteration": oldest[1]["iteration"],
+                "phase": "merged",
+                "outcomes": {**oldest[0]["outcomes"], **oldest[1]["outcomes"]},
+            }
+            self.test_outcomes = [merged, *newer]
+
     def record_snapshot(self, **extra: Any) -> None:
         """Append a snapshot of the current state to history.
 
         Only stores lightweight metadata plus any provided extras, not entire large logs unless passed explicitly.
+        Past MAX_HISTORY entries, the oldest is spilled to the blob store (see `full_history`).
         """
 
         snapshot: Dict[str, Any] = {
             "iteration": self.iteration,
-            "spec": self.spec,
             "has_code": self.code is not None,
             "has_tests": self.tests is not None,
         }
         snapshot.update(extra)
         self.history.append(snapshot)
+        while len(self.history) > MAX_HISTORY:
+            self.history_spilled.append(get_blob_store().put(json.dumps(self.history.pop(0), default=str)))
+
+    def full_history(self) -> List[Dict[str, Any]]:
+        """Every history entry, including those spilled to the blob store.
+
+        A spilled entry that has since been pruned is returned as `{"missing_ref": ref}`.
+        """
+
+        store = get_blob_store()
+        entries: List[Dict[str, Any]] = []
+        for ref in self.history_spilled:
+            try:
+                entries.append(json.loads(store.get(ref)))
+            except KeyError:
+                entries.append({"missing_ref": ref})
+        return entries + self.history
+
+    def code_versions(self) -> List[str]:
+        """Every version of the code, oldest first, rebuilt from the current code.
+
+        Each `fix_code` history entry stores `code_delta`, a `utils.line_delta` from
+        the fixed code back to the code it replaced. Versions older than a pruned
+        history entry cannot be rebuilt and are left out.
+        """
+
+        if self.code is None:
+            return []
+        versions = [self.code]
+        for entry in reversed(self.full_history()):
+            if "missing_ref" in entry:
+                break
+            if entry.get("code_delta") is not None:
+                versions.insert(0, apply_line_delta(versions[0], entry["code_delta"]))
+        return versions
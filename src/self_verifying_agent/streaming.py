@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from typing import Any, Callable, List, Optional
+
+from .utils import content_text
+
+
+def _writer() -> Optional[Callable[[Any], None]]:
+    # Imported here so the node modules load without LangGraph (see `graph.build_graph`).
+    from langgraph.config import get_stream_writer
+
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        # Called outside a LangGraph run (e.g. directly or from a worker thread).
+        return None
+
+
+def complete(llm: Any, messages: List[Any], node: str) -> str:
+    """Return the text of an LLM call, streaming it token by token inside a graph run.
+
+    Each chunk is published on the graph's custom stream as `{"node", "delta"}`, which
+    `stream_self_verifying_agent(..., stream_tokens=True)` turns into `(node, delta)`
+    events. Outside a graph run this is a plain `invoke`.
+    """
+
+    writer = _writer()
+    if writer is None:
+        return content_text(llm.invoke(messages).content)
+
+    parts: List[str] = []
+    for chunk in llm.stream(messages):
+        delta = content_text(chunk.content)
+        if delta:
+            parts.append(delta)
+            writer({"node": node, "delta": delta})
+    return "".join(parts)
+
+
+async def acomplete(llm: Any, messages: List[Any], node: str) -> str:
+    """Async version of `complete`, using `ainvoke`/`astream`."""
+
+    writer = _writer()
+    if writer is None:
+        return content_text((await llm.ainvoke(messages)).content)
+
+    parts: List[str] = []
+    async for chunk in llm.astream(messages):
+        delta = content_text(chunk.content)
+        if delta:
+            parts.append(delta)
+            writer({"node": node, "delta": delta})
+    return "".join(parts)
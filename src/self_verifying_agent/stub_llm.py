@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "by", "for", "from", "function", "given", "if",
+    "in", "is", "it", "not", "of", "or", "return", "returns", "that", "the", "to",
+    "two", "whether", "which", "with", "write",
+}
+
+
+def _function_name(spec: str) -> str:
+    """Derive a stable snake_case function name from a natural-language spec."""
+
+    words = [w for w in re.findall(r"[a-z]+", spec.lower()) if w not in _STOPWORDS]
+    return "_".join(words[:3]) or "solution"
+
+
+def _section(text: str, header: str) -> str:
+    """Return the block that follows `header:` in a node prompt, up to the next labelled block."""
+
+    match = re.search(rf"{re.escape(header)}:\n(.*?)(?:\n\n[A-Z][^\n]*:|\Z)", text, re.DOTALL)
+    return match.group(1).strip() if match else ""
+
+
+def _parsed_name(text: str) -> str:
+    match = re.search(r"['\"]name['\"]\s*:\s*['\"](\w+)['\"]", text)
+    return match.group(1) if match else "solution"
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class StubChatModel(BaseChatModel):
+    """Deterministic, offline chat model for running the pipeline without a network.
+
+    Replies are chosen from the system prompt of each node, so the agent runs end to
+    end: the generated function is a trivial placeholder and the generated tests
+    only check that it is importable and callable. `latency` adds a fixed delay per
+    call to mimic a remote provider under load tests; when streaming, the reply is
+    emitted line by line.
+    """
+
+    model_name: str = "stub"
+    temperature: float = 0.0
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        system = str(messages[0].content) if messages else ""
+        user = str(messages[-1].content) if messages else ""
+
+        if "parse natural-language programming specifications" in system:
+            return json.dumps({
+                "name": _function_name(_section(user, "Specification")),
+                "inputs": [],
+                "output": "Any",
+                "constraints": [],
+                "edge_cases": [],
+                "assumptions": ["Generated by the offline stub provider."],
+                "complexity": None,
+            })
+        if "senior Python engineer" in system:
+            name = _parsed_name(user)
+            return (
+                f"def {name}(*args, **kwargs):\n"
+                f'    """Placeholder implementation produced by the stub provider."""\n'
+                f"    return None\n"
+            )
+        if "pytest unit tests" in system:
+            name = _parsed_name(user)
+            return (
+                f"from impl import {name}\n\n\n"
+                f"def test_{name}_is_callable():\n"
+                f"    # The stub provider only checks that the function exists.\n"
+                f"    assert callable({name})\n"
+            )
+        if "debugging assistant" in system:
+            return json.dumps({
+                "status": "failure",
+                "summary": "Stub analysis of the failing tests.",
+                "error_type": "other",
+                "focus_lines": [],
+                "suggestions": [],
+            })
+        if "input generators" in system:
+            return "def make_input(n):\n    return (n,), {}\n"
+        if "refactoring assistant" in system and "SEARCH" in system:
+            # A single edit that leaves the code unchanged.
+            code = _section(user, "Current code")
+            return f"<<<<<<< SEARCH\n{code}\n=======\n{code}\n>>>>>>> REPLACE\n"
+        if "refactoring assistant" in system:
+            return _section(user, "Current code")
+        return ""
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        text = self._reply(messages)
+        prompt_tokens = sum(_estimate_tokens(str(m.content)) for m in messages)
+        completion_tokens = _estimate_tokens(text)
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        if self.latency:
+            time.sleep(self.latency)
+        for line in self._reply(messages).splitlines(keepends=True):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=line))
@@ -1,20 +1,15 @@
 from __future__ import annotations
 
-from .llm_factory import get_llm
+from typing import Any, Dict, List
+
+from .model_routing import routed
+from .prompt_context import reference_context
 from .state import AgentState
+from .streaming import acomplete, complete
 from .utils import strip_markdown
 
 
-def generate_tests(state: AgentState) -> AgentState:
-    """Generate pytest-style unit tests based on the spec, not the implementation.
-
-    Tests should cover happy paths, edge cases, and adversarial inputs and explain
-    in comments why each test exists.
-    """
-
-    print(">>> Agent is generating unit tests...")
-    llm = get_llm()
-
+def _messages(state: AgentState) -> List[Dict[str, str]]:
     system = (
         "You write focused pytest unit tests for a single Python function. "
         "You do NOT see the implementation, only the spec. Tests must be deterministic."
@@ -33,17 +28,32 @@ Write a pytest test module that:
 - Uses clear test function names and comments explaining the purpose of each test.
 - Uses only the Python standard library and pytest.
 """
+    user += reference_context(state.reference, "tests")
 
-    resp = llm.invoke([
+    return [
         {"role": "system", "content": system},
         {"role": "user", "content": user},
-    ])
+    ]
+
 
-    content = resp.content
-    if isinstance(content, str):
-        tests = content
-    else:
-        tests = "".join(part["text"] for part in content if isinstance(part, dict) and "text" in part)
+def generate_tests(state: AgentState) -> Dict[str, Any]:
+    """Generate pytest-style unit tests based on the spec, not the implementation.
 
-    state.tests = strip_markdown(tests)
-    return state
+    Tests should cover happy paths, edge cases, and adversarial inputs and explain
+    in comments why each test exists. Runs in parallel with `generate_code`, so it
+    returns a partial update that only touches `tests` (and `model_routes`).
+    """
+
+    print(">>> Agent is generating unit tests...")
+    with routed(state, "test_generator") as route:
+        tests = complete(route.llm(), _messages(state), node="test_generator")
+    return {"tests": strip_markdown(tests), "model_routes": state.model_routes}
+
+
+async def agenerate_tests(state: AgentState) -> Dict[str, Any]:
+    """Async version of `generate_tests`."""
+
+    print(">>> Agent is generating unit tests...")
+    with routed(state, "test_generator") as route:
+        tests = await acomplete(route.llm(), _messages(state), node="test_generator")
+    return {"tests": strip_markdown(tests), "model_routes": state.model_routes}
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import ast
+import difflib
+import hashlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+def tests_digest(tests: str) -> str:
+    return hashlib.sha256(tests.encode("utf-8")).hexdigest()
+
+
+def function_spans(code: str) -> List[Tuple[int, int]]:
+    """(first, last) line of every function in `code`, decorators included."""
+
+    spans: List[Tuple[int, int]] = []
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            spans.append((start, node.end_lineno or node.lineno))
+    return spans
+
+
+def _innermost(spans: List[Tuple[int, int]], line: int) -> Optional[Tuple[int, int]]:
+    containing = [span for span in spans if span[0] <= line <= span[1]]
+    return min(containing, key=lambda span: span[1] - span[0]) if containing else None
+
+
+def changed_functions(old_code: str, new_code: str) -> Optional[List[Tuple[int, int]]]:
+    """Spans in `old_code` of the functions a change to `new_code` touches.
+
+    Returns None when the change cannot be attributed to functions: either file
+    fails to parse, or a changed line sits at module level (imports, constants,
+    class bodies) in either version, where it could affect any test.
+    """
+
+    try:
+        old_spans = function_spans(old_code)
+        new_spans = function_spans(new_code)
+    except SyntaxError:
+        return None
+
+    old_lines, new_lines = old_code.splitlines(), new_code.splitlines()
+    touched: Set[Tuple[int, int]] = set()
+    matcher = difflib.SequenceMatcher(a=old_lines, b=new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+
+        # New-side lines outside any function change module-level behaviour.
+        for line in range(j1 + 1, j2 + 1):
+            if new_lines[line - 1].strip() and _innermost(new_spans, line) is None:
+                return None
+
+        # Old-side lines replaced or deleted; a pure insertion is attributed to
+        # the function around the insertion point.
+        old_range = range(i1 + 1, i2 + 1) if i2 > i1 else range(max(i1, 1), min(i1 + 1, len(old_lines)) + 1)
+        for line in old_range:
+            span = _innermost(old_spans, line)
+            if span is None:
+                if i2 > i1 and old_lines[line - 1].strip():
+                    return None
+                continue
+            touched.add(span)
+
+    return sorted(touched)
+
+
+def impacted_tests(coverage: Optional[Dict[str, Any]], code: str, tests: str) -> Optional[List[str]]:
+    """Node ids whose covered lines fall inside functions changed since `coverage` was recorded.
+
+    `coverage` is the map `run_tests` stores after a full run: the code and tests
+    it was recorded against plus `{node id: covered impl.py lines}`. Returns None,
+    meaning "run the full suite", when there is no map, the tests changed, the
+    change reaches module-level code, or no recorded test exercises the change.
+    """
+
+    if not coverage or coverage.get("tests_digest") != tests_digest(tests):
+        return None
+
+    spans = changed_functions(coverage["code"], code)
+    if not spans:
+        return None
+
+    selected = [
+        nodeid
+        for nodeid, lines in coverage["lines"].items()
+        if any(start <= line <= end for line in lines for start, end in spans)
+    ]
+    return selected or None
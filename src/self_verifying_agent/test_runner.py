@@ -1,52 +1,413 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import signal
 import subprocess
 import sys
 import tempfile
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Generator, List, Optional, Tuple
 
+from .blob_store import spill
+from .instrumentation import span
+from .preflight import check_sources, is_blocking, preflight_result
+from .pytest_pool import get_pytest_pool
+from .pytest_report import disable_plugin_autoload, load_report, plugin_args, summarize
+from .sandbox import get_run_limits, kill_process_group
 from .state import AgentState
+from .test_impact import impacted_tests, tests_digest
 
 
-def run_tests(state: AgentState) -> AgentState:
-    """Run pytest in a temporary directory against the current code and tests.
+_FAILING = ("failed", "error")
 
-    Writes `impl.py` for the implementation and `test_impl.py` for the tests,
-    then executes pytest as a subprocess, capturing stdout/stderr and exit code.
-    """
 
-    print(">>> Agent is running tests...")
-    if state.code is None or state.tests is None:
-        state.test_results = {
-            "status": "error",
-            "reason": "Missing code or tests before running test_runner.",
-        }
-        return state
+def _prepare(tmpdir: Path, code: str, tests: str, args: List[str], select: Optional[List[str]]) -> Tuple[List[str], Dict[str, str]]:
+    """Write `impl.py`/`test_impl.py` into `tmpdir` and build the pytest command and env."""
 
-    with tempfile.TemporaryDirectory() as tmpdir_str:
-        tmpdir = Path(tmpdir_str)
-        impl_path = tmpdir / "impl.py"
-        test_path = tmpdir / "test_impl.py"
+    impl_path = tmpdir / "impl.py"
+    test_path = tmpdir / "test_impl.py"
+
+    impl_path.write_text(code, encoding="utf-8")
+    test_path.write_text(tests, encoding="utf-8")
 
-        impl_path.write_text(state.code, encoding="utf-8")
-        test_path.write_text(state.tests, encoding="utf-8")
+    # Make this package importable so the report plugin loads.
+    env = dict(os.environ)
+    package_root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (package_root, env.get("PYTHONPATH")) if p)
+    disable_plugin_autoload(env)
+    targets = select or [str(test_path)]
+    cmd = [sys.executable, "-m", "pytest", *targets, *plugin_args(tmpdir), *args]
+    return cmd, env
 
-        # Run pytest
-        cmd = [sys.executable, "-m", "pytest", str(test_path)]
-        proc = subprocess.run(
+
+def _subprocess_result(
+    returncode: int, stdout: str, stderr: str, tmpdir: Path, timeout: Optional[float], killed: bool
+) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"exit_code": returncode, "stdout": stdout, "stderr": stderr, **load_report(tmpdir)}
+    if killed:
+        result.update(exit_code=1, timed_out=True, limit="suite_timeout")
+        result["stderr"] += f"\npytest timed out after {timeout} seconds."
+    elif returncode == -getattr(signal, "SIGXCPU", 0):
+        result.update(exit_code=1, limit="cpu_time")
+    return result
+
+
+def _run_subprocess(
+    code: str, tests: str, args: List[str], select: Optional[List[str]] = None, timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """Run pytest in a fresh interpreter; used when the worker pool is disabled.
+
+    Pytest runs in its own session, so after `timeout` seconds its whole process
+    group is killed, including anything the generated code spawned.
+    """
+
+    with tempfile.TemporaryDirectory() as tmpdir_str:
+        tmpdir = Path(tmpdir_str)
+        cmd, env = _prepare(tmpdir, code, tests, args, select)
+        proc = subprocess.Popen(
             cmd,
             cwd=str(tmpdir),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
+            env=env,
+            start_new_session=True,
         )
+        killed = False
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            killed = True
+            kill_process_group(proc.pid)
+            stdout, stderr = proc.communicate()
+        finally:
+            # Reap anything the tests left running in the group.
+            kill_process_group(proc.pid)
+
+        return _subprocess_result(proc.returncode, stdout, stderr, tmpdir, timeout, killed)
+
+
+async def _arun_subprocess(
+    code: str, tests: str, args: List[str], select: Optional[List[str]] = None, timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """Async version of `_run_subprocess` using an asyncio subprocess."""
+
+    with tempfile.TemporaryDirectory() as tmpdir_str:
+        tmpdir = Path(tmpdir_str)
+        cmd, env = _prepare(tmpdir, code, tests, args, select)
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=str(tmpdir),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+            start_new_session=True,
+        )
+        communicate = asyncio.ensure_future(proc.communicate())
+        killed = False
+        try:
+            stdout, stderr = await asyncio.wait_for(asyncio.shield(communicate), timeout)
+        except asyncio.TimeoutError:
+            killed = True
+            kill_process_group(proc.pid)
+            stdout, stderr = await communicate
+        finally:
+            kill_process_group(proc.pid)
+
+        return _subprocess_result(
+            proc.returncode,
+            stdout.decode("utf-8", errors="replace"),
+            stderr.decode("utf-8", errors="replace"),
+            tmpdir,
+            timeout,
+            killed,
+        )
+
+
+def _span_attributes(args: Optional[List[str]], select: Optional[List[str]], pooled: bool) -> Dict[str, Any]:
+    return {"args": " ".join(args or []), "selected": len(select) if select else None, "pooled": pooled}
+
+
+_LIMIT_MESSAGES = {
+    "suite_timeout": "Killed when the run exceeded the {suite_timeout:g}s suite timeout.",
+    "cpu_time": "Killed when the run exceeded its {cpu_seconds}s CPU time limit.",
+}
+
+
+def _mark_limit(result: Dict[str, Any]) -> None:
+    """Turn the test a killed run was stuck in into a timed-out failure, and list timeouts."""
+
+    limit = result.get("limit")
+    limits = get_run_limits()
+    for record in result.get("tests") or []:
+        if limit and record.pop("unfinished", False):
+            record.update(
+                outcome="failed",
+                exc_type="Timeout",
+                message=_LIMIT_MESSAGES[limit].format(**vars(limits)),
+                timed_out=True,
+            )
+    timed_out = [record["nodeid"] for record in result.get("tests") or [] if record.get("timed_out")]
+    if timed_out:
+        result["timed_out_tests"] = timed_out
+
+
+def _finish_result(result: Dict[str, Any], record: Dict[str, Any]) -> None:
+    """Add the outcome summary to `result` and the run's numbers to its span."""
+
+    _mark_limit(result)
+    if result.get("tests") is not None:
+        result["summary"] = summarize(result["tests"])
+    record["attributes"].update(
+        exit_code=result.get("exit_code"),
+        tests=len(result.get("tests") or []),
+        cpu_time=result.get("cpu_time"),
+        timed_out=result.get("timed_out", False),
+        timed_out_tests=len(result.get("timed_out_tests") or []),
+        limit=result.get("limit"),
+    )
+
+
+def execute_tests(
+    code: str,
+    tests: str,
+    args: Optional[List[str]] = None,
+    select: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Run `tests` against `code` once and return the raw result dict, without touching state.
+
+    Sources with a syntax error are not run at all: the result has exit code 2, no
+    `tests`, and the `preflight.check_sources` problems under `preflight`. Other
+    problems it finds (unresolvable imports, calls that cannot bind to the
+    function's signature) may be false positives, so pytest still runs and they are
+    listed under `preflight_hints`.
+    The run is held to `sandbox.get_run_limits()`. Tests that hit the per-test
+    timeout, or were running when the suite timeout or CPU limit killed pytest, are
+    failed records with `timed_out` set, listed under `timed_out_tests`; a killed run
+    also has `limit` set. The run is recorded as a `pytest` span with its wall time,
+    CPU time and test count.
+    """
+
+    problems = check_sources(code, tests)
+    if is_blocking(problems):
+        return preflight_result(problems)
+
+    pool = get_pytest_pool()
+    limits = get_run_limits()
+    with span("pytest", "pytest", **_span_attributes(args, select, pool is not None)) as record:
+        args = [*limits.pytest_args(), *(args or [])]
+        if pool is not None:
+            result = pool.run(code, tests, args=args, select=select, timeout=limits.suite_timeout)
+        else:
+            result = _run_subprocess(code, tests, args, select, limits.suite_timeout)
+        _finish_result(result, record)
+    if problems:
+        result["preflight_hints"] = problems
+    return result
+
+
+async def aexecute_tests(
+    code: str,
+    tests: str,
+    args: Optional[List[str]] = None,
+    select: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Async version of `execute_tests`.
+
+    Pool runs wait in a thread since workers talk over blocking pipes; without the
+    pool, pytest runs in an asyncio subprocess.
+    """
+
+    problems = check_sources(code, tests)
+    if is_blocking(problems):
+        return preflight_result(problems)
 
-        result: Dict[str, Any] = {
-            "exit_code": proc.returncode,
-            "stdout": proc.stdout,
-            "stderr": proc.stderr,
+    pool = get_pytest_pool()
+    limits = get_run_limits()
+    with span("pytest", "pytest", **_span_attributes(args, select, pool is not None)) as record:
+        args = [*limits.pytest_args(), *(args or [])]
+        if pool is not None:
+            result = await asyncio.to_thread(
+                pool.run, code, tests, args=args, select=select, timeout=limits.suite_timeout
+            )
+        else:
+            result = await _arun_subprocess(code, tests, args, select, limits.suite_timeout)
+        _finish_result(result, record)
+    if problems:
+        result["preflight_hints"] = problems
+    return result
+
+
+def _outcomes(result: Dict[str, Any]) -> Dict[str, str]:
+    return {record["nodeid"]: record["outcome"] for record in result.get("tests") or []}
+
+
+def _previous_failures(state: AgentState) -> Optional[List[str]]:
+    """Node ids still failing as of the last runs, or None if a rerun must be full.
+
+    Collection errors have no per-test node id, so they always force a full run.
+    """
+
+    failing = [nodeid for nodeid, outcome in state.latest_test_outcomes().items() if outcome in _FAILING]
+    if not failing or any("::" not in nodeid for nodeid in failing):
+        return None
+    return failing
+
+
+def _record_outcomes(state: AgentState, result: Dict[str, Any]) -> None:
+    if result.get("tests") is not None:
+        state.add_test_outcomes(result["phase"], _outcomes(result))
+
+
+def _store_results(state: AgentState, result: Dict[str, Any]) -> None:
+    """Keep `result` as `state.test_results`, with long pytest output spilled to the blob store."""
+
+    for key in ("stdout", "stderr"):
+        spill(result, key)
+    state.test_results = result
+
+
+def _record_coverage(state: AgentState, result: Dict[str, Any]) -> None:
+    """Move per-test coverage from a full run's records into `state.coverage`."""
+
+    if result.get("tests") is None:
+        return
+    state.coverage = {
+        "code": state.code,
+        "tests_digest": tests_digest(state.tests or ""),
+        "lines": {
+            record["nodeid"]: record.pop("covered_lines", [])
+            for record in result["tests"]
+            if "::" in record["nodeid"]
+        },
+    }
+
+
+def _regressions(result: Dict[str, Any], previous: Dict[str, str]) -> List[str]:
+    return [
+        nodeid
+        for nodeid, outcome in _outcomes(result).items()
+        if outcome in _FAILING and previous.get(nodeid) == "passed"
+    ]
+
+
+# A test plan yields (pytest args, node id selection) requests and receives each run's result.
+_TestPlan = Generator[Tuple[List[str], Optional[List[str]]], Dict[str, Any], None]
+
+
+def _test_plan(state: AgentState) -> _TestPlan:
+    """Decide which runs to make and fold their results into `state`.
+
+    Shared by `run_tests` and `arun_tests`, which only differ in how they execute
+    each requested run.
+    """
+
+    assert state.code is not None and state.tests is not None
+
+    previous = state.latest_test_outcomes()
+    first: Optional[Dict[str, Any]] = None
+
+    verified, state.fix_verification = state.fix_verification, None
+    if verified and verified["code"] == state.code and verified["tests_digest"] == tests_digest(state.tests):
+        # The fixer already ran the full suite on this code while choosing among candidates.
+        result = dict(verified["result"], phase="full", reused=True)
+        _record_coverage(state, result)
+        _record_outcomes(state, result)
+        result["regressions"] = _regressions(result, previous)
+        _store_results(state, result)
+        return
+
+    failures = _previous_failures(state)
+    if failures:
+        first = yield ["-x"], failures
+        first["phase"] = "failures_first"
+        # Exit codes 4/5 mean the node ids no longer resolve; fall back to a full run.
+        if first["exit_code"] in (4, 5):
+            first = None
+        else:
+            _record_outcomes(state, first)
+            if first["exit_code"] != 0:
+                _store_results(state, first)
+                return
+
+    impacted = impacted_tests(state.coverage, state.code, state.tests) if state.iteration > 0 else None
+    if impacted is not None:
+        remaining = [nodeid for nodeid in impacted if first is None or nodeid not in _outcomes(first)]
+        if remaining:
+            result = yield [], remaining
+            result["phase"] = "impacted"
+            _record_outcomes(state, result)
+        else:
+            result = dict(first or {}, phase="impacted")
+        result["deselected"] = len(previous) - len(impacted)
+    else:
+        result = yield ["--agent-coverage"], None
+        result["phase"] = "full"
+        _record_coverage(state, result)
+        _record_outcomes(state, result)
+
+    result["regressions"] = _regressions(result, previous)
+    _store_results(state, result)
+
+
+def _missing_inputs(state: AgentState) -> bool:
+    if state.code is None or state.tests is None:
+        state.test_results = {
+            "status": "error",
+            "reason": "Missing code or tests before running test_runner.",
         }
+        return True
+    return False
+
+
+def run_tests(state: AgentState) -> AgentState:
+    """Run pytest in a temporary directory against the current code and tests.
+
+    Writes `impl.py` for the implementation and `test_impl.py` for the tests,
+    then executes pytest, capturing stdout/stderr and exit code. Runs go to the
+    shared warm worker pool from `pytest_pool` when one is configured, otherwise
+    to a fresh subprocess. Per-test records from `pytest_report`
+    are stored under `tests` (None if pytest did not produce them) with outcome
+    counts under `summary`.
+
+    During repair iterations, the tests that failed last time run first with `-x`.
+    If one still fails, that result is reported immediately. Once they all pass,
+    the suite is confirmed: only the tests whose covered lines sit in functions the
+    fix changed (see `test_impact`), or the full suite when that cannot be decided.
+    After a best-of-N fix, the winning candidate's full run is reused instead (with
+    `reused` set), since it ran on exactly this code and these tests.
+    Tests that passed before but fail now are listed under `regressions`. Every full
+    run refreshes `state.coverage`, and every run's per-test outcomes go to
+    `state.test_outcomes`. Pytest output longer than `AGENT_LOG_INLINE_CHARS` is
+    spilled to the blob store: an excerpt stays under `stdout`/`stderr` and
+    `blob_store.unspill` loads the full text from `stdout_ref`/`stderr_ref`.
+    """
+
+    print(">>> Agent is running tests...")
+    if _missing_inputs(state):
+        return state
+
+    plan = _test_plan(state)
+    try:
+        args, select = next(plan)
+        while True:
+            args, select = plan.send(execute_tests(state.code, state.tests, args=args, select=select))
+    except StopIteration:
+        return state
+
+
+async def arun_tests(state: AgentState) -> AgentState:
+    """Async version of `run_tests`."""
+
+    print(">>> Agent is running tests...")
+    if _missing_inputs(state):
+        return state
 
-        state.test_results = result
+    plan = _test_plan(state)
+    try:
+        args, select = next(plan)
+        while True:
+            args, select = plan.send(await aexecute_tests(state.code, state.tests, args=args, select=select))
+    except StopIteration:
         return state
@@ -1,4 +1,6 @@
+import difflib
 import re
+from typing import Any, List
 
 def strip_markdown(text: str) -> str:
     """Removes markdown code block delimiters from the start and end of a string."""
@@ -8,3 +10,26 @@ def strip_markdown(text: str) -> str:
     if match:
         return match.group(1).strip()
     return text.strip()
+
+
+def content_text(content: Any) -> str:
+    """Flattens an LLM message content (a string or a list of parts) into text."""
+    if isinstance(content, str):
+        return content
+    return "".join(part["text"] for part in content if isinstance(part, dict) and "text" in part)
+
+
+def line_delta(source: str, target: str) -> List[List[Any]]:
+    """Compact line diff turning `source` into `target`: `[start, end, replacement lines]` hunks."""
+    matcher = difflib.SequenceMatcher(a=source.splitlines(keepends=True), b=target.splitlines(keepends=True), autojunk=False)
+    b = matcher.b
+    return [[i1, i2, b[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def apply_line_delta(source: str, delta: List[List[Any]]) -> str:
+    """Rebuild the target of `line_delta(source, target)` from `source`."""
+    lines = source.splitlines(keepends=True)
+    # Hunks are in source order; applying from the end keeps earlier indices valid.
+    for start, end, replacement in reversed(delta):
+        lines[start:end] = replacement
+    return "".join(lines)